@@ -0,0 +1,186 @@
+# This script benchmarks each stage of the pipeline on a synthetic HOME-style
+# video: frames per second decoded by extract, milliseconds per frame spent
+# by boxify and milliseconds per slot spent by match with each scorer and
+# number of jobs, along with the peak memory of every stage.
+#
+# Usage: python benchmarks/run.py [--boxes N] [--templates N]
+#                                 [--scorers ssim ncc ...] [--jobs 1 2 4 ...]
+#                                 [--work-dir DIR] [--output results.json]
+#
+# Every stage runs in a fresh process so its peak RSS is not polluted by the
+# previous ones. The results are printed and written as JSON, so runs from
+# different commits can be compared.
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Import the homedumper of this checkout, also in the stage processes
+REPO_PATH = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_PATH))
+
+from homedumper.const import BOX_COLUMNS, BOX_ROWS, CACHE_ENV
+from homedumper._memory import peak_rss
+
+
+# Name of the project created by extract for the synthetic video
+PROJECT = "out/synthetic"
+
+
+def run_stage(stage: str, scorer: str, jobs: int) -> dict:
+    """
+    Run a stage of the pipeline in this process. The current working dir
+    must be the work dir of the benchmark.
+
+    Parameters
+    ----------
+    stage : str
+        One of 'extract', 'boxify' or 'match'.
+    scorer : str
+        Scorer used by the match stage.
+    jobs : int
+        Number of processes used by the match stage.
+
+    Returns
+    -------
+    dict
+        Elapsed seconds, number of items processed and peak RSS in kilobytes.
+    """
+
+    import homedumper
+
+    start = time.perf_counter()
+    if stage == "extract":
+        homedumper.extract("synthetic.avi", "out")
+        with open("truth.json", encoding="utf-8") as f:
+            count = json.load(f)["frames"]
+    elif stage == "boxify":
+        count = homedumper.boxify(PROJECT)
+    else:
+        count = homedumper.match(PROJECT, force=True, scorer=scorer, jobs=jobs)
+    elapsed = time.perf_counter() - start
+
+    return {"seconds": elapsed, "count": count, "peak_rss_kb": peak_rss() // 1024}
+
+
+def measure(work_path: Path, stage: str, scorer: str = "ssim", jobs: int = 1) -> dict:
+    """
+    Run a stage of the pipeline in a fresh process.
+
+    Parameters
+    ----------
+    work_path : Path
+        Work dir of the benchmark.
+    stage : str
+        One of 'extract', 'boxify' or 'match'.
+    scorer : str, optional
+        Scorer used by the match stage, by default 'ssim'
+    jobs : int, optional
+        Number of processes used by the match stage, by default 1
+
+    Returns
+    -------
+    dict
+        Measures of the stage.
+    """
+
+    command = [sys.executable, str(Path(__file__).resolve()), "--stage", stage]
+    command += ["--scorers", scorer, "--jobs", str(jobs)]
+    result = subprocess.run(
+        command, cwd=work_path, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def benchmark(args: argparse.Namespace) -> dict:
+    """
+    Generate the synthetic inputs and measure every stage.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Command line arguments.
+
+    Returns
+    -------
+    dict
+        Description of the run and the measures of each stage.
+    """
+
+    sys.path.insert(0, str(REPO_PATH / "benchmarks"))
+    import synthetic
+
+    work_path = Path(args.work_dir or tempfile.mkdtemp(prefix="homedumper-bench-"))
+    work_path.mkdir(parents=True, exist_ok=True)
+
+    # The stages, run in child processes, read the synthetic templates
+    templates = synthetic.make_templates(work_path, args.templates)
+    os.environ[CACHE_ENV] = str(work_path / synthetic.WORK_CACHE)
+    synthetic.make_video(work_path, templates, args.boxes, args.hold)
+    slots = args.boxes * BOX_ROWS * BOX_COLUMNS
+
+    results = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "work_dir": str(work_path),
+        "boxes": args.boxes,
+        "templates": len(templates),
+        "stages": {},
+        "match": [],
+    }
+
+    # Decoding and filtering of the video
+    extract = measure(work_path, "extract")
+    extract["fps"] = extract["count"] / extract["seconds"]
+    results["stages"]["extract"] = extract
+    print(f"extract: {extract['fps']:.1f} fps, {extract['peak_rss_kb']} kB")
+
+    # Cropping and OCR of the key frames
+    boxify = measure(work_path, "boxify")
+    boxify["ms_per_frame"] = 1000 * boxify["seconds"] / max(1, boxify["count"])
+    results["stages"]["boxify"] = boxify
+    print(f"boxify: {boxify['ms_per_frame']:.1f} ms/frame, {boxify['peak_rss_kb']} kB")
+
+    # Scaling of the matching with the scorer and the number of jobs
+    for scorer in args.scorers:
+        for jobs in args.jobs:
+            match = measure(work_path, "match", scorer, jobs)
+            match.update(scorer=scorer, jobs=jobs)
+            match["ms_per_slot"] = 1000 * match["seconds"] / slots
+            results["match"].append(match)
+            print(
+                f"match {scorer} x{jobs}: {match['ms_per_slot']:.2f} ms/slot, "
+                f"{match['peak_rss_kb']} kB"
+            )
+
+    return results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark the homedumper stages")
+    parser.add_argument("--boxes", type=int, default=20)
+    parser.add_argument("--templates", type=int, default=200)
+    parser.add_argument("--hold", type=int, default=15)
+    parser.add_argument("--scorers", nargs="+", default=["ssim", "ncc", "ncc-int8"])
+    parser.add_argument("--jobs", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--work-dir", default=None)
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--stage", choices=["extract", "boxify", "match"])
+    args = parser.parse_args()
+
+    # Measure a single stage, called by measure() in a fresh process
+    if args.stage is not None:
+        print(json.dumps(run_stage(args.stage, args.scorers[0], args.jobs[0])))
+        sys.exit(0)
+
+    results = benchmark(args)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.output}")
@@ -0,0 +1,286 @@
+# This module generates synthetic HOME-style inputs for the benchmarks: a
+# template pack with its name dictionary and a video that scrolls through a
+# number of boxes filled with those templates, along with the ground truth.
+#
+# Usage: python benchmarks/synthetic.py <work dir> [--boxes N] [--templates N]
+#
+# The template cache is created in <work dir>/cache, so commands must be run
+# with HOMEDUMPER_CACHE=<work dir>/cache to use it.
+
+import argparse
+import json
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+import numpy.typing as npt
+
+from homedumper.const import BOX_COLUMNS, BOX_ROWS, EMPTY_TEMPLATE
+from homedumper.const import RESIZED_DIR, THUMBANIL_SIZE
+from homedumper._cache import template_cache
+from homedumper._download import _prepare_resized_folders, _resize_image
+from homedumper._download import write_pack_manifest
+
+
+# Cache folder in the work dir, to be set as HOMEDUMPER_CACHE
+WORK_CACHE = "cache"
+
+# Geometry of the synthetic video, a Switch capture
+FRAME_SIZE = (1280, 720)
+FPS = 30
+
+# Regions and colors checked by the frame extractor, (y1, y2, x1, x2)
+INDICATORS = [(74, 103, 513, 533), (74, 103, 121, 141)]
+STABLE_COLOR = (167, 180, 31)
+TRANSIENT_COLOR = (60, 60, 200)
+TITLE_REGION = (70, 102, 166, 487)
+BACKGROUND = (214, 196, 120)
+
+# Layout of the thumbnails, the same used by boxify
+DY, DX, Y0, X0 = 75, 92, 162, 94
+
+
+def template_ids(count: int) -> List[str]:
+    """
+    Build the ids of a synthetic template set, with an alternative form for
+    one out of five species.
+
+    Parameters
+    ----------
+    count : int
+        Number of species.
+
+    Returns
+    -------
+    List[str]
+        Template ids, without the empty slot.
+    """
+
+    ids = []
+    for dex in range(1, count + 1):
+        ids.append(f"{dex:04d}")
+        if dex % 5 == 0:
+            ids.append(f"{dex:04d}-f")
+    return ids
+
+
+def template_name(id: str) -> Optional[str]:
+    """
+    Get the name of a synthetic template.
+
+    Parameters
+    ----------
+    id : str
+        Id of the template.
+
+    Returns
+    -------
+    Optional[str]
+        Name of the pokemon, None for the empty slot.
+    """
+
+    return None if id == EMPTY_TEMPLATE else f"synthetic-{id}"
+
+
+def draw_template(rng: np.random.Generator, size: int = 256) -> npt.NDArray:
+    """
+    Draw a random sprite on a transparent background.
+
+    Parameters
+    ----------
+    rng : np.random.Generator
+        Source of randomness.
+    size : int, optional
+        Side of the image, by default 256
+
+    Returns
+    -------
+    npt.NDArray
+        BGRA image.
+    """
+
+    img = np.zeros((size, size, 4), dtype=np.uint8)
+    for _ in range(3):
+        color = tuple(int(c) for c in rng.integers(0, 230, 3)) + (255,)
+        center = tuple(int(c) for c in rng.integers(size // 4, 3 * size // 4, 2))
+        axes = tuple(int(a) for a in rng.integers(size // 10, size // 3, 2))
+        angle = int(rng.integers(0, 180))
+        cv2.ellipse(img, center, axes, angle, 0, 360, color, -1)
+    return img
+
+
+def make_templates(
+    work_path: Path, count: int, seed: int = 0
+) -> Dict[str, npt.NDArray]:
+    """
+    Create a resized template pack and a name dictionary in the cache of a
+    work dir.
+
+    Parameters
+    ----------
+    work_path : Path
+        Work dir of the benchmark.
+    count : int
+        Number of species.
+    seed : int, optional
+        Seed of the random sprites, by default 0
+
+    Returns
+    -------
+    Dict[str, npt.NDArray]
+        Resized regular templates by id, including the empty slot.
+    """
+
+    rng = np.random.default_rng(seed)
+    cache_path = template_cache(work_path / WORK_CACHE)
+    folders = _prepare_resized_folders(cache_path / RESIZED_DIR)
+
+    # Write the templates and their masks as the download stage does
+    names = {}
+    for id in template_ids(count):
+        img = draw_template(rng)
+        for out_path, mask_path in folders.values():
+            _resize_image(img, out_path / f"{id}.png", mask_path / f"{id}.png")
+        names[id] = template_name(id)
+
+    with open(work_path / WORK_CACHE / "id2name.json", "w", encoding="utf-8") as f:
+        json.dump(names, f)
+    write_pack_manifest(cache_path)
+
+    out_path = folders["regular"][0]
+    return {path.stem: cv2.imread(str(path)) for path in out_path.glob("*.png")}
+
+
+def draw_box(title: str, thumbnails: List[npt.NDArray], stable: bool) -> npt.NDArray:
+    """
+    Draw a frame of the HOME box screen.
+
+    Parameters
+    ----------
+    title : str
+        Title of the box.
+    thumbnails : List[npt.NDArray]
+        Images of the slots, row by row.
+    stable : bool
+        Whether the frame is stable or part of the L/R animation.
+
+    Returns
+    -------
+    npt.NDArray
+        BGR frame.
+    """
+
+    frame = np.full((FRAME_SIZE[1], FRAME_SIZE[0], 3), BACKGROUND, dtype=np.uint8)
+
+    # Title of the box, in black over white
+    y1, y2, x1, x2 = TITLE_REGION
+    frame[y1:y2, x1:x2] = 255
+    cv2.putText(frame, title, (x1 + 90, y2 - 8), cv2.FONT_HERSHEY_SIMPLEX, 0.8, 0, 2)
+
+    # Indicators of the L and R buttons
+    color = STABLE_COLOR if stable else TRANSIENT_COLOR
+    for y1, y2, x1, x2 in INDICATORS:
+        frame[y1:y2, x1:x2] = color
+
+    # Thumbnails of the slots
+    w = THUMBANIL_SIZE
+    for k, thumbnail in enumerate(thumbnails):
+        i, j = divmod(k, BOX_COLUMNS)
+        y, x = Y0 + i * DY, X0 + j * DX
+        frame[y - w : y + w, x - w : x + w] = thumbnail
+
+    return frame
+
+
+def make_video(
+    work_path: Path,
+    templates: Dict[str, npt.NDArray],
+    boxes: int,
+    hold: int = 15,
+    transition: int = 5,
+    seed: int = 0,
+) -> Path:
+    """
+    Record a video scrolling through boxes filled with random templates, and
+    save the expected content of each box next to it.
+
+    Parameters
+    ----------
+    work_path : Path
+        Work dir of the benchmark.
+    templates : Dict[str, npt.NDArray]
+        Resized templates by id.
+    boxes : int
+        Number of boxes in the video.
+    hold : int, optional
+        Frames each box stays on screen, by default 15
+    transition : int, optional
+        Frames of the animation between boxes, by default 5
+    seed : int, optional
+        Seed of the box contents, by default 0
+
+    Returns
+    -------
+    Path
+        Path to the video. The ground truth is in 'truth.json' next to it,
+        in the format of 'data/perfect.json'.
+    """
+
+    rng = np.random.default_rng(seed)
+    ids = sorted(id for id in templates if id != EMPTY_TEMPLATE)
+    slots = BOX_ROWS * BOX_COLUMNS
+
+    video_path = work_path / "synthetic.avi"
+    fourcc = cv2.VideoWriter_fourcc(*"MJPG")
+    writer = cv2.VideoWriter(str(video_path), fourcc, FPS, FRAME_SIZE)
+
+    truth = []
+    for b in range(boxes):
+
+        # Fill the box leaving some empty slots at the end
+        filled = int(rng.integers(slots // 2, slots + 1))
+        content = list(rng.choice(ids, filled)) + [EMPTY_TEMPLATE] * (slots - filled)
+        title = f"BOX {b + 1:03d}"
+        truth.append(
+            {
+                "title": title,
+                "templates": [str(id) for id in content],
+                "pokemon": [template_name(id) for id in content],
+            }
+        )
+
+        # Add some noise so the thumbnails are not identical to the templates
+        thumbnails = []
+        for id in content:
+            noise = rng.integers(-8, 9, templates[id].shape)
+            thumbnails.append(np.clip(templates[id] + noise, 0, 255).astype(np.uint8))
+
+        for _ in range(transition):
+            writer.write(draw_box(title, thumbnails, stable=False))
+        frame = draw_box(title, thumbnails, stable=True)
+        for _ in range(hold):
+            writer.write(frame)
+
+    writer.release()
+
+    with open(work_path / "truth.json", "w", encoding="utf-8") as f:
+        json.dump({"frames": boxes * (hold + transition), "boxes": truth}, f)
+
+    return video_path
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic benchmark")
+    parser.add_argument("work_dir", type=Path)
+    parser.add_argument("--boxes", type=int, default=20)
+    parser.add_argument("--templates", type=int, default=200)
+    parser.add_argument("--hold", type=int, default=15)
+    args = parser.parse_args()
+
+    args.work_dir.mkdir(parents=True, exist_ok=True)
+    templates = make_templates(args.work_dir, args.templates)
+    video = make_video(args.work_dir, templates, args.boxes, args.hold)
+    print(f"{len(templates)} templates and {args.boxes} boxes in {video}")
+    print(f"Run with HOMEDUMPER_CACHE={args.work_dir / WORK_CACHE}")
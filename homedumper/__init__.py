@@ -1,8 +1,5 @@
 import logging
-from homedumper._extract import extract
-from homedumper._boxify import boxify
-from homedumper._download import download
-from homedumper._match import match
+import importlib
 
 logging.basicConfig(
     level=logging.INFO,
@@ -11,10 +8,44 @@ logging.basicConfig(
 )
 
 __all__ = [
+    'dump',
     'extract',
     'boxify',
     'download',
     'match',
+    'batch',
+    'serve',
+    'live',
+    'Metrics',
+    'configure',
 ]
 
-__version__ = '0.0.1'
\ No newline at end of file
+__version__ = '0.0.1'
+
+# Public functions and the modules that define them. The modules depend on
+# OpenCV, scikit-image, NumPy and friends, so they are only imported the
+# first time one of their functions is used.
+_LAZY = {
+    'dump': 'homedumper._pipeline',
+    'extract': 'homedumper._extract',
+    'boxify': 'homedumper._boxify',
+    'download': 'homedumper._download',
+    'match': 'homedumper._match',
+    'batch': 'homedumper._batch',
+    'serve': 'homedumper._serve',
+    'live': 'homedumper._live',
+    'Metrics': 'homedumper._metrics',
+    'configure': 'homedumper._runtime',
+}
+
+
+def __getattr__(name: str):
+    if name in _LAZY:
+        value = getattr(importlib.import_module(_LAZY[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module 'homedumper' has no attribute '{name}'")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY))
@@ -1,13 +1,107 @@
+import cProfile
+import json
 import pathlib
+from typing import List, Optional
 import typer
 import homedumper
-from homedumper.const import DEFAULT_OUT
+from homedumper.const import DEFAULT_OUT, DEFAULT_MATCH_MARGIN, DEFAULT_SCORER
+from homedumper.const import DEFAULT_HOST, DEFAULT_PORT
+from homedumper.const import DEDUP_MIN_PIXELS, DEDUP_THRESHOLD, STABLE_THRESHOLD
+from homedumper._memory import parse_size, peak_rss
 
 app = typer.Typer()
 
 
+def _configure(jobs: Optional[int], pin_cores: bool):
+    """
+    Apply the --jobs and --pin-cores options before running a command,
+    leaving the default threads of the libraries if none is given.
+
+    Parameters
+    ----------
+    jobs : Optional[int]
+        Number of processors the command may use.
+    pin_cores : bool
+        Pin the worker processes to their own processor.
+    """
+
+    if jobs is not None or pin_cores:
+        homedumper.configure(jobs, pin_cores)
+
+
+def _parse_memory(max_memory: Optional[str]) -> Optional[int]:
+    """
+    Parse the --max-memory option.
+
+    Parameters
+    ----------
+    max_memory : Optional[str]
+        Memory size like '512M' or '2G', None if unbounded.
+
+    Returns
+    -------
+    Optional[int]
+        Number of bytes, None if unbounded.
+    """
+
+    if max_memory is None:
+        return None
+    try:
+        return parse_size(max_memory)
+    except ValueError as err:
+        raise typer.BadParameter(str(err), param_hint="--max-memory")
+
+
+def _check_search(threshold: Optional[float], shortlist: Optional[int]):
+    """
+    Check that the --threshold and --shortlist options can be combined.
+
+    Parameters
+    ----------
+    threshold : Optional[float]
+        Likelihood above which the search of a slot stops early.
+    shortlist : Optional[int]
+        Number of species whose forms are compared.
+    """
+
+    # Only the matching stage knows the settings, import it on demand
+    from homedumper._match import check_search
+
+    try:
+        check_search(threshold, shortlist)
+    except ValueError as err:
+        raise typer.BadParameter(str(err), param_hint="--shortlist")
+
+
+def _check_scope(scope: Optional[List[str]]):
+    """
+    Check that the files of the --scope option exist.
+
+    Parameters
+    ----------
+    scope : Optional[List[str]]
+        Pokemon names, template ids or paths to files with them.
+    """
+
+    from homedumper._scope import read_scope
+
+    try:
+        read_scope(scope or [])
+    except ValueError as err:
+        raise typer.BadParameter(str(err), param_hint="--scope")
+
+
 @app.command()
-def dump(video_path: str, output_path: str = DEFAULT_OUT):
+def dump(
+    video_path: str,
+    output_path: str = DEFAULT_OUT,
+    verify: bool = False,
+    profile: bool = False,
+    cprofile: Optional[str] = None,
+    max_memory: Optional[str] = None,
+    jobs: Optional[int] = None,
+    pin_cores: bool = False,
+):
     """
     Dumps the database from the video.
 
@@ -17,29 +111,80 @@ def dump(video_path: str, output_path: str = DEFAULT_OUT):
         Path to the video to extract frames from.
     output_path : str, optional
         Path to the output folder, by default DEFAULT_OUT
+    verify : bool, optional
+        Check the content of every cached template, by default False
+    profile : bool, optional
+        Write the counters and timers of every stage to 'profile.json' in
+        the project folder, by default False
+    cprofile : Optional[str], optional
+        File where the cProfile statistics of the whole run are dumped, by
+        default None
+    max_memory : Optional[str], optional
+        Memory budget like '512M' or '2G' shared by the stages, by default
+        None (unbounded)
+    jobs : Optional[int], optional
+        Number of processors used, by default None (a single process with
+        the default threads of the libraries). With more than one, as many
+        processes boxify and match the frames, and the video is decoded only
+        after the templates are downloaded and loaded.
+    pin_cores : bool, optional
+        Pin each worker process to its own processor, by default False
     """
-    # Exctract frames from the video
-    count = homedumper.extract(video_path=video_path, output_path=output_path)
-    typer.echo(f"Extracted {count} frames from {video_path}")
+    _configure(jobs, pin_cores)
+    metrics = homedumper.Metrics()
+    budget = _parse_memory(max_memory)
 
-    # Locate the project folder
-    video_path = pathlib.Path(video_path)
-    folder_path = pathlib.Path(output_path) / video_path.stem
+    # Profile every function call if requested
+    profiler = None
+    if cprofile is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
 
-    # Boxify the frames
-    count = homedumper.boxify(folder_path=folder_path)
-    typer.echo(f"{count} frames converted to box from {folder_path}")
+    # Extract, boxify and match the frames while the video is decoded
+    summary = homedumper.dump(
+        video_path=video_path,
+        output_path=output_path,
+        verify=verify,
+        max_memory=budget,
+        jobs=jobs or 1,
+        metrics=metrics,
+    )
+    if summary["project"] is None:
+        raise typer.Exit(code=1)
+    folder_path = pathlib.Path(summary["project"])
+    typer.echo(f"Extracted {summary['frames']} frames from {video_path}")
+    typer.echo(f"{summary['boxes']} frames converted to box from {folder_path}")
+    typer.echo(f"{summary['pokemon']} pokemon found in {folder_path}")
 
-    # Download resurces
-    homedumper.download()
-    typer.echo(f"All resources downloaded")
+    # Report the memory actually used, if it can be measured
+    peak = peak_rss()
+    if peak:
+        metrics.count("memory.peak_rss_kb", peak // 1024)
+        typer.echo(f"Peak memory: {peak / (1 << 20):.1f} MiB")
+    if budget is not None and peak > budget:
+        typer.echo(f"Peak memory exceeded the budget of {max_memory}", err=True)
 
-    # Match all thumbnails to pokemon names
-    count = homedumper.match(path=folder_path)
-    typer.echo(f"{count} pokemon found in {folder_path}")
+    if profiler is not None and cprofile is not None:
+        profiler.disable()
+        profiler.dump_stats(cprofile)
+        typer.echo(f"cProfile statistics saved to {cprofile}")
+
+    if profile:
+        report_path = folder_path / "profile.json"
+        metrics.save(report_path)
+        typer.echo(f"Profile saved to {report_path}")
 
 @app.command()
-def extract(video_path: str, output_path: str = DEFAULT_OUT):
+def extract(
+    video_path: str,
+    output_path: str = DEFAULT_OUT,
+    stable_threshold: int = STABLE_THRESHOLD,
+    dedup_threshold: int = DEDUP_THRESHOLD,
+    dedup_pixels: int = DEDUP_MIN_PIXELS,
+    max_memory: Optional[str] = None,
+    jobs: Optional[int] = None,
+    signatures: bool = False,
+):
     """
     Extract all different frames from the video.
 
@@ -49,13 +194,39 @@ def extract(video_path: str, output_path: str = DEFAULT_OUT):
         Path to the video to extract frames from.
     output_path : str, optional
         Path to the output folder, by default DEFAULT_OUT
+    stable_threshold : int, optional
+        Max difference of the L/R indicators with their resting color, by
+        default STABLE_THRESHOLD
+    dedup_threshold : int, optional
+        Min gray level difference of a changed pixel, by default
+        DEDUP_THRESHOLD
+    dedup_pixels : int, optional
+        Min changed pixels for a frame not to be a duplicate, by default
+        DEDUP_MIN_PIXELS
+    max_memory : Optional[str], optional
+        Memory budget like '512M' or '2G', by default None (unbounded)
+    jobs : Optional[int], optional
+        Number of threads of OpenCV, by default None (its default)
+    signatures : bool, optional
+        Record a signature of every frame in the project folder, or decide
+        from the recorded ones and decode only the frames saved, by default
+        False
     """
-    count = homedumper.extract(video_path=video_path, output_path=output_path)
+    _configure(jobs, False)
+    count = homedumper.extract(
+        video_path=video_path,
+        output_path=output_path,
+        stable_threshold=stable_threshold,
+        dedup_threshold=dedup_threshold,
+        dedup_pixels=dedup_pixels,
+        max_memory=_parse_memory(max_memory),
+        signatures=signatures,
+    )
     typer.echo(f"Extracted {count} frames from {video_path}")
 
 
 @app.command()
-def boxify(folder_path: str):
+def boxify(folder_path: str, jobs: Optional[int] = None):
     """
     Convert a folder with raw Pokemon Home screenshots of boxes into a folder
     structure with isolated images of each pokemon found.
@@ -64,14 +235,31 @@ def boxify(folder_path: str):
     ----------
     folder_path : str
         Path to the folder that contains the 'frames' subfolder with the images.
+    jobs : Optional[int], optional
+        Number of threads of OpenCV and tesseract, by default None (their
+        defaults)
     """
 
+    _configure(jobs, False)
     count = homedumper.boxify(folder_path=folder_path)
     typer.echo(f"{count} frames converted to box from {folder_path}")
 
 
 @app.command()
-def match(folder_path: str):
+def match(
+    folder_path: str,
+    force: bool = False,
+    threshold: Optional[float] = None,
+    margin: float = DEFAULT_MATCH_MARGIN,
+    priors: Optional[List[str]] = None,
+    shortlist: Optional[int] = None,
+    sqlite: Optional[str] = None,
+    scorer: str = DEFAULT_SCORER,
+    jobs: Optional[int] = None,
+    max_memory: Optional[str] = None,
+    pin_cores: bool = False,
+    scope: Optional[List[str]] = None,
+):
     """
     Convert a folder structure with isolated images of each pokemon found into
     an annotated list of pokemon found in the images.
@@ -80,18 +268,297 @@ def match(folder_path: str):
     ----------
     folder_path : str
         Path to the folder that contains the 'boxes' subfolder with the images.
+    force : bool, optional
+        Match every box again ignoring cached results, by default False
+    threshold : Optional[float], optional
+        Likelihood above which the search of a slot stops early, by default
+        None (compare every template)
+    margin : float, optional
+        Minimum likelihood gap with the runner-up to stop early, by default
+        DEFAULT_MATCH_MARGIN
+    priors : Optional[List[str]], optional
+        'match.json' files of previous dumps used to sort the templates, by
+        default None
+    shortlist : Optional[int], optional
+        Match species first and then only the forms of the `shortlist` most
+        likely species, by default None (compare every template)
+    sqlite : Optional[str], optional
+        SQLite database where results are stored as boxes are matched, by
+        default None
+    scorer : str, optional
+        One of 'ssim', 'ncc', 'ncc-int8' or 'masked', by default
+        DEFAULT_SCORER
+    jobs : Optional[int], optional
+        Number of processes matching boxes in parallel, by default None (a
+        single process with the default threads of the libraries)
+    max_memory : Optional[str], optional
+        Memory budget like '512M' or '2G', by default None (unbounded)
+    pin_cores : bool, optional
+        Pin each worker process to its own processor, by default False
+    scope : Optional[List[str]], optional
+        Pokemon names, template ids, 'match.json' files of previous dumps or
+        text files with one name per line. Only the templates of their
+        species are compared, by default None (every template)
     """
 
-    count = homedumper.match(path=folder_path)
+    _configure(jobs, pin_cores)
+    _check_search(threshold, shortlist)
+    _check_scope(scope)
+
+    metrics = homedumper.Metrics()
+    count = homedumper.match(
+        path=folder_path,
+        force=force,
+        threshold=threshold,
+        margin=margin,
+        priors=priors,
+        shortlist=shortlist,
+        sqlite=sqlite,
+        scorer=scorer,
+        jobs=jobs or 1,
+        max_memory=_parse_memory(max_memory),
+        scope=scope,
+        metrics=metrics,
+    )
     typer.echo(f"{count} pokemon found in {folder_path}")
 
+    # Report how far the search went, the cached boxes aren't searched
+    comparisons = metrics.average("match.comparisons_per_slot")
+    if comparisons is not None:
+        typer.echo(f"{comparisons:.1f} templates compared per slot on average")
+
+
+@app.command()
+def batch(
+    paths: List[str],
+    output_path: str = DEFAULT_OUT,
+    jobs: Optional[int] = None,
+    threshold: Optional[float] = None,
+    margin: float = DEFAULT_MATCH_MARGIN,
+    priors: Optional[List[str]] = None,
+    shortlist: Optional[int] = None,
+    scorer: str = DEFAULT_SCORER,
+    verify: bool = False,
+    pin_cores: bool = False,
+):
+    """
+    Dumps the database from many videos, or from every video in a folder,
+    loading the templates only once.
+
+    Parameters
+    ----------
+    paths : List[str]
+        Paths to the videos or to folders with videos.
+    output_path : str, optional
+        Path to the output folder, by default DEFAULT_OUT
+    jobs : Optional[int], optional
+        Maximum number of videos processed at once, by default None (the
+        number of processors)
+    threshold : Optional[float], optional
+        Likelihood above which the search of a slot stops early, by default
+        None (compare every template)
+    margin : float, optional
+        Minimum likelihood gap with the runner-up to stop early, by default
+        DEFAULT_MATCH_MARGIN
+    priors : Optional[List[str]], optional
+        'match.json' files of previous dumps used to sort the templates, by
+        default None
+    shortlist : Optional[int], optional
+        Match species first and then only the forms of the `shortlist` most
+        likely species, by default None (compare every template)
+    scorer : str, optional
+        One of 'ssim', 'ncc', 'ncc-int8' or 'masked', by default
+        DEFAULT_SCORER
+    verify : bool, optional
+        Check the content of every cached template, by default False
+    pin_cores : bool, optional
+        Pin each worker process to its own processor, by default False
+    """
+
+    _configure(jobs, pin_cores)
+    _check_search(threshold, shortlist)
+    summary = homedumper.batch(
+        paths=paths,
+        output_path=output_path,
+        jobs=jobs,
+        threshold=threshold,
+        margin=margin,
+        priors=priors,
+        shortlist=shortlist,
+        scorer=scorer,
+        verify=verify,
+    )
+    count = len(summary["videos"])
+    typer.echo(f"{summary['pokemon']} pokemon found in {count} videos")
+    if summary["failed"]:
+        typer.echo(f"{summary['failed']} videos failed, see {output_path}")
+
+
+@app.command()
+def serve(
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    socket: Optional[str] = None,
+    output_path: str = DEFAULT_OUT,
+    jobs: Optional[int] = None,
+    queue_size: Optional[int] = None,
+    threshold: Optional[float] = None,
+    margin: float = DEFAULT_MATCH_MARGIN,
+    priors: Optional[List[str]] = None,
+    shortlist: Optional[int] = None,
+    scorer: str = DEFAULT_SCORER,
+    verify: bool = False,
+    pin_cores: bool = False,
+):
+    """
+    Serve a local HTTP API to submit dump jobs, check their status and fetch
+    their results, keeping the templates loaded between jobs.
+
+    Parameters
+    ----------
+    host : str, optional
+        Address to listen on, by default DEFAULT_HOST
+    port : int, optional
+        Port to listen on, by default DEFAULT_PORT
+    socket : Optional[str], optional
+        Unix socket to listen on instead of a TCP port, by default None
+    output_path : str, optional
+        Folder where each job writes its results, by default DEFAULT_OUT
+    jobs : Optional[int], optional
+        Number of jobs processed at once, by default None (the number of
+        processors)
+    queue_size : Optional[int], optional
+        Maximum number of jobs waiting or running before new ones are
+        rejected, by default None (twice the number of jobs)
+    threshold : Optional[float], optional
+        Likelihood above which the search of a slot stops early, by default
+        None (compare every template)
+    margin : float, optional
+        Minimum likelihood gap with the runner-up to stop early, by default
+        DEFAULT_MATCH_MARGIN
+    priors : Optional[List[str]], optional
+        'match.json' files of previous dumps used to sort the templates, by
+        default None
+    shortlist : Optional[int], optional
+        Match species first and then only the forms of the `shortlist` most
+        likely species, by default None (compare every template)
+    scorer : str, optional
+        One of 'ssim', 'ncc', 'ncc-int8' or 'masked', by default
+        DEFAULT_SCORER
+    verify : bool, optional
+        Check the content of every cached template, by default False
+    pin_cores : bool, optional
+        Pin each worker process to its own processor, by default False
+    """
+
+    _configure(jobs, pin_cores)
+    _check_search(threshold, shortlist)
+
+    homedumper.serve(
+        host=host,
+        port=port,
+        socket=socket,
+        output_path=output_path,
+        jobs=jobs,
+        queue_size=queue_size,
+        threshold=threshold,
+        margin=margin,
+        priors=priors,
+        shortlist=shortlist,
+        scorer=scorer,
+        verify=verify,
+    )
+
+
+@app.command()
+def live(
+    source: str,
+    output_path: str = DEFAULT_OUT,
+    fps: Optional[float] = None,
+    follow: bool = False,
+    threshold: Optional[float] = None,
+    margin: float = DEFAULT_MATCH_MARGIN,
+    priors: Optional[List[str]] = None,
+    shortlist: Optional[int] = None,
+    scorer: str = DEFAULT_SCORER,
+    verify: bool = False,
+):
+    """
+    Dumps the boxes from a capture device or a video being recorded while
+    scrolling through them, printing each box as a JSON line once matched.
+
+    Parameters
+    ----------
+    source : str
+        Index of the capture device (e.g. 0) or path to a video file.
+    output_path : str, optional
+        Path to the output folder, by default DEFAULT_OUT
+    fps : Optional[float], optional
+        Replay a video file at this frame rate, by default None (as fast as
+        possible)
+    follow : bool, optional
+        Keep reading a video file while it grows, by default False
+    threshold : Optional[float], optional
+        Likelihood above which the search of a slot stops early, by default
+        None (compare every template)
+    margin : float, optional
+        Minimum likelihood gap with the runner-up to stop early, by default
+        DEFAULT_MATCH_MARGIN
+    priors : Optional[List[str]], optional
+        'match.json' files of previous dumps used to sort the templates, by
+        default None
+    shortlist : Optional[int], optional
+        Match species first and then only the forms of the `shortlist` most
+        likely species, by default None (compare every template)
+    scorer : str, optional
+        One of 'ssim', 'ncc', 'ncc-int8' or 'masked', by default
+        DEFAULT_SCORER
+    verify : bool, optional
+        Check the content of every cached template, by default False
+    """
+
+    _check_search(threshold, shortlist)
+
+    count = homedumper.live(
+        source=source,
+        output_path=output_path,
+        callback=lambda box: typer.echo(json.dumps(box)),
+        fps=fps,
+        follow=follow,
+        threshold=threshold,
+        margin=margin,
+        priors=priors,
+        shortlist=shortlist,
+        scorer=scorer,
+        verify=verify,
+    )
+    typer.echo(f"{count} boxes found in {source}", err=True)
+
 
 @app.command()
-def download():
+def download(
+    force_resize: bool = False,
+    jobs: Optional[int] = None,
+    verify: bool = False,
+    pin_cores: bool = False,
+):
     """
     Download required templates.
+
+    Parameters
+    ----------
+    force_resize : bool, optional
+        Resize every template even if it didn't change, by default False
+    jobs : Optional[int], optional
+        Number of processes used to resize the templates, by default None
+    verify : bool, optional
+        Check the content of every cached template, by default False
+    pin_cores : bool, optional
+        Pin each worker process to its own processor, by default False
     """
-    homedumper.download()
+
+    _configure(jobs, pin_cores)
+    homedumper.download(force_resize=force_resize, jobs=jobs, verify=verify)
     typer.echo(f"Download Completed")
 
 
@@ -0,0 +1,215 @@
+import json
+import logging
+import time
+from concurrent.futures import as_completed
+from pathlib import Path
+from typing import List, Optional
+
+from homedumper.const import (
+    BATCH_SUMMARY,
+    DEFAULT_MATCH_MARGIN,
+    DEFAULT_OUT,
+    DEFAULT_SCORER,
+    VIDEO_EXTENSIONS,
+)
+from homedumper._boxify import boxify
+from homedumper._download import download
+from homedumper._extract import extract
+from homedumper._match import Matcher, _create_matcher, match
+from homedumper._metrics import Metrics
+from homedumper._runtime import process_pool
+
+# Matcher shared by the videos processed in each worker process
+_batch_matcher: Optional[Matcher] = None
+
+
+def find_videos(paths: List[str]) -> List[Path]:
+    """
+    Collect the videos to process, looking for video files inside the given
+    folders.
+
+    Parameters
+    ----------
+    paths : List[str]
+        Paths to video files or to folders with videos.
+
+    Returns
+    -------
+    List[Path]
+        The videos, without repeated names since each one names its project
+        folder.
+    """
+
+    videos = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            for file in sorted(path.iterdir()):
+                if file.is_file() and file.suffix.lower() in VIDEO_EXTENSIONS:
+                    videos.append(file)
+        elif path.is_file():
+            videos.append(path)
+        else:
+            logging.error(f"Invalid video path: {path.absolute()}")
+
+    unique = {}
+    for video in videos:
+        if video.stem in unique:
+            logging.error(f"Skipping {video}, another video is named {video.stem}")
+            continue
+        unique[video.stem] = video
+    return list(unique.values())
+
+
+def _init_batch_worker(matcher: Matcher):
+    """
+    Keep the matcher loaded by the parent process in a worker process.
+
+    Parameters
+    ----------
+    matcher : Matcher
+        The matcher, inherited without copying it when processes are forked.
+    """
+
+    global _batch_matcher
+    _batch_matcher = matcher
+
+
+def _dump_video(video_path: Path, output_path: str, settings: dict) -> dict:
+    """
+    Run every stage of the pipeline on a video in a worker process.
+
+    Parameters
+    ----------
+    video_path : Path
+        Path to the video.
+    output_path : str
+        Path to the output folder.
+    settings : dict
+        Search settings forwarded to match.
+
+    Returns
+    -------
+    dict
+        Summary of the video, with the number of frames, boxes and pokemon
+        found, the seconds spent and the metrics of each stage.
+    """
+
+    metrics = Metrics()
+    start = time.perf_counter()
+
+    project_path = Path(output_path) / video_path.stem
+    frames = extract(str(video_path), output_path, metrics)
+    boxes = boxify(str(project_path), metrics)
+    pokemon = match(
+        str(project_path), matcher=_batch_matcher, metrics=metrics, **settings
+    )
+
+    return {
+        "video": str(video_path),
+        "project": str(project_path),
+        "frames": frames,
+        "boxes": boxes,
+        "pokemon": pokemon,
+        "seconds": round(time.perf_counter() - start, 3),
+        "metrics": metrics.report(),
+    }
+
+
+def batch(
+    paths: List[str],
+    output_path: str = DEFAULT_OUT,
+    jobs: Optional[int] = None,
+    threshold: Optional[float] = None,
+    margin: float = DEFAULT_MATCH_MARGIN,
+    priors: Optional[List[str]] = None,
+    shortlist: Optional[int] = None,
+    scorer: str = DEFAULT_SCORER,
+    verify: bool = False,
+) -> dict:
+    """
+    Dump many videos at once. The templates are validated and loaded once,
+    and the videos are processed by a pool of worker processes, each one
+    running every stage of a video.
+
+    Parameters
+    ----------
+    paths : List[str]
+        Paths to video files or to folders with videos.
+    output_path : str, optional
+        Path to the output folder, by default DEFAULT_OUT
+    jobs : Optional[int], optional
+        Maximum number of videos processed at once, by default None (the
+        number of processors).
+    threshold : Optional[float], optional
+        Likelihood above which the search of a slot stops early, by default
+        None (compare every template).
+    margin : float, optional
+        Minimum likelihood gap with the runner-up to stop early, by default
+        DEFAULT_MATCH_MARGIN
+    priors : Optional[List[str]], optional
+        Paths to 'match.json' files of previous dumps used to sort the
+        templates, by default None
+    shortlist : Optional[int], optional
+        Number of species whose forms are compared, by default None (compare
+        every template).
+    scorer : str, optional
+        Name of the scorer, by default DEFAULT_SCORER
+    verify : bool, optional
+        Check the content of every cached template, by default False
+
+    Returns
+    -------
+    dict
+        Summary of the batch, also written to BATCH_SUMMARY in the output
+        folder, with one entry per video in the given order.
+    """
+
+    start = time.perf_counter()
+    videos = find_videos(paths)
+    results = {}
+
+    if videos:
+
+        # Validate the cache and load the templates once for every video
+        download(verify=verify)
+        matcher = _create_matcher(
+            {}, priors or [], threshold, margin, shortlist, scorer
+        )
+        settings = {
+            "threshold": threshold,
+            "margin": margin,
+            "priors": priors,
+            "shortlist": shortlist,
+            "scorer": scorer,
+        }
+
+        with process_pool(jobs, _init_batch_worker, (matcher,)) as pool:
+            futures = {
+                pool.submit(_dump_video, video, output_path, settings): video
+                for video in videos
+            }
+            for future in as_completed(futures):
+                video = futures[future]
+                try:
+                    results[video] = future.result()
+                    count = results[video]["pokemon"]
+                    logging.info(f"{count} pokemon found in {video}")
+                except Exception as err:
+                    logging.error(f"Failed to dump {video}: {err}")
+                    results[video] = {"video": str(video), "error": str(err)}
+    else:
+        logging.error("No videos found.")
+
+    summary = {
+        "videos": [results[video] for video in videos],
+        "failed": sum("error" in result for result in results.values()),
+        "pokemon": sum(result.get("pokemon", 0) for result in results.values()),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+    out_path = Path(output_path)
+    out_path.mkdir(parents=True, exist_ok=True)
+    with open(out_path / BATCH_SUMMARY, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=4)
+
+    return summary
@@ -3,13 +3,12 @@ import pytesseract
 import cv2
 from pathlib import Path
 import numpy.typing as npt
-from typing import Tuple, List
-from homedumper.const import THUMBANIL_SIZE
+from typing import Tuple, List, Optional
+from homedumper.const import THUMBANIL_SIZE, BOX_ROWS, BOX_COLUMNS
+from homedumper._metrics import Metrics
 
-current_tittle = 1
 
-
-def box_title(frame: npt.NDArray) -> str:
+def box_title(frame: npt.NDArray, number: int = 1) -> str:
     """
     Extract the title of the box from the frame.
 
@@ -17,6 +16,9 @@ def box_title(frame: npt.NDArray) -> str:
     ----------
     frame : npt.ArrayLike
         Screen capture of a Pokemon HOME screen with a box on it.
+    number : int, optional
+        Number of the box in the default title used without tesseract,
+        by default 1
 
     Returns
     -------
@@ -36,13 +38,8 @@ def box_title(frame: npt.NDArray) -> str:
         logging.error("Tesseract not found. Please install it.")
         logging.info("Using default names for the boxes.")
 
-        # Get the last tittle id and format the new name
-        global current_tittle
-        name = f"HOME {str(current_tittle).rjust(3,'0')}"
-
-        # Increment the current tittle id and return the name
-        current_tittle += 1
-        return name
+        # Format the name after the number of the box
+        return f"HOME {str(number).rjust(3,'0')}"
 
 
 def pokemon_thumbnails(frame: npt.NDArray) -> List[npt.NDArray]:
@@ -70,8 +67,8 @@ def pokemon_thumbnails(frame: npt.NDArray) -> List[npt.NDArray]:
     # Get the coordinates of each possible pokemon thumbnail
     regions = (
         (y0 - w + i * dy, y0 + w + i * dy, x0 - w + j * dx, x0 + w + j * dx)
-        for i in range(5)
-        for j in range(6)
+        for i in range(BOX_ROWS)
+        for j in range(BOX_COLUMNS)
     )
 
     # Extract the pokemon thumbnails
@@ -136,7 +133,9 @@ def export_box(pokemons: List[npt.NDArray], box_title: str, output_path: Path):
     _export_box_title(box_title, output_path)
 
 
-def frame2box(frame: npt.NDArray) -> Tuple[str, List[npt.NDArray]]:
+def frame2box(
+    frame: npt.NDArray, metrics: Optional[Metrics] = None, number: int = 1
+) -> Tuple[str, List[npt.NDArray]]:
     """
     Extract the box data from a frame.
 
@@ -144,14 +143,23 @@ def frame2box(frame: npt.NDArray) -> Tuple[str, List[npt.NDArray]]:
     ----------
     frame : npt.NDArray
         Screen capture of a Pokemon HOME screen with a box on it.
+    metrics : Optional[Metrics], optional
+        Collector of the counters and timers of the stage, by default None
+    number : int, optional
+        Number of the box in the default title, by default 1
 
     Returns
     -------
     Tuple[str, List[npt.NDArray]]
         Tuple with the box title and a list of the pokemon rois.
     """
+    if metrics is None:
+        metrics = Metrics()
+
     # Extract the box title
-    title = box_title(frame)
+    with metrics.timer("boxify.ocr"):
+        title = box_title(frame, number)
+    metrics.count("boxify.ocr_calls")
 
     # Extract the box pokemon rois
     pokemons = pokemon_thumbnails(frame)
@@ -197,7 +205,12 @@ def _diggest_project_path(folder_path: str) -> Tuple[Path, Path]:
     return input_path_obj, output_path_obj
 
 
-def boxify_image(image_path: Path, output_path: Path):
+def boxify_image(
+    image_path: Path,
+    output_path: Path,
+    metrics: Optional[Metrics] = None,
+    number: int = 1,
+):
     """
     Transform an image into a box folder structure.
 
@@ -207,24 +220,81 @@ def boxify_image(image_path: Path, output_path: Path):
         Path to the image to be converted.
     output_path : Path
         Path to the output folder.
+    metrics : Optional[Metrics], optional
+        Collector of the counters and timers of the stage, by default None
+    number : int, optional
+        Number of the box in the default title, by default 1
+
+    Raises
+    ------
+    ValueError
+        When the image can't be read.
     """
 
+    if metrics is None:
+        metrics = Metrics()
+
     # Load the image
-    image = cv2.imread(str(image_path))
+    with metrics.timer("boxify.read"):
+        image = cv2.imread(str(image_path))
+    if image is None:
+        raise ValueError(f"Invalid image: {image_path}")
+    metrics.count("boxify.frames_read")
+
+    # Convert it to a box folder
+    boxify_frame(image, image_path.stem, output_path, metrics, number)
+
+
+def boxify_frame(
+    frame: npt.NDArray,
+    name: str,
+    output_path: Path,
+    metrics: Optional[Metrics] = None,
+    number: int = 1,
+) -> Path:
+    """
+    Transform a frame already in memory into a box folder.
+
+    Parameters
+    ----------
+    frame : npt.NDArray
+        Screen capture of a Pokemon HOME screen with a box on it.
+    name : str
+        Name of the box folder.
+    output_path : Path
+        Path to the 'boxes' folder.
+    metrics : Optional[Metrics], optional
+        Collector of the counters and timers of the stage, by default None
+    number : int, optional
+        Number of the box in the default title, by default 1
+
+    Returns
+    -------
+    Path
+        Path to the box folder.
+    """
+
+    if metrics is None:
+        metrics = Metrics()
 
     # Extract the box data
-    title, pokemons = frame2box(image)
+    title, pokemons = frame2box(frame, metrics, number)
 
     # Create the output folder for the image
-    name = image_path.stem
     out_folder = output_path / name
     out_folder.mkdir(parents=True, exist_ok=True)
 
     # Export the box data
-    export_box(pokemons, title, out_folder)
+    with metrics.timer("boxify.write"):
+        export_box(pokemons, title, out_folder)
+    metrics.count("boxify.thumbnails_written", len(pokemons))
+    metrics.count(
+        "boxify.bytes_written", sum(f.stat().st_size for f in out_folder.iterdir())
+    )
+    return out_folder
 
 
-def boxify(folder_path: str) -> int:
+def boxify(folder_path: str, metrics: Optional[Metrics] = None) -> int:
     """
     Transform all the images in a folder into a folder structure with isolated
     images of each pokemon found.
@@ -233,6 +303,8 @@ def boxify(folder_path: str) -> int:
     ----------
     folder_path : str
         Path to the folder that contains the 'frames' subfolder with the images.
+    metrics : Optional[Metrics], optional
+        Collector of the counters and timers of the stage, by default None
 
     Returns
     -------
@@ -247,16 +319,21 @@ def boxify(folder_path: str) -> int:
         logging.error(f"No subfolder 'frames' with png files inside was found in {folder_path}")
         return 0
 
+    if metrics is None:
+        metrics = Metrics()
+
     # Set a counter for processed images
     image_count = 0
 
     # Read all png images
-    for image_path in input_path_obj.glob("*.png"):
+    with metrics.timer("boxify.total"):
+        for image_path in input_path_obj.glob("*.png"):
 
-        # Convert the image to a box
-        boxify_image(image_path, output_path_obj)
+            # Convert the image to a box, numbering the default titles of
+            # each project from the first one
+            boxify_image(image_path, output_path_obj, metrics, image_count + 1)
 
-        # Increment the counter
-        image_count += 1
+            # Increment the counter
+            image_count += 1
 
     return image_count
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from homedumper.const import (
+    CACHE_ENV,
+    CACHE_NAME,
+    LOCK_POLL_INTERVAL,
+    TEMPLATES_SHA256,
+    THUMBANIL_SIZE,
+    URL_TEMPLATES,
+)
+
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
+
+def cache_root() -> Path:
+    """
+    Get the folder of the cache shared by every run of the current user.
+
+    Returns
+    -------
+    Path
+        Value of the HOMEDUMPER_CACHE variable if it is set, otherwise the
+        'homedumper' folder in the cache folder of the user.
+    """
+
+    if os.environ.get(CACHE_ENV):
+        return Path(os.environ[CACHE_ENV]).expanduser()
+
+    base = os.environ.get("XDG_CACHE_HOME") or os.environ.get("LOCALAPPDATA")
+    base_path = Path(base).expanduser() if base else Path.home() / ".cache"
+    return base_path / CACHE_NAME
+
+
+def templates_key() -> str:
+    """
+    Get the key of the prepared templates, which changes with their source
+    or their size.
+
+    Returns
+    -------
+    str
+        Hexadecimal digest of the URL and checksum of the templates archive
+        and of the size of the resized templates.
+    """
+
+    source = f"{URL_TEMPLATES}\n{TEMPLATES_SHA256}\n{THUMBANIL_SIZE * 2}"
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+
+
+def template_cache(root: Optional[Path] = None) -> Path:
+    """
+    Get the folder of the prepared templates.
+
+    Parameters
+    ----------
+    root : Optional[Path], optional
+        Folder of the cache, by default None (cache_root())
+
+    Returns
+    -------
+    Path
+        Path to the folder, which may not exist yet.
+    """
+
+    return (root or cache_root()) / f"templates-{templates_key()}"
+
+
+@contextmanager
+def cache_lock(path: Path, shared: bool = False) -> Iterator[None]:
+    """
+    Lock a cache folder against the other processes, through a sibling
+    '.lock' file. The lock is released when the process exits, even if it
+    crashes.
+
+    Readers hold a shared lock while they load the folder and writers an
+    exclusive one while they change it. Locks are not reentrant, so they
+    must not be nested for the same folder.
+
+    Parameters
+    ----------
+    path : Path
+        Path to the folder.
+    shared : bool, optional
+        Take a shared lock, by default False (exclusive). Shared locks are
+        exclusive on Windows.
+
+    Yields
+    ------
+    Iterator[None]
+        Nothing, the folder is locked until the context exits.
+    """
+
+    lock_path = path.with_name(path.name + ".lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(lock_path, "a+b") as f:
+        if sys.platform == "win32":
+            # Poll, since msvcrt gives up after 10 seconds when blocking
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(LOCK_POLL_INTERVAL)
+        else:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if sys.platform == "win32":
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@contextmanager
+def staging_folder(path: Path) -> Iterator[Path]:
+    """
+    Build a folder in a hidden sibling that is renamed to its final path once
+    complete, so other processes never see it half-built. The caller must
+    hold the exclusive lock of the folder.
+
+    The sibling is kept if the build fails, so the next build resumes from
+    what it left, e.g. a partial download.
+
+    Parameters
+    ----------
+    path : Path
+        Final path of the folder. It must not exist.
+
+    Yields
+    ------
+    Iterator[Path]
+        Path to the sibling folder.
+    """
+
+    staging = path.with_name(f".{path.name}.partial")
+    staging.mkdir(parents=True, exist_ok=True)
+    yield staging
+    staging.rename(path)
+
+
+def write_json_atomic(path: Path, data: dict):
+    """
+    Write a JSON file through a temporary sibling renamed over it, so readers
+    see either the previous content or the new one.
+
+    Parameters
+    ----------
+    path : Path
+        Path to the file.
+    data : dict
+        Content of the file.
+    """
+
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
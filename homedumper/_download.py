@@ -1,25 +1,47 @@
 import json
+import hashlib
 import logging
+import re
+import sys
+import threading
 import zipfile
-import urllib.request
-import os
 import cv2
-import shutil
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 import numpy as np
+import numpy.typing as npt
 
-import requests
 from homedumper.const import (
-    CACHE_DIR,
     URL_TEMPLATES,
     THUMBANIL_SIZE,
+    RESIZED_DIR,
     URL_RAW_POKEMON_METADATA,
+    TEMPLATES_SHA256,
 )
+from homedumper._cache import (
+    cache_lock,
+    cache_root,
+    staging_folder,
+    template_cache,
+    write_json_atomic,
+)
+from homedumper._fetch import stream_download
+from homedumper._runtime import process_pool
+
+TEMPLATES_ZIP = "templates.zip"
+TEMPLATE_MEMBER = re.compile(r"(?:^|/)images/pokemon/(regular|shiny)/([^/]+\.png)$")
+RESIZE_MANIFEST = "manifest.json"
+PACK_MANIFEST = "templates.json"
 
+# Name dictionary shared by the whole process, loaded on first use
+_names: Optional[Dict[str, str]] = None
+_names_lock = threading.Lock()
 
-def download_templates(URL: str, path: Path):
+
+def download_templates(URL: str, path: Path) -> Path:
     """
-    Download the templates from the given URL.
+    Download the templates archive from the given URL into the cache. The
+    archive is kept compressed, templates are converted straight from it.
 
     Parameters
     ----------
@@ -27,33 +49,15 @@ def download_templates(URL: str, path: Path):
         The URL to download the templates from.
     path : Path
         The path to download the templates to.
-    """
 
-    zip_path = path / "master.zip"
+    Returns
+    -------
+    Path
+        Path to the downloaded archive.
+    """
 
-    # Download the templates
     logging.info("Downloading templates...")
-    urllib.request.urlretrieve(URL, zip_path)
-
-    # Extract project
-    logging.info("Uncompressing templates...")
-    with zipfile.ZipFile(zip_path, "r") as zip_ref:
-        zip_ref.extractall(path)
-    os.remove(zip_path)
-
-    # Move content to the raw folder
-    raw_path = path / "raw"
-    raw_path.mkdir(parents=True, exist_ok=True)
-
-    regular_path = path / "livingdex-renders" / "images" / "pokemon" / "regular"
-    shutil.move(regular_path, raw_path)
-
-    shiny_path = path / "livingdex-renders" / "images" / "pokemon" / "shiny"
-    shutil.move(shiny_path, raw_path)
-
-    # Delete useless folders
-    shutil.rmtree(path / "livingdex-renders")
-    shutil.rmtree(path / "__MACOSX")
+    return stream_download(URL, path / TEMPLATES_ZIP, TEMPLATES_SHA256)
 
 
 def check_cached_templates(
@@ -120,46 +124,495 @@ def is_valid_thumbnail(name: str) -> bool:
     return True
 
 
-def resize_templates(cache_path: Path, subfolder: str):
+def foreground_mask(img: npt.NDArray) -> npt.NDArray:
+    """
+    Compute the mask of the pixels that belong to the pokemon in a template.
+
+    Parameters
+    ----------
+    img : npt.NDArray
+        Template image. If it has an alpha channel the opaque pixels are the
+        foreground, otherwise the pixels that are not white.
+
+    Returns
+    -------
+    npt.NDArray
+        Image with 255 on the foreground pixels and 0 elsewhere.
+    """
+
+    if img.ndim == 3 and img.shape[2] == 4:
+        mask = img[:, :, 3] > 127
+    else:
+        mask = img[:, :, :3].min(axis=2) < 250
+
+    # Flat templates (like the empty slot) are compared as a whole
+    if not mask.any():
+        mask[:] = True
+
+    return mask.astype(np.uint8) * 255
+
+
+def _resize_image(img: npt.NDArray, out_file: Path, mask_file: Path):
+    """
+    Resize a raw template and store it along with its foreground mask.
+
+    Parameters
+    ----------
+    img : npt.NDArray
+        Raw template, with alpha channel if available.
+    out_file : Path
+        Path to the resized template.
+    mask_file : Path
+        Path to the foreground mask of the resized template.
+    """
+
+    new_size = (THUMBANIL_SIZE * 2, THUMBANIL_SIZE * 2)
+
+    # Resize the image, keeping the alpha channel for the mask
+    if img.ndim == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    resized_img = cv2.resize(img, new_size, interpolation=cv2.INTER_AREA)
+    cv2.imwrite(str(out_file), resized_img[:, :, :3])
+    cv2.imwrite(str(mask_file), foreground_mask(resized_img))
+
+
+def _resize_template(in_file: Path, out_file: Path, mask_file: Path):
+    """
+    Resize a raw template file and store it along with its foreground mask.
+
+    Parameters
+    ----------
+    in_file : Path
+        Path to the raw template.
+    out_file : Path
+        Path to the resized template.
+    mask_file : Path
+        Path to the foreground mask of the resized template.
+
+    Raises
+    ------
+    ValueError
+        When the raw template can't be read.
+    """
+
+    img = cv2.imread(str(in_file), cv2.IMREAD_UNCHANGED)
+    if img is None:
+        raise ValueError(f"Invalid template: {in_file}")
+    _resize_image(img, out_file, mask_file)
+
+
+def _convert_members(zip_path: Path, tasks: List[Tuple[str, Path, Path]]):
+    """
+    Resize templates read straight from the templates archive.
+
+    Parameters
+    ----------
+    zip_path : Path
+        Path to the templates archive.
+    tasks : List[Tuple[str, Path, Path]]
+        Name of each member of the archive along with the paths to its
+        resized template and foreground mask.
+
+    Raises
+    ------
+    ValueError
+        When a member can't be decoded.
+    """
+
+    with zipfile.ZipFile(zip_path, "r") as archive:
+        for member, out_file, mask_file in tasks:
+            buffer = np.frombuffer(archive.read(member), dtype=np.uint8)
+            img = cv2.imdecode(buffer, cv2.IMREAD_UNCHANGED)
+            if img is None:
+                raise ValueError(f"Invalid template: {member}")
+            _resize_image(img, out_file, mask_file)
+
+
+def _write_empty_template(out_path: Path, mask_path: Path):
+    """
+    Create the template of an empty slot, a white image. The files are only
+    written when they are missing or differ from the expected ones, e.g.
+    after a change of the template size.
+
+    Parameters
+    ----------
+    out_path : Path
+        Folder of the resized templates.
+    mask_path : Path
+        Folder of the foreground masks.
+    """
+
+    img = np.ones((THUMBANIL_SIZE * 2, THUMBANIL_SIZE * 2, 3), dtype=np.uint8) * 255
+    for file, expected in [
+        (out_path / "0000.png", img),
+        (mask_path / "0000.png", foreground_mask(img)),
+    ]:
+        # Keep the current file if it is up to date
+        if file.exists():
+            current = cv2.imread(str(file), cv2.IMREAD_UNCHANGED)
+            if current is not None and np.array_equal(current, expected):
+                continue
+        cv2.imwrite(str(file), expected)
+
+
+def _file_hash(path: Path) -> str:
     """
-    Resize the templates according homedumper.consts.THUMBANIL_SIZE x 2.
+    Compute the hash of the content of a file.
+
+    Parameters
+    ----------
+    path : Path
+        Path to the file.
+
+    Returns
+    -------
+    str
+        Hexadecimal digest of the file.
+    """
+
+    return hashlib.sha1(path.read_bytes()).hexdigest()
+
+
+def _prepare_resized_folders(resized_path: Path) -> Dict[str, Tuple[Path, Path]]:
+    """
+    Create the folders of the resized templates and their masks, along with
+    the template of the empty slot.
+
+    Parameters
+    ----------
+    resized_path : Path
+        Folder of the resized templates.
+
+    Returns
+    -------
+    Dict[str, Tuple[Path, Path]]
+        Template and mask folders of the regular and shiny versions.
+    """
+
+    folders = {}
+    for type in ["regular", "shiny"]:
+        out_path = resized_path / type
+        out_path.mkdir(parents=True, exist_ok=True)
+        mask_path = resized_path / f"{type}_mask"
+        mask_path.mkdir(parents=True, exist_ok=True)
+
+        # Create a white background image
+        _write_empty_template(out_path, mask_path)
+        folders[type] = (out_path, mask_path)
+    return folders
+
+
+def _load_resize_manifest(resized_path: Path, force: bool = False) -> dict:
+    """
+    Load the sources of the resized templates.
+
+    Parameters
+    ----------
+    resized_path : Path
+        Folder of the resized templates.
+    force : bool, optional
+        Ignore the manifest, by default False
+
+    Returns
+    -------
+    dict
+        Entries with the 'hash' and 'stamp' of each source by template key
+        ('<type>/<file name>').
+    """
+
+    manifest_path = resized_path / RESIZE_MANIFEST
+    if force or not manifest_path.exists():
+        return {}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_resize_manifest(resized_path: Path, previous: dict, updated: dict):
+    """
+    Remove the templates whose source no longer exists and save the sources
+    of the resized templates.
+
+    Parameters
+    ----------
+    resized_path : Path
+        Folder of the resized templates.
+    previous : dict
+        Entries of the manifest before resizing.
+    updated : dict
+        Entries of the current sources.
+    """
+
+    for key in set(previous) - set(updated):
+        type, name = key.split("/")
+        (resized_path / type / name).unlink(missing_ok=True)
+        (resized_path / f"{type}_mask" / name).unlink(missing_ok=True)
+
+    write_json_atomic(resized_path / RESIZE_MANIFEST, updated)
+
+
+def resize_templates(
+    cache_path: Path,
+    subfolder: str = RESIZED_DIR,
+    jobs: Optional[int] = None,
+    force: bool = False,
+):
+    """
+    Resize the templates of the 'raw' folder according
+    homedumper.consts.THUMBANIL_SIZE x 2 and store their foreground masks in
+    a sibling '<type>_mask' folder.
+
+    Only the raw templates that are new or whose content changed since the
+    last call are resized, according to the manifest stored in the
+    destination folder.
 
     Parameters
     ----------
     cache_path : Path
         Path to the folder where the raw subfolder is stored.
+    subfolder : str, optional
+        Destination folder, by default RESIZED_DIR
+    jobs : Optional[int], optional
+        Number of worker processes, by default None (one per CPU)
+    force : bool, optional
+        Resize every template ignoring the manifest, by default False
     """
 
     # Create the destination folder
     resized_path = cache_path / subfolder
+    manifest = _load_resize_manifest(resized_path, force)
+    folders = _prepare_resized_folders(resized_path)
+
+    updated = {}
+    tasks = []
 
     # Iterate over regular and shiny versions
-    for type in ["regular", "shiny"]:
+    for type, (out_path, mask_path) in folders.items():
 
-        # Path to the folder with the input templates
-        in_path = cache_path / "raw" / type
+        # Pick each file
+        for in_file in sorted((cache_path / "raw" / type).glob("*.png")):
 
-        # Create the destination folders
-        out_path = cache_path / subfolder / type
-        out_path.mkdir(parents=True, exist_ok=True)
+            # Check if it is a possible template
+            if not is_valid_thumbnail(in_file.stem):
+                continue
+
+            key = f"{type}/{in_file.name}"
+            out_file = out_path / in_file.name
+            mask_file = mask_path / in_file.name
+            stat = in_file.stat()
+            entry = manifest.get(key, {})
+            done = out_file.exists() and mask_file.exists()
+
+            # Skip the templates whose source didn't change
+            if done and entry.get("stamp") == [stat.st_size, stat.st_mtime_ns]:
+                updated[key] = entry
+                continue
+            source_hash = _file_hash(in_file)
+            updated[key] = {"hash": source_hash, "stamp": [stat.st_size, stat.st_mtime_ns]}
+            if done and entry.get("hash") == source_hash:
+                continue
+
+            tasks.append((in_file, out_file, mask_file))
+
+    # Resize the new or changed templates in parallel
+    logging.info(f"Resizing {len(tasks)} templates.")
+    if tasks:
+        with process_pool(jobs) as pool:
+            list(pool.map(_resize_template, *zip(*tasks), chunksize=32))
+
+    _save_resize_manifest(resized_path, manifest, updated)
+
+
+def convert_templates(
+    zip_path: Path,
+    cache_path: Path,
+    subfolder: str = RESIZED_DIR,
+    jobs: Optional[int] = None,
+    force: bool = False,
+):
+    """
+    Resize the templates straight from the 'regular' and 'shiny' members of
+    the templates archive, without extracting it to disk.
 
-        # Create a white background image
-        new_size = (THUMBANIL_SIZE * 2, THUMBANIL_SIZE * 2)
-        out_file = resized_path / type / "0000.png"
-        img = np.ones((THUMBANIL_SIZE * 2, THUMBANIL_SIZE * 2, 3), dtype=np.uint8) * 255
-        cv2.imwrite(str(out_file), img)
+    Only the members that are new or whose CRC changed since the last call
+    are resized, according to the manifest stored in the destination folder.
 
-        # Pick each file
-        for in_file in in_path.glob("*.png"):
+    Parameters
+    ----------
+    zip_path : Path
+        Path to the templates archive.
+    cache_path : Path
+        Path to the cache folder.
+    subfolder : str, optional
+        Destination folder, by default RESIZED_DIR
+    jobs : Optional[int], optional
+        Number of worker processes, by default None (one per CPU)
+    force : bool, optional
+        Resize every template ignoring the manifest, by default False
+    """
 
-            # Check if it is a possible template
-            if is_valid_thumbnail(in_file.stem):
+    resized_path = cache_path / subfolder
+    manifest = _load_resize_manifest(resized_path, force)
+    folders = _prepare_resized_folders(resized_path)
+
+    updated = {}
+    tasks = []
+
+    with zipfile.ZipFile(zip_path, "r") as archive:
+        for info in archive.infolist():
+
+            # Keep only the valid regular and shiny templates
+            found = TEMPLATE_MEMBER.search(info.filename)
+            if found is None or info.filename.startswith("__MACOSX"):
+                continue
+            type, name = found.groups()
+            if not is_valid_thumbnail(Path(name).stem):
+                continue
+
+            key = f"{type}/{name}"
+            out_path, mask_path = folders[type]
+            out_file = out_path / name
+            mask_file = mask_path / name
+
+            # The CRC stored in the archive identifies the content
+            stamp = [info.file_size, info.CRC]
+            updated[key] = {"hash": f"{info.CRC:08x}", "stamp": stamp}
+            done = out_file.exists() and mask_file.exists()
+            if done and manifest.get(key, {}).get("stamp") == stamp:
+                continue
+
+            tasks.append((info.filename, out_file, mask_file))
+
+    # Resize the new or changed templates in parallel, by chunks of members
+    logging.info(f"Converting {len(tasks)} templates.")
+    if tasks:
+        with process_pool(jobs) as pool:
+            chunks = [tasks[i : i + 64] for i in range(0, len(tasks), 64)]
+            list(pool.map(_convert_members, [zip_path] * len(chunks), chunks))
+
+    _save_resize_manifest(resized_path, manifest, updated)
+
+
+def write_pack_manifest(cache_path: Path) -> dict:
+    """
+    Describe the resized templates in the pack manifest at the root of the
+    cache, so later runs can validate the cache reading a single file.
+
+    Parameters
+    ----------
+    cache_path : Path
+        Path to the folder where the templates are stored.
+
+    Returns
+    -------
+    dict
+        The manifest, with the folder and size of the templates, their ids,
+        file sizes and hashes and a version of the whole pack.
+    """
+
+    templates = {}
+    for template in sorted((cache_path / RESIZED_DIR).glob("*/*.png")):
+        key = f"{template.parent.name}/{template.stem}"
+        templates[key] = [template.stat().st_size, _file_hash(template)]
+
+    version = hashlib.sha1(json.dumps(templates, sort_keys=True).encode("utf-8"))
+    manifest = {
+        "folder": RESIZED_DIR,
+        "size": THUMBANIL_SIZE * 2,
+        "version": version.hexdigest(),
+        "templates": templates,
+    }
+
+    write_json_atomic(cache_path / PACK_MANIFEST, manifest)
+    return manifest
+
+
+def read_pack_manifest(cache_path: Path) -> Optional[dict]:
+    """
+    Read the pack manifest of the cache.
+
+    Parameters
+    ----------
+    cache_path : Path
+        Path to the folder where the templates are stored.
+
+    Returns
+    -------
+    Optional[dict]
+        The manifest, None if it doesn't exist, can't be read or describes
+        templates of another size.
+    """
+
+    try:
+        with open(cache_path / PACK_MANIFEST, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get("folder") != RESIZED_DIR:
+        return None
+    return manifest
+
+
+def verify_pack(cache_path: Path, manifest: dict) -> List[Path]:
+    """
+    Check that every template described in the pack manifest exists and has
+    the expected content.
+
+    Parameters
+    ----------
+    cache_path : Path
+        Path to the folder where the templates are stored.
+    manifest : dict
+        Pack manifest of the cache.
+
+    Returns
+    -------
+    List[Path]
+        Paths to the templates that are missing or corrupted.
+    """
+
+    invalid = []
+    resized_path = cache_path / manifest["folder"]
+    for key, (size, file_hash) in manifest["templates"].items():
+        path = resized_path / f"{key}.png"
+        if not path.exists() or path.stat().st_size != size:
+            logging.warning(f"Template {key} is missing or has a wrong size.")
+            invalid.append(path)
+        elif _file_hash(path) != file_hash:
+            logging.warning(f"Template {key} is corrupted.")
+            invalid.append(path)
+    return invalid
+
+
+def templates_version(cache_path: Path, subfolder: str = RESIZED_DIR) -> str:
+    """
+    Compute a version string identifying the current set of templates.
+
+    Parameters
+    ----------
+    cache_path : Path
+        Path to the folder where the templates are stored.
+    subfolder : str, optional
+        Subfolder with the templates, by default RESIZED_DIR
+
+    Returns
+    -------
+    str
+        Version of the pack manifest if it exists, otherwise a hexadecimal
+        digest of the names, sizes and modification times of the templates.
+        It changes whenever a template is added, removed or rewritten.
+    """
 
-                # Resize the image
-                out_file = resized_path / type / in_file.name
-                img = cv2.imread(str(in_file))
-                resized_img = cv2.resize(img, new_size, interpolation=cv2.INTER_AREA)
-                cv2.imwrite(str(out_file), resized_img)
+    manifest = read_pack_manifest(cache_path)
+    if manifest is not None and manifest["folder"] == subfolder:
+        return manifest["version"]
+
+    digest = hashlib.sha1()
+    for template in sorted((cache_path / subfolder).glob("*/*.png")):
+        stat = template.stat()
+        digest.update(f"{template.parent.name}/{template.name}".encode("utf-8"))
+        digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+    return digest.hexdigest()
 
 
 def convert_name_dict(data: dict) -> dict:
@@ -196,15 +649,30 @@ def _path_to_id2name_file() -> Path:
     Path
         Path to the id2name file.
     """    
-    cache_path = Path(CACHE_DIR)
+    cache_path = cache_root()
     filename = 'id2name.json'
     filepath = cache_path / filename
 
     return filepath
 
+
+def _path_to_id2name_meta_file() -> Path:
+    """
+    Returns the path to the file with the HTTP validators (ETag and
+    Last-Modified) of the downloaded pokemon metadata.
+
+    Returns
+    -------
+    Path
+        Path to the id2name metadata file.
+    """
+    return _path_to_id2name_file().with_name("id2name.meta.json")
+
+
 def name_dict() -> dict:
     """
-    Returns the name dictionary.
+    Returns the name dictionary. It is read from disk (or downloaded) only
+    the first time and shared by the whole process afterwards.
 
     Returns
     -------
@@ -212,80 +680,202 @@ def name_dict() -> dict:
         Dictionary to map template ids with pokemon names.
     """    
 
-    path = _path_to_id2name_file()
-    if path.exists():
-        with open(path, 'r') as f:
-            return json.load(f)
-    else:
-        return download_name_dict()
+    global _names
+
+    if _names is None:
+        with _names_lock:
+            if _names is None:
+                path = _path_to_id2name_file()
+                if path.exists():
+                    with open(path, 'r') as f:
+                        _names = {
+                            sys.intern(id): sys.intern(name)
+                            for id, name in json.load(f).items()
+                        }
+                else:
+                    _names = download_name_dict()
+
+    return _names
     
 
-def download_name_dict() -> dict:
+def download_name_dict(conditional: bool = False) -> dict:
     """
     Download the name dictionary to map template ids with pokemon names.
 
+    Parameters
+    ----------
+    conditional : bool, optional
+        Send the validators of the cached copy so the metadata is only
+        transferred if it changed, by default False
+
     Returns
     -------
     dict
         Dictionary to map template ids with pokemon names.
     """    
-    # Fetch data in json format
-    resp = requests.get(URL_RAW_POKEMON_METADATA)
-    data = json.loads(resp.text)
+    # requests is only needed here, import it on demand
+    import requests
+
+    global _names
 
-    # Convert it to the expected format
-    data = convert_name_dict(data)
-    
-    # Save it in cache
     path = _path_to_id2name_file()
-    with open(path, 'w') as outfile:
-        json.dump(data, outfile)
-    
-    # retrun the data
+    meta_path = _path_to_id2name_meta_file()
+
+    # Ask only for a newer version than the cached one
+    headers = {}
+    if conditional and path.exists() and meta_path.exists():
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    # Fetch data in json format
+    resp = requests.get(URL_RAW_POKEMON_METADATA, headers=headers, timeout=60)
+
+    if resp.status_code == 304:
+        logging.info("Name dictionary didn't change.")
+        with open(path, 'r') as f:
+            data = json.load(f)
+    else:
+        resp.raise_for_status()
+        data = json.loads(resp.text)
+
+        # Convert it to the expected format
+        data = convert_name_dict(data)
+
+        # Save it in cache along with its validators
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_json_atomic(path, data)
+        write_json_atomic(
+            meta_path,
+            {
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+            },
+        )
+
+    # Update the registry and return the data
+    _names = data
     return data
 
 
-def download(force_redownload: bool = False, force_resize: bool = False):
+def download(
+    force_redownload: bool = False,
+    force_resize: bool = False,
+    jobs: Optional[int] = None,
+    verify: bool = False,
+):
     """
     Download the templates.
+
+    Parameters
+    ----------
+    force_redownload : bool, optional
+        Download the templates and the name dictionary even if they are
+        cached, by default False
+    force_resize : bool, optional
+        Resize every template even if it didn't change, by default False
+    jobs : Optional[int], optional
+        Number of processes used to resize the templates, by default None
+        (one per CPU)
+    verify : bool, optional
+        Check the content of every cached template instead of trusting the
+        pack manifest, by default False
+    """
+
+    cache_path = template_cache()
+
+    # Concurrent runs wait for the one preparing the templates and reuse them
+    with cache_lock(cache_path):
+
+        # Trust the pack manifest unless asked to check the templates
+        manifest = None
+        if not (force_redownload or force_resize):
+            manifest = read_pack_manifest(cache_path)
+        if manifest is not None and verify:
+            invalid = verify_pack(cache_path, manifest)
+
+            # Remove the invalid templates so they are resized again
+            for path in invalid:
+                path.unlink(missing_ok=True)
+            if invalid:
+                manifest = None
+
+        if manifest is not None:
+            logging.info("Templates are already cached.")
+        elif cache_path.exists():
+
+            # Update in place, the folder is not valid until its manifest
+            # is written again
+            (cache_path / PACK_MANIFEST).unlink(missing_ok=True)
+            _prepare_templates(cache_path, force_redownload, force_resize, jobs)
+            write_pack_manifest(cache_path)
+        else:
+
+            # Publish the folder only once it is complete
+            logging.info(f"Preparing the templates in {cache_path}.")
+            with staging_folder(cache_path) as staging_path:
+                _prepare_templates(staging_path, force_redownload, force_resize, jobs)
+                write_pack_manifest(staging_path)
+
+    logging.info("Templates are ready.")
+
+    # Ensure the existence of the name dictionary
+    if not _path_to_id2name_file().exists():
+        logging.info("Downloading name dictionary.")
+        download_name_dict()
+    elif force_redownload:
+        logging.info("Checking for a newer name dictionary.")
+        download_name_dict(conditional=True)
+
+    logging.info("Name dictionary is ready.")
+
+
+def _prepare_templates(
+    cache_path: Path,
+    force_redownload: bool = False,
+    force_resize: bool = False,
+    jobs: Optional[int] = None,
+):
     """
+    Download the raw templates if they are not cached and resize the ones
+    that are new or changed.
 
-    cache_path = Path(CACHE_DIR)
+    Parameters
+    ----------
+    cache_path : Path
+        Path to the folder where the templates are stored.
+    force_redownload : bool, optional
+        Download the templates even if they are cached, by default False
+    force_resize : bool, optional
+        Resize every template even if it didn't change, by default False
+    jobs : Optional[int], optional
+        Number of processes used to resize the templates, by default None
+    """
 
     # Check if the cache folder exists
     if not cache_path.exists():
         cache_path.mkdir(parents=True, exist_ok=True)
 
-    # Check if the templates are already cached
+    # Resize the templates of an already extracted raw folder
+    zip_path = cache_path / TEMPLATES_ZIP
     if check_cached_templates(cache_path) and not force_redownload:
-        logging.info("Templates are already cached.")
-    # Download only if there are no cached templates
+        logging.info("Raw templates are already cached.")
+        resize_templates(cache_path, RESIZED_DIR, jobs, force_resize)
+        return
+
+    # Download the archive only if it is not cached
+    if zip_path.exists() and not force_redownload:
+        logging.info("Templates archive is already cached.")
     else:
         logging.info("Templates are being dowloaded.")
         download_templates(URL_TEMPLATES, cache_path)
 
-    # Check if the preprocessed templates are ready
-    resize = True
-    resized_folder = "resized"
-    if not force_redownload and check_cached_templates(
-        cache_path, resized_folder, 1000
-    ):
-        logging.info("Resized templates are already cached.")
-        resize = False
-
-    # Resize only if there are no cached resized templates
-    if resize:
-        logging.info("Resizing templates.")
-        resize_templates(cache_path, resized_folder)
-    
-    logging.info("Templates are ready.")
-
-    # Ensure the existence of the name dictionary
-    if not _path_to_id2name_file().exists() or force_redownload:
-        logging.info("Downloading name dictionary.")
-        download_name_dict()
-
-    logging.info("Name dictionary is ready.")
+    # Resize only the templates that are new or changed
+    logging.info("Converting templates.")
+    convert_templates(zip_path, cache_path, RESIZED_DIR, jobs, force_resize)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,330 @@
-from typing import List
+import os
+import zipfile
+from collections import OrderedDict
+from typing import Iterator, List, Optional, Tuple
 import cv2
 import pathlib
 import logging
+import numpy as np
 import numpy.typing as npt
-from homedumper.const import DEFAULT_OUT
+from homedumper.const import (
+    DEDUP_MIN_PIXELS,
+    DEDUP_THRESHOLD,
+    DEFAULT_OUT,
+    SIGNATURE_STRIDE,
+    SIGNATURES_FILE,
+    STABLE_THRESHOLD,
+)
+from homedumper._memory import budget_share
+from homedumper._metrics import Metrics
+
+# Region of the frames compared to discard duplicates
+DEDUP_REGION = (slice(59, 505), slice(30, 623))
+
+# Regions of the frames that indicate when L or R are pressed
+INDICATOR_REGIONS = {
+    "R": (slice(74, 103), slice(513, 533)),
+    "L": (slice(74, 103), slice(121, 141)),
+}
+
+
+def frame_name(index: int) -> str:
+    """
+    Get the file name of an extracted frame.
+
+    Parameters
+    ----------
+    index : int
+        Position of the frame among the extracted ones, from 0.
+
+    Returns
+    -------
+    str
+        Name of the image file.
+    """
+
+    return f"{index + 1}.png".rjust(7, "0")
+
+
+def changed_pixels(
+    previous: npt.NDArray, region: npt.NDArray, threshold: int = DEDUP_THRESHOLD
+) -> int:
+    """
+    Count the pixels that changed between the regions of two frames.
+
+    Parameters
+    ----------
+    previous : npt.NDArray
+        Region of the first frame.
+    region : npt.NDArray
+        Region of the second frame.
+    threshold : int, optional
+        Min gray level difference of a changed pixel, by default
+        DEDUP_THRESHOLD
+
+    Returns
+    -------
+    int
+        Number of changed pixels.
+    """
+
+    diff = cv2.absdiff(previous, region)
+
+    # Convert image to grayscale image
+    gray_image = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
+
+    # Convert the grayscale image to binary image
+    mask = cv2.inRange(gray_image, threshold, 255)
+
+    # Count the number of pixels that execeeding the threshold difference
+    return cv2.countNonZero(mask)
+
+
+def indicator_means(frame: npt.NDArray) -> npt.NDArray:
+    """
+    Get the average value of the red channel of the L/R indicators.
+
+    Parameters
+    ----------
+    frame : npt.NDArray
+        Image frame to analyze
+
+    Returns
+    -------
+    npt.NDArray
+        Average of each region of INDICATOR_REGIONS.
+    """
+
+    return np.array(
+        [frame[region][:, :, 2].mean() for region in INDICATOR_REGIONS.values()]
+    )
+
+
+def is_stable(means: npt.NDArray, threshold: int = STABLE_THRESHOLD) -> bool:
+    """
+    Check if the L/R indicators of a frame have their resting color.
+
+    Parameters
+    ----------
+    means : npt.NDArray
+        Average of the red channel of each indicator, see indicator_means.
+    threshold : int, optional
+        Max difference of the indicators with their resting color, by
+        default STABLE_THRESHOLD
+
+    Returns
+    -------
+    bool
+        True if the frame is stable (Not a transient of movement)
+    """
+
+    # Define the color of the stable condition
+    target_color = [167, 180, 31]
+
+    return bool(np.all(np.abs(means - target_color[2]) <= threshold))
+
+
+def frame_signature(frame: npt.NDArray) -> npt.NDArray:
+    """
+    Sample the region compared to discard duplicates every SIGNATURE_STRIDE
+    pixels. Sampling, unlike averaging, keeps the differences of single
+    pixels, so the changed pixels of two signatures times the stride squared
+    estimate the changed pixels of the frames.
+
+    Parameters
+    ----------
+    frame : npt.NDArray
+        Image frame to analyze
+
+    Returns
+    -------
+    npt.NDArray
+        Signature of the frame.
+    """
+
+    region = frame[DEDUP_REGION]
+    return np.ascontiguousarray(region[::SIGNATURE_STRIDE, ::SIGNATURE_STRIDE])
+
+
+class SignatureRecorder:
+    """
+    Class for recording the L/R indicators and the signature of every frame
+    decoded from a video into a sidecar file, so the frames can be extracted
+    again with other thresholds without decoding the whole video. The
+    signatures are streamed to a temporary file until the sidecar is saved.
+    """
+
+    def __init__(self, path: pathlib.Path):
+
+        self.path = path
+        self.means: List[npt.NDArray] = []
+        self.count = 0
+        self.shape: Optional[Tuple[int, ...]] = None
+        self.region: Optional[Tuple[int, ...]] = None
+
+        self.raw_path = path.with_name(path.name + ".part")
+        self.raw = open(self.raw_path, "wb")
+
+    def add(self, frame: npt.NDArray):
+        """
+        Record a decoded frame.
+
+        Parameters
+        ----------
+        frame : npt.NDArray
+            The frame.
+        """
+
+        signature = frame_signature(frame)
+        self.means.append(indicator_means(frame))
+        self.raw.write(signature.tobytes())
+        self.shape = signature.shape
+        self.region = frame[DEDUP_REGION].shape[:2]
+        self.count += 1
+
+    def save(self, video_path: pathlib.Path):
+        """
+        Write the sidecar, replacing the previous one.
+
+        Parameters
+        ----------
+        video_path : pathlib.Path
+            Path to the video, whose size and modification time identify it.
+        """
+
+        self.raw.close()
+        if self.shape is None:
+            return
+
+        signatures = np.memmap(
+            str(self.raw_path), np.uint8, "r", shape=(self.count,) + self.shape
+        )
+        stat = video_path.stat()
+
+        # Written by chunks from the temporary file, then renamed
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                index=np.arange(self.count, dtype=np.int32),
+                means=np.array(self.means),
+                signatures=signatures,
+                region=np.array(self.region),
+                stride=np.array(SIGNATURE_STRIDE),
+                source=np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64),
+            )
+        os.replace(tmp_path, self.path)
+        del signatures
+
+    def close(self):
+        """
+        Remove the temporary file.
+        """
+
+        self.raw.close()
+        self.raw_path.unlink(missing_ok=True)
+
+
+def load_signatures(path: pathlib.Path, video_path: pathlib.Path) -> Optional[dict]:
+    """
+    Load the sidecar written by SignatureRecorder.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        Path to the sidecar.
+    video_path : pathlib.Path
+        Path to the video.
+
+    Returns
+    -------
+    Optional[dict]
+        Arrays of the sidecar, None if it doesn't exist, can't be read or
+        belongs to another video or stride.
+    """
+
+    try:
+        with np.load(path) as sidecar:
+            data = {key: sidecar[key] for key in sidecar.files}
+    except (OSError, ValueError, zipfile.BadZipFile):
+        return None
+
+    stat = video_path.stat()
+    if (
+        data.get("source") is None
+        or data["source"].tolist() != [stat.st_size, stat.st_mtime_ns]
+        or int(data.get("stride", 0)) != SIGNATURE_STRIDE
+    ):
+        logging.info(f"Ignoring {path}, written for another video or version.")
+        return None
+
+    return data
+
+
+class FrameStore:
+    """
+    Class for keeping the regions of the frames already extracted, used to
+    discard duplicates. With a memory limit, only the most recent regions
+    are kept in memory and the rest are read back from the frames written to
+    disk, which are lossless.
+    """
+
+    def __init__(
+        self,
+        output_path: pathlib.Path,
+        max_bytes: Optional[int] = None,
+        metrics: Optional[Metrics] = None,
+    ):
+
+        self.output_path = output_path
+        self.max_bytes = max_bytes
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.count = 0
+
+        # Regions in memory by position, the oldest first
+        self.resident: "OrderedDict[int, npt.NDArray]" = OrderedDict()
+        self.resident_bytes = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, region: npt.NDArray):
+        """
+        Add the region of a frame that is about to be written.
+
+        Parameters
+        ----------
+        region : npt.NDArray
+            Region of the frame, copied so the whole frame can be released.
+        """
+
+        region = region.copy()
+        self.resident[self.count] = region
+        self.resident_bytes += region.nbytes
+        self.count += 1
+
+        # Forget the oldest regions beyond the limit, they are on disk
+        if self.max_bytes is not None:
+            while self.resident_bytes > self.max_bytes and len(self.resident) > 1:
+                _, oldest = self.resident.popitem(last=False)
+                self.resident_bytes -= oldest.nbytes
+
+    def __iter__(self) -> Iterator[npt.NDArray]:
+        """
+        Iterate over the regions, the most recent first since a duplicate is
+        most likely a copy of the last frames.
+        """
+
+        for index in reversed(range(self.count)):
+            region = self.resident.get(index)
+            if region is None:
+                self.metrics.count("extract.dedup_reloads")
+                path = self.output_path / frame_name(index)
+                frame = cv2.imread(str(path))
+                if frame is None:
+                    raise ValueError(f"Frame {path} was removed while extracting")
+                region = frame[DEDUP_REGION]
+            yield region
 
 
 class FrameExtractor:
@@ -11,13 +332,28 @@ class FrameExtractor:
     Class for extracting different frames from a video.
     """
 
-    def __init__(self, video_path: str, out_path: str = DEFAULT_OUT):
+    def __init__(
+        self,
+        video_path: str,
+        out_path: str = DEFAULT_OUT,
+        metrics: Optional[Metrics] = None,
+        stable_threshold: int = STABLE_THRESHOLD,
+        dedup_threshold: int = DEDUP_THRESHOLD,
+        dedup_pixels: int = DEDUP_MIN_PIXELS,
+        max_memory: Optional[int] = None,
+    ):
 
         # Ensure video path and output path are valid and get Path objects
         if not self._digest_paths(video_path, out_path):
             raise ValueError("Invalid video path")
         self.frame_count = 1
-        self.processed_frames: List[npt.ArrayLike] = []
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.processed_frames = FrameStore(
+            self.output_path, budget_share(max_memory, "dedup"), self.metrics
+        )
+        self.stable_threshold = stable_threshold
+        self.dedup_threshold = dedup_threshold
+        self.dedup_pixels = dedup_pixels
 
     def _digest_paths(self, video_path: str, output_path: str = DEFAULT_OUT) -> bool:
         """
@@ -52,11 +388,16 @@ class FrameExtractor:
         self.output_path = output_path_obj
         return True
 
-    def extract_frames(self) -> int:
+    def extract_frames(self, recorder: Optional[SignatureRecorder] = None) -> int:
         """
         Extracts frames from the video and saves them to the output path only
         if they are unique.
 
+        Parameters
+        ----------
+        recorder : Optional[SignatureRecorder], optional
+            Recorder of the signature of every decoded frame, by default None
+
         Returns
         -------
         int
@@ -69,15 +410,126 @@ class FrameExtractor:
         # Retreive each frame from the video and process it
         while True:
             # Retrieve frame
-            ret, frame = cap.read()
+            with self.metrics.timer("extract.decode"):
+                ret, frame = cap.read()
 
             # If the frame is empty, break
             if not ret:
                 return self.frame_count - 1
+            self.metrics.count("extract.frames_decoded")
 
+            if recorder is not None:
+                recorder.add(frame)
             self.process_frame(frame, self.output_path)
 
-    def _is_stable(self, frame: npt.NDArray, threshold: int = 10) -> bool:
+    def extract_signatures(self, sidecar: dict) -> int:
+        """
+        Extracts the frames deciding which ones are stable and unique from the
+        signatures of a previous extraction, so only the frames saved are
+        decoded, seeking to each one. The frames left by the previous
+        extraction beyond the new ones are removed.
+
+        Duplicates are discarded estimating the changed pixels of the frames
+        from their signatures, so a few borderline frames may be decided
+        differently than when decoding the whole video.
+
+        Parameters
+        ----------
+        sidecar : dict
+            Arrays of the sidecar, see load_signatures.
+
+        Returns
+        -------
+        int
+            Number of frames extracted
+        """
+
+        signatures = sidecar["signatures"]
+        scale = np.prod(sidecar["region"]) / np.prod(signatures.shape[1:3])
+
+        # Decide from the indicators and signatures of every frame
+        kept: List[npt.NDArray] = []
+        indices: List[int] = []
+        for index, means, signature in zip(
+            sidecar["index"], sidecar["means"], signatures
+        ):
+            if not is_stable(means, self.stable_threshold):
+                self.metrics.count("extract.rejected_unstable")
+                continue
+
+            # Compare with the most recent frames first
+            duplicate = False
+            with self.metrics.timer("extract.dedup"):
+                for previous in reversed(kept):
+                    self.metrics.count("extract.dedup_comparisons")
+                    changed = changed_pixels(previous, signature, self.dedup_threshold)
+                    if changed * scale < self.dedup_pixels:
+                        duplicate = True
+                        break
+            if duplicate:
+                self.metrics.count("extract.rejected_duplicate")
+                continue
+
+            kept.append(signature)
+            indices.append(int(index))
+
+        # Decode only the frames to save
+        cap = cv2.VideoCapture(str(self.video_path))
+        position = 0
+        seek = True
+
+        def read(index: int) -> Optional[npt.NDArray]:
+            nonlocal position
+
+            # Seek to the frame, or skip the frames before it
+            if seek and position != index:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+                position = index
+            while position < index:
+                if not cap.grab():
+                    return None
+                position += 1
+
+            ret, frame = cap.read()
+            position += 1
+            return frame if ret else None
+
+        for index, signature in zip(indices, kept):
+            with self.metrics.timer("extract.decode"):
+                frame = read(index)
+
+                # Some videos can't be seeked to the exact frame, decode
+                # them from the start instead
+                if (
+                    seek
+                    and frame is not None
+                    and not np.array_equal(frame_signature(frame), signature)
+                ):
+                    logging.warning(
+                        f"Can't seek {self.video_path} accurately, decoding it."
+                    )
+                    self.metrics.count("extract.inaccurate_seeks")
+                    cap.release()
+                    cap = cv2.VideoCapture(str(self.video_path))
+                    position = 0
+                    seek = False
+                    frame = read(index)
+
+            if frame is None:
+                logging.error(f"Frame {index} of {self.video_path} can't be read.")
+                break
+            self.metrics.count("extract.frames_decoded")
+            self.write_frame(frame, self.output_path)
+        cap.release()
+
+        # Remove the frames of the previous extraction
+        for stale in self.output_path.glob("*.png"):
+            if stale.stem.isdigit() and int(stale.stem) >= self.frame_count:
+                stale.unlink()
+
+        return self.frame_count - 1
+
+    def _is_stable(self, frame: npt.NDArray, threshold: Optional[int] = None) -> bool:
         """
         Checks if the frame is stable by inspecting if the
         animation caused by pressing either L or R buttons is not present
@@ -88,9 +540,9 @@ class FrameExtractor:
         ----------
         frame : npt.ArrayLike
             Image frame to analyze
-        threshold : int, optional
+        threshold : Optional[int], optional
             Threshold for the color difference of the regions to be considered
-            stable, by default 10
+            stable, by default None (the one given to the extractor)
 
         Returns
         -------
@@ -98,30 +550,15 @@ class FrameExtractor:
             True if the frame is stable (Not a transient of movement)
         """
 
-        # Defines the regions of the frame to be checked
-        regions = {
-            "R": frame[74:103, 513:533],
-            "L": frame[74:103, 121:141],
-        }
-
-        # Define the color of the stable condition
-        target_color = [167, 180, 31]
-
-        # Check if the regions are stable
-        for region in regions.values():
+        if threshold is None:
+            threshold = self.stable_threshold
 
-            # Retrieve the average value of the region's red channel
-            red_channel = region[:, :, 2]
-            avg = red_channel.mean()
-
-            # Check if the region is not stable
-            if abs(avg - target_color[2]) > threshold:
-                return False
-
-        # If all regions are stable, return True
-        return True
+        # Check the average value of the red channel of the regions
+        return is_stable(indicator_means(frame), threshold)
 
-    def _is_not_duplicate(self, frame: npt.NDArray, threshold: int = 10) -> bool:
+    def _is_not_duplicate(
+        self, frame: npt.NDArray, threshold: Optional[int] = None
+    ) -> bool:
         """
         Checks if the frame is not duplicate by comparing it with the previous
         frames.
@@ -130,9 +567,9 @@ class FrameExtractor:
         ----------
         frame : npt.ArrayLike
             Image frame to analyze
-        threshold : int, optional
+        threshold : Optional[int], optional
             Threshold for the color difference of the images to be considered
-            different, by default 10
+            different, by default None (the one given to the extractor)
 
         Returns
         -------
@@ -140,8 +577,11 @@ class FrameExtractor:
             True if the frame is a new one (Not a duplicate)
         """
 
+        if threshold is None:
+            threshold = self.dedup_threshold
+
         # Retreive the region of interest from the frame
-        region = frame[59:505, 30:623, :]
+        region = frame[DEDUP_REGION]
 
         # Check if the frame is the first one
         if len(self.processed_frames) == 0:
@@ -151,29 +591,21 @@ class FrameExtractor:
         # Check if the frame is a duplicate
         for previous_frame_region in self.processed_frames:
 
-            diff = cv2.absdiff(previous_frame_region, region)
-
-            # Convert image to grayscale image
-            gray_image = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
-
-            # Convert the grayscale image to binary image
-            mask = cv2.inRange(gray_image, threshold, 255)
+            self.metrics.count("extract.dedup_comparisons")
+            diff_pix = changed_pixels(previous_frame_region, region, threshold)
 
-            # Count the number of pixels that execeeding the threshold difference
-            diff_pix = cv2.countNonZero(mask)
-
-            # If there are more than 2000 pixelels that exceed the threshold,
-            # the frame is not a duplicate, 2000 is a number chosen analyzing
-            # the average frame difference between two consecutive slots with
-            # different pokemon
-            if diff_pix < 2000:
+            # If there are more than `dedup_pixels` pixels that exceed the
+            # threshold, the frame is not a duplicate, the default 2000 is a
+            # number chosen analyzing the average frame difference between two
+            # consecutive slots with different pokemon
+            if diff_pix < self.dedup_pixels:
                 return False
 
         # If the frame is not a duplicate, add it to the list
         self.processed_frames.append(region)
         return True
 
-    def process_frame(self, frame: npt.NDArray, output_path: pathlib.Path):
+    def process_frame(self, frame: npt.NDArray, output_path: pathlib.Path) -> bool:
         """
         Processes a frame and saves it to the output path if it is a new
         one.
@@ -184,21 +616,62 @@ class FrameExtractor:
             Image containing the frame to be processed
         output_path : pathlib.Path
             Destination where the frame will be saved if it is new
+
+        Returns
+        -------
+        bool
+            True if the frame was saved
         """
 
         # Check if the image is not a transient
-        if self._is_stable(frame):
+        with self.metrics.timer("extract.stability"):
+            stable = self._is_stable(frame)
+        if not stable:
+            self.metrics.count("extract.rejected_unstable")
+            return False
 
-            # Check if the image is not a duplicate
-            if self._is_not_duplicate(frame):
+        # Check if the image is not a duplicate
+        with self.metrics.timer("extract.dedup"):
+            new = self._is_not_duplicate(frame)
+        if not new:
+            self.metrics.count("extract.rejected_duplicate")
+            return False
 
-                # Save the frame to the output path
-                img_name = f"{self.frame_count}.png".rjust(7,"0")
-                cv2.imwrite(str(output_path / img_name), frame)
-                self.frame_count += 1
+        self.write_frame(frame, output_path)
+        return True
 
+    def write_frame(self, frame: npt.NDArray, output_path: pathlib.Path):
+        """
+        Saves a frame to the output path as the next extracted one.
+
+        Parameters
+        ----------
+        frame : npt.ArrayLike
+            Image containing the frame to be saved
+        output_path : pathlib.Path
+            Destination where the frame will be saved
+        """
 
-def extract(video_path: str, output_path: str = DEFAULT_OUT) -> int:
+        # Save the frame to the output path
+        img_name = frame_name(self.frame_count - 1)
+        img_path = output_path / img_name
+        with self.metrics.timer("extract.write"):
+            cv2.imwrite(str(img_path), frame)
+        self.metrics.count("extract.frames_written")
+        self.metrics.count("extract.bytes_written", img_path.stat().st_size)
+        self.frame_count += 1
+
+
+def extract(
+    video_path: str,
+    output_path: str = DEFAULT_OUT,
+    metrics: Optional[Metrics] = None,
+    stable_threshold: int = STABLE_THRESHOLD,
+    dedup_threshold: int = DEDUP_THRESHOLD,
+    dedup_pixels: int = DEDUP_MIN_PIXELS,
+    max_memory: Optional[int] = None,
+    signatures: bool = False,
+) -> int:
     """
     Extracts frames from the video and saves them to the output path only
     if they are unique.
@@ -210,10 +683,54 @@ def extract(video_path: str, output_path: str = DEFAULT_OUT) -> int:
     output_path : str, optional
         Path to the folder where the output will be generated, by default
         './output/'
+    metrics : Optional[Metrics], optional
+        Collector of the counters and timers of the stage, by default None
+    stable_threshold : int, optional
+        Max difference of the L/R indicators with their resting color for a
+        frame to be stable, by default STABLE_THRESHOLD
+    dedup_threshold : int, optional
+        Min gray level difference for a pixel to change between two frames,
+        by default DEDUP_THRESHOLD
+    dedup_pixels : int, optional
+        Min number of changed pixels for a frame not to be a duplicate, by
+        default DEDUP_MIN_PIXELS
+    max_memory : Optional[int], optional
+        Memory budget of the pipeline in bytes, bounding the regions kept to
+        discard duplicates, by default None (unbounded)
+    signatures : bool, optional
+        Record the L/R indicators and a subsampled signature of every frame
+        in a SIGNATURES_FILE sidecar in the project folder, or if the sidecar
+        of the video already exists, decide which frames to save from it and
+        decode only those, by default False
     """
 
     try:
-        fe = FrameExtractor(video_path, output_path)
+        fe = FrameExtractor(
+            video_path,
+            output_path,
+            metrics,
+            stable_threshold,
+            dedup_threshold,
+            dedup_pixels,
+            max_memory,
+        )
     except ValueError:
         return 0
-    return fe.extract_frames()
+    with fe.metrics.timer("extract.total"):
+        if not signatures:
+            return fe.extract_frames()
+
+        # Decide from the signatures of a previous extraction
+        sidecar_path = fe.output_path.parent / SIGNATURES_FILE
+        sidecar = load_signatures(sidecar_path, fe.video_path)
+        if sidecar is not None:
+            logging.info(f"Extracting frames from the signatures in {sidecar_path}")
+            return fe.extract_signatures(sidecar)
+
+        recorder = SignatureRecorder(sidecar_path)
+        try:
+            count = fe.extract_frames(recorder)
+            recorder.save(fe.video_path)
+        finally:
+            recorder.close()
+        return count
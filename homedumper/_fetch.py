@@ -0,0 +1,141 @@
+import hashlib
+import logging
+from pathlib import Path
+from typing import Mapping, Optional
+
+CHUNK_SIZE = 1 << 16  # bytes written to disk at once while downloading
+
+
+def _sha256(path: Path) -> str:
+    """
+    Compute the SHA-256 of a file reading it by chunks.
+
+    Parameters
+    ----------
+    path : Path
+        Path to the file.
+
+    Returns
+    -------
+    str
+        Hexadecimal digest of the file.
+    """
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _total_size(status: int, headers: Mapping[str, str], offset: int) -> Optional[int]:
+    """
+    Get the size of the whole file from the headers of a download response.
+
+    Parameters
+    ----------
+    status : int
+        Status code of the response.
+    headers : Mapping[str, str]
+        Headers of the response.
+    offset : int
+        Bytes already downloaded, requested as a range.
+
+    Returns
+    -------
+    Optional[int]
+        Size of the whole file in bytes, None if the server didn't send it.
+    """
+
+    # Partial and unsatisfiable ranges: 'bytes <first>-<last>/<total>' or
+    # 'bytes */<total>'
+    if status in (206, 416):
+        total = headers.get("Content-Range", "").rpartition("/")[2]
+        if total.isdigit():
+            return int(total)
+        if status == 416:
+            return None
+
+    length = headers.get("Content-Length", "")
+    if not length.isdigit():
+        return None
+    return int(length) + (offset if status == 206 else 0)
+
+
+def stream_download(url: str, dest: Path, sha256: Optional[str] = None) -> Path:
+    """
+    Download a file streaming it to disk. An interrupted download is resumed
+    from the '.part' file it left behind using an HTTP Range request.
+
+    The file is only published once its size matches the one announced by
+    the server, and its checksum if given. A partial file the server reports
+    as complete without its size is downloaded again.
+
+    Parameters
+    ----------
+    url : str
+        The URL to download the file from.
+    dest : Path
+        Destination of the file.
+    sha256 : Optional[str], optional
+        Expected SHA-256 hex digest of the file, by default None (not checked)
+
+    Returns
+    -------
+    Path
+        The destination of the file.
+
+    Raises
+    ------
+    ValueError
+        When the downloaded file doesn't match the expected size or checksum.
+    """
+
+    # requests is only needed here, import it on demand
+    import requests
+
+    part = dest.with_name(dest.name + ".part")
+
+    while True:
+        offset = part.stat().st_size if part.exists() else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+        with requests.get(url, headers=headers, stream=True, timeout=60) as resp:
+            total = _total_size(resp.status_code, resp.headers, offset)
+
+            # The partial file is already complete
+            if resp.status_code == 416:
+                logging.info(f"{dest.name} was already downloaded.")
+
+            else:
+                resp.raise_for_status()
+
+                # Start over if the server ignored the range
+                mode = "ab"
+                if resp.status_code != 206:
+                    offset = 0
+                    mode = "wb"
+                if offset:
+                    logging.info(f"Resuming download of {dest.name} at {offset} bytes.")
+
+                with open(part, mode) as f:
+                    for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+
+        # Nothing proves the partial file is complete, download it again
+        if resp.status_code == 416 and total is None and sha256 is None:
+            logging.info(f"Can't verify the size of {dest.name}, downloading it again.")
+            part.unlink()
+            continue
+        break
+
+    # Verify the whole file before publishing it
+    if total is not None and part.stat().st_size != total:
+        part.unlink()
+        raise ValueError(f"Size mismatch downloading {url}")
+    if sha256 is not None and _sha256(part) != sha256:
+        part.unlink()
+        raise ValueError(f"Checksum mismatch downloading {url}")
+
+    part.replace(dest)
+    return dest
@@ -0,0 +1,152 @@
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+import cv2
+import numpy as np
+import numpy.typing as npt
+
+from homedumper._scorers import ssim_likelihood
+
+
+def species_key(id: str) -> str:
+    """
+    Get the species part of a template id. Template ids follow the
+    'species-form' pattern of the pokemon names, with the national dex number
+    as species (e.g. '0025-f' is a form of '0025').
+
+    Parameters
+    ----------
+    id : str
+        Name of the template file.
+
+    Returns
+    -------
+    str
+        Species of the template.
+    """
+
+    return id.split("-")[0]
+
+
+class SpeciesIndex:
+    """
+    Class for matching thumbnails in two stages: first against one mean
+    template per species at a reduced resolution, then at full resolution
+    against the forms of the most likely species only.
+    """
+
+    def __init__(self, templates: dict, scale: float = 0.5):
+
+        self.templates = templates
+        self.scale = scale
+
+        # Group the templates by species
+        self.forms: Dict[str, List[str]] = defaultdict(list)
+        for id in sorted(templates):
+            self.forms[species_key(id)].append(id)
+
+        # Average the forms of each species into a small representative
+        self.representatives = {}
+        for species, ids in self.forms.items():
+            mean = np.mean([templates[id] for id in ids], axis=0).astype(np.uint8)
+            self.representatives[species] = self._downscale(mean)
+
+    def _downscale(self, img: npt.NDArray) -> npt.NDArray:
+        """
+        Reduce the resolution of an image for the species stage.
+
+        Parameters
+        ----------
+        img : npt.NDArray
+            Image to downscale.
+
+        Returns
+        -------
+        npt.NDArray
+            Downscaled image.
+        """
+
+        return cv2.resize(img, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+
+    def shortlist(self, thumbnail: npt.NDArray, size: int) -> List[str]:
+        """
+        Find the species whose representatives are closer to a thumbnail.
+
+        Parameters
+        ----------
+        thumbnail : npt.NDArray
+            Image of the target Pokemon.
+        size : int
+            Number of species to keep.
+
+        Returns
+        -------
+        List[str]
+            The `size` most likely species, the best first.
+        """
+
+        small = self._downscale(thumbnail)
+        likelihoods = {
+            species: ssim_likelihood(small, representative)
+            for species, representative in self.representatives.items()
+        }
+        return sorted(likelihoods, key=likelihoods.__getitem__, reverse=True)[:size]
+
+    def best_match(
+        self, thumbnail: npt.NDArray, size: int = 3
+    ) -> Tuple[Optional[str], float, int]:
+        """
+        Estimate the id of the most likely Pokemon corresponding to a thumbnail.
+
+        Parameters
+        ----------
+        thumbnail : npt.NDArray
+            Image of the target Pokemon.
+        size : int, optional
+            Number of species whose forms are compared at full resolution, by
+            default 3
+
+        Returns
+        -------
+        Tuple[Optional[str], float, int]
+            Id of the best template (None if no template matched), its
+            likelihood and the number of comparisons made.
+        """
+
+        species = self.shortlist(thumbnail, size)
+        best, like, visited = self.refine(thumbnail, species)
+        return best, like, visited + len(self.representatives)
+
+    def refine(
+        self, thumbnail: npt.NDArray, species: List[str]
+    ) -> Tuple[Optional[str], float, int]:
+        """
+        Compare a thumbnail at full resolution against all the forms of the
+        given species.
+
+        Parameters
+        ----------
+        thumbnail : npt.NDArray
+            Image of the target Pokemon.
+        species : List[str]
+            Species whose forms are compared.
+
+        Returns
+        -------
+        Tuple[Optional[str], float, int]
+            Id of the best template (None if no template matched), its
+            likelihood and the number of comparisons made.
+        """
+
+        best = None
+        like = 0.0
+        visited = 0
+
+        for key in species:
+            for id in self.forms[key]:
+                lk = ssim_likelihood(thumbnail, self.templates[id], fine=True)
+                visited += 1
+                if lk > like:
+                    best = id
+                    like = lk
+
+        return best, like, visited
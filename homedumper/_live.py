@@ -0,0 +1,463 @@
+import json
+import logging
+import pathlib
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Iterator, List, Optional
+import cv2
+import numpy as np
+import numpy.typing as npt
+
+from homedumper.const import (
+    DEDUP_MIN_PIXELS,
+    DEDUP_THRESHOLD,
+    DEFAULT_MATCH_MARGIN,
+    DEFAULT_OUT,
+    DEFAULT_SCORER,
+    LIVE_IDLE_TIMEOUT,
+    LIVE_POLL_INTERVAL,
+    LIVE_QUEUE_SIZE,
+    LIVE_RESULTS,
+    STABLE_THRESHOLD,
+)
+from homedumper._boxify import boxify_frame
+from homedumper._download import download
+from homedumper._extract import (
+    DEDUP_REGION,
+    FrameExtractor,
+    changed_pixels,
+    frame_name,
+    frame_signature,
+)
+from homedumper._loader import load_box
+from homedumper._match import Matcher, _create_matcher, _export, _match_box
+from homedumper._metrics import Metrics
+
+
+def _is_device(source: str) -> bool:
+    """
+    Check if a source is the index of a capture device rather than a file.
+
+    Parameters
+    ----------
+    source : str
+        Index of the device (e.g. '0') or path to a video file.
+
+    Returns
+    -------
+    bool
+        True for a capture device.
+    """
+
+    return source.isdigit()
+
+
+class LiveSource:
+    """
+    Class for reading the frames of a capture device at its own frame rate,
+    or of a video file, optionally replayed at a fixed frame rate or followed
+    while it is still being written.
+    """
+
+    def __init__(
+        self,
+        source: str,
+        fps: Optional[float] = None,
+        follow: bool = False,
+        idle_timeout: float = LIVE_IDLE_TIMEOUT,
+    ):
+
+        self.source = source
+        self.fps = fps
+        self.follow = follow and not _is_device(source)
+        self.idle_timeout = idle_timeout
+        self.stopped = threading.Event()
+        self.seek = True
+
+    def _open(self) -> cv2.VideoCapture:
+        """
+        Open the capture of the source.
+
+        Returns
+        -------
+        cv2.VideoCapture
+            The capture.
+        """
+
+        if _is_device(self.source):
+            return cv2.VideoCapture(int(self.source))
+        return cv2.VideoCapture(self.source)
+
+    def _reopen(
+        self, position: int, last: Optional[npt.NDArray]
+    ) -> cv2.VideoCapture:
+        """
+        Open the video file again at the first frame not read yet. Seeking is
+        checked against the last frame read, since some videos can't be
+        seeked to the exact frame, and the frames already read are skipped
+        instead when it fails.
+
+        Parameters
+        ----------
+        position : int
+            Number of frames already read.
+        last : Optional[npt.NDArray]
+            Signature of the last frame read, None if no frame was read.
+
+        Returns
+        -------
+        cv2.VideoCapture
+            The capture.
+        """
+
+        cap = self._open()
+        if last is None:
+            return cap
+
+        # Seek to the last frame read and check it is the same
+        if self.seek:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, position - 1)
+            ret, frame = cap.read()
+            if ret and np.array_equal(frame_signature(frame), last):
+                return cap
+            logging.warning(f"Can't seek {self.source} accurately, decoding it.")
+            cap.release()
+            cap = self._open()
+            self.seek = False
+
+        # Skip the frames already read
+        for _ in range(position):
+            if not cap.grab():
+                break
+        return cap
+
+    def stop(self):
+        """
+        Stop reading frames, e.g. when the user ends the capture.
+        """
+
+        self.stopped.set()
+
+    def __iter__(self) -> Iterator[npt.NDArray]:
+        """
+        Iterate over the frames until the source ends or is stopped.
+        """
+
+        cap = self._open()
+        if not cap.isOpened():
+            raise ValueError(f"Unable to open {self.source}")
+
+        position = 0
+        last: Optional[npt.NDArray] = None
+        start = time.perf_counter()
+        idle_since: Optional[float] = None
+
+        try:
+            while not self.stopped.is_set():
+                ret, frame = cap.read()
+
+                if not ret:
+                    if not self.follow:
+                        return
+
+                    # Wait for the file to grow and read it again from the
+                    # first frame not read yet
+                    now = time.perf_counter()
+                    if idle_since is None:
+                        idle_since = now
+                    elif now - idle_since > self.idle_timeout:
+                        return
+                    time.sleep(LIVE_POLL_INTERVAL)
+                    cap.release()
+                    cap = self._reopen(position, last)
+                    continue
+
+                idle_since = None
+                position += 1
+                if self.follow:
+                    last = frame_signature(frame)
+
+                # Replay a file at the requested frame rate
+                if self.fps is not None:
+                    delay = start + position / self.fps - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                yield frame
+        finally:
+            cap.release()
+
+
+class LiveExtractor(FrameExtractor):
+    """
+    Class for extracting different frames from a live source, whose frames
+    are given one by one instead of read from a finished video.
+    """
+
+    def _digest_paths(self, video_path: str, output_path: str = DEFAULT_OUT) -> bool:
+        """
+        Digests the source and the output path, naming the project of a
+        capture device after its index.
+
+        Parameters
+        ----------
+        video_path : str
+                Index of the capture device or path to the video
+        output_path : str, optional
+                String describing the output path, by default DEFAULT_OUT
+        """
+
+        if not _is_device(video_path):
+            return super()._digest_paths(video_path, output_path)
+
+        self.video_path = pathlib.Path(f"device{video_path}")
+        self.output_path = pathlib.Path(output_path) / self.video_path.stem / "frames"
+        self.output_path.mkdir(parents=True, exist_ok=True)
+        return True
+
+
+def _read_frames(
+    source: LiveSource,
+    extractor: LiveExtractor,
+    frames: queue.Queue,
+    metrics: Metrics,
+    done: Future,
+):
+    """
+    Read the frames of the source and queue the stable ones that differ from
+    the previous one, which are few since every box is shown for many frames.
+    Runs in its own thread so the source is read at its own pace.
+
+    Parameters
+    ----------
+    source : LiveSource
+        The source.
+    extractor : LiveExtractor
+        Extractor whose thresholds are used.
+    frames : queue.Queue
+        Queue of (index, frame, capture time), ended with None.
+    metrics : Metrics
+        Collector of the counters and timers.
+    done : Future
+        Set when the source ends, with the error that stopped the reading if
+        any, for the thread that matches the frames to raise it.
+    """
+
+    last = None
+    try:
+        for index, frame in enumerate(source):
+            captured = time.perf_counter()
+            metrics.count("extract.frames_decoded")
+
+            # Skip the transitions between boxes
+            if not extractor._is_stable(frame):
+                metrics.count("extract.rejected_unstable")
+                continue
+
+            # Skip the copies of the last frame, the rest are checked against
+            # every frame extracted when matched
+            region = frame[DEDUP_REGION]
+            if last is not None:
+                diff_pix = changed_pixels(last, region, extractor.dedup_threshold)
+                if diff_pix < extractor.dedup_pixels:
+                    metrics.count("extract.rejected_duplicate")
+                    continue
+            last = region
+
+            # Wait for a free place if matching falls behind
+            if frames.full():
+                metrics.count("live.queue_full")
+            frames.put((index, frame, captured))
+            metrics.count("live.frames_queued")
+    except BaseException as err:
+        done.set_exception(err)
+    else:
+        done.set_result(None)
+    finally:
+        frames.put(None)
+
+
+def live(
+    source: str,
+    output_path: str = DEFAULT_OUT,
+    callback: Optional[Callable[[dict], None]] = None,
+    fps: Optional[float] = None,
+    follow: bool = False,
+    threshold: Optional[float] = None,
+    margin: float = DEFAULT_MATCH_MARGIN,
+    priors: Optional[List[str]] = None,
+    shortlist: Optional[int] = None,
+    scorer: str = DEFAULT_SCORER,
+    stable_threshold: int = STABLE_THRESHOLD,
+    dedup_threshold: int = DEDUP_THRESHOLD,
+    dedup_pixels: int = DEDUP_MIN_PIXELS,
+    verify: bool = False,
+    metrics: Optional[Metrics] = None,
+    matcher: Optional[Matcher] = None,
+) -> int:
+    """
+    Dump the boxes of a live source while the user scrolls through them,
+    matching each new box as soon as it is shown. Every box is passed to
+    `callback` and appended to LIVE_RESULTS in the project folder, and the
+    'match.csv' and 'match.json' files are written when the source ends or
+    the capture is interrupted with Ctrl+C.
+
+    Parameters
+    ----------
+    source : str
+        Index of a capture device (e.g. '0') or path to a video file.
+    output_path : str, optional
+        Path to the output folder, by default DEFAULT_OUT
+    callback : Optional[Callable[[dict], None]], optional
+        Function called with each box matched, with its 'box' folder,
+        'title', source 'frame' index, 'latency' in seconds since the frame
+        was captured and 'slots', by default None
+    fps : Optional[float], optional
+        Replay a video file at this frame rate, as if it was captured live,
+        by default None (read it as fast as possible)
+    follow : bool, optional
+        Keep reading a video file that is still being written until it stops
+        growing for LIVE_IDLE_TIMEOUT seconds, by default False
+    threshold : Optional[float], optional
+        Likelihood above which the search of a slot stops early, by default
+        None (compare every template).
+    margin : float, optional
+        Minimum likelihood gap with the runner-up to stop early, by default
+        DEFAULT_MATCH_MARGIN
+    priors : Optional[List[str]], optional
+        Paths to 'match.json' files of previous dumps used to sort the
+        templates, by default None
+    shortlist : Optional[int], optional
+        Number of species whose forms are compared, by default None (compare
+        every template).
+    scorer : str, optional
+        Name of the scorer, by default DEFAULT_SCORER. The matrix scorers
+        keep the latency low with large template sets.
+    stable_threshold : int, optional
+        Max difference of the L/R indicators with their resting color, by
+        default STABLE_THRESHOLD
+    dedup_threshold : int, optional
+        Min gray level difference of a changed pixel, by default
+        DEDUP_THRESHOLD
+    dedup_pixels : int, optional
+        Min changed pixels for a frame not to be a duplicate, by default
+        DEDUP_MIN_PIXELS
+    verify : bool, optional
+        Check the content of every cached template, by default False
+    metrics : Optional[Metrics], optional
+        Collector of the counters and timers of the stages, by default None
+    matcher : Optional[Matcher], optional
+        Matcher already loaded with the same settings, by default None
+
+    Returns
+    -------
+    int
+        Number of boxes found.
+
+    Raises
+    ------
+    ValueError
+        When the source can't be opened.
+    """
+
+    if metrics is None:
+        metrics = Metrics()
+
+    try:
+        extractor = LiveExtractor(
+            source,
+            output_path,
+            metrics,
+            stable_threshold,
+            dedup_threshold,
+            dedup_pixels,
+        )
+    except ValueError:
+        return 0
+    project_path = extractor.output_path.parent
+    boxes_path = project_path / "boxes"
+    boxes_path.mkdir(parents=True, exist_ok=True)
+
+    # Load the templates before the capture starts
+    if matcher is None:
+        download(verify=verify)
+        with metrics.timer("match.load_templates"):
+            matcher = _create_matcher(
+                {}, priors or [], threshold, margin, shortlist, scorer
+            )
+
+    live_source = LiveSource(source, fps, follow)
+    frames: queue.Queue = queue.Queue(LIVE_QUEUE_SIZE)
+    read: Future = Future()
+    reader = threading.Thread(
+        target=_read_frames,
+        args=(live_source, extractor, frames, metrics, read),
+        daemon=True,
+    )
+
+    rows = []
+    latencies = []
+
+    def process(index: int, frame: npt.NDArray, captured: float, results):
+
+        # Keep only the frames of boxes not seen before
+        name = frame_name(extractor.frame_count - 1)
+        if not extractor.process_frame(frame, extractor.output_path):
+            return
+
+        # Extract and match the box
+        stem = pathlib.Path(name).stem
+        box_path = boxify_frame(frame, stem, boxes_path, metrics, int(stem))
+        box_rows, _ = _match_box(load_box(box_path), matcher, metrics)
+        rows.extend(box_rows)
+
+        latency = time.perf_counter() - captured
+        latencies.append(latency)
+        metrics.timers["live.latency"] += latency
+        metrics.count("live.boxes")
+
+        result = {
+            "box": box_path.name,
+            "title": box_rows[0][0] if box_rows else "",
+            "frame": index,
+            "latency": round(latency, 3),
+            "slots": [
+                {
+                    "slot": slot,
+                    "pokemon": pokemon,
+                    "template": template,
+                    "likelihood": float(like),
+                }
+                for _, slot, pokemon, template, like in box_rows
+            ],
+        }
+        results.write(json.dumps(result) + "\n")
+        results.flush()
+        if callback is not None:
+            callback(result)
+
+    logging.info(f"Capturing {source}, press Ctrl+C to stop")
+    with open(project_path / LIVE_RESULTS, "w", encoding="utf-8") as results:
+        reader.start()
+        try:
+            for index, frame, captured in iter(frames.get, None):
+                process(index, frame, captured, results)
+        except KeyboardInterrupt:
+            logging.info("Stopping the capture, matching the frames already read.")
+            live_source.stop()
+            for index, frame, captured in iter(frames.get, None):
+                process(index, frame, captured, results)
+        reader.join()
+
+    with metrics.timer("match.export"):
+        _export(project_path, [row[:3] for row in rows])
+    if latencies:
+        logging.info(f"Matched each box {max(latencies):.2f}s after it was shown at most")
+
+    # Raise the error that stopped the capture, once the boxes already
+    # matched are exported
+    read.result()
+
+    return len(latencies)
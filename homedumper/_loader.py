@@ -0,0 +1,144 @@
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+import cv2
+import numpy as np
+import numpy.typing as npt
+
+from homedumper.const import LOADER_THREADS
+
+
+class LoadedBox(NamedTuple):
+    """
+    Content of a box folder read from disk. The thumbnails are kept encoded
+    and only decoded when they are matched, so the boxes whose results are
+    cached are never decoded.
+    """
+
+    folder: str
+    title: str
+    slots: List[str]
+    encoded: List[bytes]
+    hash: str
+
+    @property
+    def thumbnails(self) -> List[npt.NDArray]:
+        """
+        Decode the thumbnails of the box, in the order of its slots.
+
+        Raises
+        ------
+        ValueError
+            When a thumbnail is not a valid image.
+        """
+
+        thumbnails = []
+        for slot, data in zip(self.slots, self.encoded):
+            buffer = np.frombuffer(data, dtype=np.uint8)
+            thumbnail = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+            if thumbnail is None:
+                raise ValueError(f"Can't decode slot {slot} of box {self.folder}")
+            thumbnails.append(thumbnail)
+        return thumbnails
+
+
+def load_box(box_path: Path) -> LoadedBox:
+    """
+    Read the title and the thumbnails of a box folder, reading each file only
+    once.
+
+    Parameters
+    ----------
+    box_path : Path
+        Path to the box folder.
+
+    Returns
+    -------
+    LoadedBox
+        Title, slot ids and encoded thumbnails of the box, along with a hash
+        of the content of its files.
+    """
+
+    digest = hashlib.sha1()
+    title = ""
+    slots = []
+    encoded = []
+
+    for file in sorted(box_path.iterdir()):
+        if file.suffix not in (".png", ".txt"):
+            continue
+
+        data = file.read_bytes()
+        digest.update(file.name.encode("utf-8"))
+        digest.update(data)
+
+        if file.name == "title.txt":
+            title = data.decode("utf-8").strip()
+        elif file.suffix == ".png":
+            slots.append(file.stem)
+            encoded.append(data)
+
+    return LoadedBox(box_path.name, title, slots, encoded, digest.hexdigest())
+
+
+def box_bytes(box: LoadedBox) -> int:
+    """
+    Estimate the memory used by a loaded box.
+
+    Parameters
+    ----------
+    box : LoadedBox
+        The box.
+
+    Returns
+    -------
+    int
+        Bytes of its encoded thumbnails, at least 1.
+    """
+
+    return max(1, sum(len(data) for data in box.encoded))
+
+
+def prefetch_boxes(
+    box_paths: Iterable[Path],
+    threads: int = LOADER_THREADS,
+    max_bytes: Optional[int] = None,
+) -> Iterator[LoadedBox]:
+    """
+    Load boxes in background threads, keeping the next ones read while the
+    current one is being processed.
+
+    Parameters
+    ----------
+    box_paths : Iterable[Path]
+        Paths to the box folders, in order.
+    threads : int, optional
+        Number of reading threads, by default LOADER_THREADS
+    max_bytes : Optional[int], optional
+        Memory available to the boxes read ahead, estimated from the size of
+        the ones already read, by default None (unbounded)
+
+    Yields
+    ------
+    LoadedBox
+        The boxes in the same order as `box_paths`.
+    """
+
+    # Keep up to two boxes per thread being read ahead
+    depth = max(1, 2 * threads)
+
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as pool:
+        pending: deque = deque()
+        for box_path in box_paths:
+            pending.append(pool.submit(load_box, box_path))
+            while len(pending) >= depth:
+                box = pending.popleft().result()
+
+                # Read fewer boxes ahead if they don't fit in the budget
+                if max_bytes is not None:
+                    depth = max(1, min(depth, max_bytes // box_bytes(box)))
+                yield box
+        while pending:
+            yield pending.popleft().result()
@@ -1,39 +1,50 @@
 import csv
 import json
 import logging
+from collections import deque
+from concurrent.futures import Future
 from pathlib import Path
-from typing import List, Tuple
-from skimage.metrics import structural_similarity
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 import cv2
 import numpy.typing as npt
 
-from homedumper.const import CACHE_DIR
-from homedumper._download import name_dict
+from homedumper.const import (
+    DEFAULT_MATCH_MARGIN,
+    DEFAULT_SCORER,
+    EMPTY_TEMPLATE,
+    RESIZED_DIR,
+)
+from homedumper._cache import cache_lock, cache_root, template_cache
+from homedumper._download import name_dict, templates_version
+from homedumper._index import SpeciesIndex, species_key
+from homedumper._loader import LoadedBox, box_bytes, prefetch_boxes
+from homedumper._memory import budget_share
+from homedumper._metrics import Metrics
+from homedumper._priors import (
+    SearchOrder,
+    count_names,
+    count_previous_dumps,
+    priors_version,
+    slot_neighbours,
+)
+from homedumper._runtime import process_pool
+from homedumper._scope import (
+    load_pack,
+    pack_path,
+    read_scope,
+    resolve_scope,
+    save_pack,
+    scope_version,
+)
+from homedumper._scorers import create_scorer, ssim_likelihood
+from homedumper._store import ResultStore
+
+MANIFEST_FILE = "match_manifest.json"
+MANIFEST_SCHEMA = 2  # rows of (box, slot, pokemon, template, likelihood)
+MANIFEST_ROW = 5
+SPILL_FILE = "match_spill.sqlite"  # results kept on disk under a memory budget
+CSV_HEADER = ("Box name", "Slot Number", "Pokemon ID")
 
-def ssim_likelihood(img1: npt.NDArray, img2: npt.NDArray) -> float:
-    """
-    Compute the likelihood of two images being the same using the Structural
-    Similarity Index
-
-    Parameters
-    ----------
-    img1 : npt.NDarray
-        The first image.
-    img2 : npt.NDarray
-        The second image.
-
-    Returns
-    -------
-    float
-        The likelihood of the two images being the same using the SSIM method.
-    """
-
-    # Convert the second image to the first image's size
-    if img1.shape != img2.shape:
-        img2 = cv2.resize(img2, img1.shape)
-
-    # Compute SSIM between two images
-    return structural_similarity(img1, img2, channel_axis=2)
 
 def id2name(id: str) -> str:
     """
@@ -56,7 +67,36 @@ def id2name(id: str) -> str:
     logging.error(f"No pokemon name found for template with {id}.png")
     return id
 
-def _best_match(thumbnail: npt.NDArray, templates: dict) -> str:
+def _template_name(id: Optional[str]) -> Optional[str]:
+    """
+    Translate the id of the best matching template into a pokemon name.
+
+    Parameters
+    ----------
+    id : Optional[str]
+        Name of the template file, None if nothing matched.
+
+    Returns
+    -------
+    Optional[str]
+        Name of the pokemon, None if the slot is empty.
+    """
+
+    # If the match is with the empty image, return None
+    if id is None or id == EMPTY_TEMPLATE:
+        return None
+
+    # Translate best match into pokemon name
+    return id2name(id)
+
+
+def _best_match(
+    thumbnail: npt.NDArray,
+    templates: dict,
+    order: Optional[List[str]] = None,
+    threshold: Optional[float] = None,
+    margin: float = DEFAULT_MATCH_MARGIN,
+) -> Tuple[Optional[str], float, int]:
     """
     Estimate the id of the most likely Pokemon corresponding to a thumbnail.
 
@@ -67,100 +107,899 @@ def _best_match(thumbnail: npt.NDArray, templates: dict) -> str:
     templates : dict
         Dictionary with the templates. Keys are the ids and values are
         the template images.
+    order : Optional[List[str]], optional
+        Order in which the templates are compared, by default None (the
+        order of the templates dictionary).
+    threshold : Optional[float], optional
+        Likelihood above which the search stops early, provided that the
+        best match exceeds the runner-up by at least `margin`, by default
+        None (compare every template).
+    margin : float, optional
+        Minimum likelihood gap between the best match and the runner-up to
+        stop early, by default DEFAULT_MATCH_MARGIN
+
+    Returns
+    -------
+    Tuple[Optional[str], float, int]
+        Id of the best template (None if no template matched), its
+        likelihood and the number of templates compared.
     """
     best = None
     like = 0.0
+    runner_up = 0.0
+    visited = 0
 
     # Iterate over the templates
-    for name, template in templates.items():
+    for name in order or templates:
 
         # Compute the likelihood of the template being the thumbnail
-        lk = ssim_likelihood(thumbnail, template)
+        lk = ssim_likelihood(thumbnail, templates[name])
+        visited += 1
 
         # If he likelihood is better than the current best, update the best
         if lk > like:
             best = name
+            runner_up = like
             like = lk
+        elif lk > runner_up:
+            runner_up = lk
 
-    # If the match is with the empty image, return None
-    if best == "0000":
-        return None
+        # Stop if the best match is good enough and clearly above the rest
+        if threshold is not None and like >= threshold and like - runner_up >= margin:
+            break
 
-    # Translate best match into pokemon name
-    return id2name(best)
+    return best, like, visited
+
+
+def check_search(threshold: Optional[float], shortlist: Optional[int]):
+    """
+    Check that the search settings can be combined.
+
+    Parameters
+    ----------
+    threshold : Optional[float]
+        Likelihood above which the search of a slot stops early.
+    shortlist : Optional[int]
+        Number of species whose forms are compared.
+
+    Raises
+    ------
+    ValueError
+        When both a shortlist and a threshold are given, since the two-stage
+        search compares every species and then every form of the shortlist,
+        so it can't stop early nor use the priors.
+    """
+
+    if shortlist and threshold is not None:
+        raise ValueError("A shortlist can't be combined with a threshold")
 
 
-def parse_slot_path(path: Path) -> Tuple[str, str]:
+class Matcher:
+    """
+    Class for estimating the template that corresponds to each slot with the
+    configured scorer and search strategy.
+    """
+
+    def __init__(
+        self,
+        templates: dict,
+        search: Optional[SearchOrder] = None,
+        threshold: Optional[float] = None,
+        margin: float = DEFAULT_MATCH_MARGIN,
+        shortlist: Optional[int] = None,
+        scorer: str = DEFAULT_SCORER,
+        masks: Optional[dict] = None,
+        max_memory: Optional[int] = None,
+    ):
+
+        check_search(threshold, shortlist)
+
+        self.templates = templates
+        self.search = search
+        self.threshold = threshold
+        self.margin = margin
+        self.shortlist = shortlist
+
+        # Score whole boxes at once with a matrix scorer, mapping its matrix
+        # from the cache folder if it doesn't fit in the budget
+        self.scorer = create_scorer(
+            scorer,
+            templates,
+            masks,
+            budget_share(max_memory, "templates"),
+            str(cache_root()),
+        )
+
+        # Group the templates by species for the two-stage search
+        self.index = SpeciesIndex(templates) if shortlist else None
+
+    def best_match(
+        self, thumbnail: npt.NDArray, neighbours: List[Tuple[str, int]]
+    ) -> Tuple[Optional[str], float, int]:
+        """
+        Estimate the id of the most likely Pokemon corresponding to a thumbnail.
+
+        Parameters
+        ----------
+        thumbnail : npt.NDArray
+            Image of the target Pokemon.
+        neighbours : List[Tuple[str, int]]
+            Template ids already matched in the same box, along with their
+            distance in slots to the current one.
+
+        Returns
+        -------
+        Tuple[Optional[str], float, int]
+            Id of the best template (None if no template matched), its
+            likelihood and the number of comparisons made.
+        """
+
+        # Species first, then only its forms
+        if self.index is not None and self.shortlist:
+            return self.index.best_match(thumbnail, self.shortlist)
+
+        # Flat search, with the most likely templates first
+        order = None
+        if self.search is not None:
+            order = self.search.order(neighbours)
+        return _best_match(
+            thumbnail, self.templates, order, self.threshold, self.margin
+        )
+
+    def match_box(
+        self, thumbnails: List[npt.NDArray]
+    ) -> List[Tuple[Optional[str], float, int]]:
+        """
+        Estimate the id of the most likely Pokemon corresponding to each
+        thumbnail of a box.
+
+        Parameters
+        ----------
+        thumbnails : List[npt.NDArray]
+            Images of the slots of the box, in order.
+
+        Returns
+        -------
+        List[Tuple[Optional[str], float, int]]
+            Id of the best template of each slot (None if no template
+            matched), its likelihood and the number of comparisons made.
+        """
+
+        if self.scorer is not None:
+            scores = self.scorer.score(thumbnails)
+            return self._match_box_scores(thumbnails, scores, self.scorer.ids)
+
+        results = []
+        found: Dict[int, str] = {}
+        for slot, thumbnail in enumerate(thumbnails):
+            best, like, count = self.best_match(thumbnail, slot_neighbours(slot, found))
+            if best is not None:
+                found[slot] = best
+            results.append((best, like, count))
+        return results
+
+    def _match_box_scores(
+        self, thumbnails: List[npt.NDArray], scores: npt.NDArray, ids: List[str]
+    ) -> List[Tuple[Optional[str], float, int]]:
+        """
+        Pick the best template of each slot from the scores of a matrix
+        scorer, refining the forms of the best species if a shortlist is set.
+
+        Parameters
+        ----------
+        thumbnails : List[npt.NDArray]
+            Images of the slots of the box, in order.
+        scores : npt.NDArray
+            Matrix (thumbnails x templates) with the likelihoods.
+        ids : List[str]
+            Ids of the templates, in the order of the columns of `scores`.
+
+        Returns
+        -------
+        List[Tuple[Optional[str], float, int]]
+            Id of the best template of each slot, its likelihood and the
+            number of comparisons made.
+        """
+
+        results: List[Tuple[Optional[str], float, int]] = []
+
+        for thumbnail, row in zip(thumbnails, scores):
+
+            if self.index is None:
+                best = int(row.argmax())
+                results.append((ids[best], float(row[best]), len(ids)))
+                continue
+
+            # Collect the species of the best scored templates
+            species: List[str] = []
+            for best in row.argsort()[::-1]:
+                key = species_key(ids[best])
+                if key not in species:
+                    species.append(key)
+                    if len(species) == self.shortlist:
+                        break
+
+            best_id, like, count = self.index.refine(thumbnail, species)
+            results.append((best_id, like, count + len(ids)))
+
+        return results
+
+
+def _read_template(path: Path, flags: int) -> npt.NDArray:
     """
-    Parse the path to a slot thumbnail and return the box name and the slot number.
+    Read a resized template.
 
     Parameters
     ----------
     path : Path
-        Path to the slot thumbnail.
+        Path to the template.
+    flags : int
+        Flags of cv2.imread.
 
     Returns
     -------
-    Tuple[str, str]
-        Box name and slot number.
-    """   
+    npt.NDArray
+        The template image.
 
-    slot_id = path.stem
-    title_path = path.parent / 'title.txt' 
+    Raises
+    ------
+    ValueError
+        When the template is missing or can't be read.
+    """
 
-    # Read the title file
-    with open(title_path, "r", encoding="utf-8") as f:
-        title = f.read().strip()
-    
-    return title, slot_id
+    template = cv2.imread(str(path), flags)
+    if template is None:
+        raise ValueError(f"Invalid template: {path}, run download with --verify")
+    return template
 
 
-def _match(boxes_path: Path) -> List[Tuple[str, str, str]]:
+def _load_templates(folder: str = "regular", ids: Optional[Set[str]] = None) -> dict:
     """
-    Iterate over all boxes and estimates the id of the more likely Pokemon
-    corresponding to each slot.
+    Load the resized templates from the cache.
 
     Parameters
     ----------
-    path : str
-        Path to the folder that contains the 'boxes' subfolder with the images.
+    folder : str, optional
+        Subfolder of the resized templates to load, by default "regular"
+    ids : Optional[Set[str]], optional
+        Ids of the templates to load, by default None (every template). The
+        subset is packed into a single file of the cache the first time, and
+        read from it afterwards.
 
     Returns
     -------
-    List[Tuple[Path, str]]
-        List of tuples with the path to the image and the pokemon id.
+    dict
+        Dictionary with the templates. Keys are the ids and values are
+        the template images.
     """
 
     # Path to the resized template dir
-    assets_path = Path(CACHE_DIR) / "resized" / "regular"
+    assets_path = template_cache() / RESIZED_DIR / folder
+    flags = cv2.IMREAD_GRAYSCALE if folder.endswith("_mask") else cv2.IMREAD_COLOR
+
+    # Load a subset from its pack, packing it the first time
+    if ids is not None:
+        path = pack_path(templates_version(template_cache()), folder, ids)
+        templates = load_pack(path)
+        if templates is None:
+            templates = {
+                id: _read_template(assets_path / f"{id}.png", flags)
+                for id in sorted(ids)
+            }
+            save_pack(path, templates)
+        return templates
 
     # Load the templates
     templates = {}
     for template in assets_path.glob("*.png"):
-        templates[template.stem] = cv2.imread(str(template))
+        templates[template.stem] = _read_template(template, flags)
     # TODO: See what to do with the shiny
 
-    # Initialize empty list
+    return templates
+
+
+def _scope_ids(scope: List[str]) -> Set[str]:
+    """
+    Get the templates of the species of a scope.
+
+    Parameters
+    ----------
+    scope : List[str]
+        Pokemon names, template ids or paths to files with them, see
+        read_scope.
+
+    Returns
+    -------
+    Set[str]
+        Ids of the templates in the scope, with the empty slot.
+    """
+
+    assets_path = template_cache() / RESIZED_DIR / "regular"
+    template_ids = [template.stem for template in assets_path.glob("*.png")]
+    name2id = {name: id for id, name in name_dict().items()}
+
+    ids = resolve_scope(read_scope(scope), template_ids, name2id)
+    logging.info(f"Matching against {len(ids)} of {len(template_ids)} templates.")
+    return ids
+
+
+def _match_box(
+    box: LoadedBox, matcher: Matcher, metrics: Optional[Metrics] = None
+) -> Tuple[List[tuple], int]:
+    """
+    Estimate the id of the more likely Pokemon corresponding to each slot of
+    a single box.
+
+    Parameters
+    ----------
+    box : LoadedBox
+        Title and thumbnails of the box.
+    matcher : Matcher
+        Templates and search strategy used to match each slot.
+    metrics : Optional[Metrics], optional
+        Collector of the counters and timers of the stage, by default None
+
+    Returns
+    -------
+    Tuple[List[tuple], int]
+        List of rows (Box name, Slot Number, Pokemon ID, Template ID,
+        Likelihood) and the total number of comparisons made.
+    """
+
+    logging.info(f"Matching {len(box.slots)} slots from {box.folder}")
+
     matches = []
+    visited = 0
+
+    if metrics is None:
+        metrics = Metrics()
+
+    with metrics.timer("match.scoring"):
+        results = matcher.match_box(box.thumbnails)
+    for slot_id, (best, like, count) in zip(box.slots, results):
+        visited += count
+        matches.append((box.title, slot_id, _template_name(best), best, like))
+
+    # Matrix scorers compare the whole box at once
+    metrics.count("match.slots_matched", len(matches))
+    metrics.count("match.comparisons", visited)
+    metrics.count("match.scorer_calls", 1 if matcher.scorer is not None else visited)
+
+    return matches, visited
+
+
+def _manifest_version(
+    threshold: Optional[float],
+    margin: float,
+    shortlist: Optional[int],
+    scorer: str,
+    scope: Optional[List[str]] = None,
+    priors: Optional[List[str]] = None,
+) -> str:
+    """
+    Get the version of the results stored in the manifest of a project.
 
-    # Iterate over the boxes
-    for box_path in sorted(boxes_path.iterdir()):
+    Parameters
+    ----------
+    threshold : Optional[float]
+        Likelihood above which the search of a slot stops early.
+    margin : float
+        Minimum likelihood gap with the runner-up to stop early.
+    shortlist : Optional[int]
+        Number of species whose forms are compared.
+    scorer : str
+        Name of the scorer.
+    scope : Optional[List[str]], optional
+        Species scope of the templates, by default None (every template)
+    priors : Optional[List[str]], optional
+        Paths to 'match.json' files of previous dumps sorting the templates,
+        by default None
 
-        # Iterate over the slots
-        for thumbnail in sorted(box_path.glob("*.png")):
+    Returns
+    -------
+    str
+        Version of the template set and of the search settings.
+    """
 
-            # Read the target image
-            logging.info(f"Matching {thumbnail.name} from {box_path.name}")
-            thu = cv2.imread(str(thumbnail))
-            name = _best_match(thu, templates)
-            box_name, slot_id = parse_slot_path(thumbnail)
+    # Results depend on the template set and on the search strategy, and
+    # their layout on the schema of the manifest
+    version = templates_version(template_cache())
+    version = f"v{MANIFEST_SCHEMA}:{version}:{scorer}:{threshold}:{margin}:{shortlist}"
+    if scope:
+        version += f":{scope_version(read_scope(scope))}"
+    if priors:
+        version += f":priors-{priors_version(priors)}"
+    return version
 
-            matches.append((box_name, slot_id, name))
 
-    return matches
+def _load_manifest(path: Path, version: str) -> Dict[str, dict]:
+    """
+    Load the cached box results from the manifest of a project.
 
+    Parameters
+    ----------
+    path : Path
+        Path to the manifest file.
+    version : str
+        Version of the current template set. Cached results computed with a
+        different template set are discarded.
 
-def export_csv(path: Path, header: Tuple[str, str, str], data: List[Tuple[str, str, str]]):
+    Returns
+    -------
+    Dict[str, dict]
+        Cached entries by box folder name, each one with the 'hash' of the box
+        content and its 'matches'.
+    """
+
+    if not path.exists():
+        return {}
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        logging.warning(f"Ignoring unreadable manifest {path}")
+        return {}
+
+    if manifest.get("templates") != version:
+        logging.info("Template set changed since last match, matching all boxes.")
+        return {}
+
+    # Match again the boxes whose rows don't have the expected layout
+    return {
+        folder: entry
+        for folder, entry in manifest.get("boxes", {}).items()
+        if all(len(row) == MANIFEST_ROW for row in entry.get("matches", []))
+    }
+
+
+def _save_manifest(path: Path, version: str, boxes: Dict[str, dict]):
+    """
+    Save the box results to the manifest of a project.
+
+    Parameters
+    ----------
+    path : Path
+        Path to the manifest file.
+    version : str
+        Version of the template set used to compute the results.
+    boxes : Dict[str, dict]
+        Entries by box folder name, each one with the 'hash' of the box
+        content and its 'matches'.
+    """
+
+    manifest = {"templates": version, "boxes": boxes}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+
+def _match_boxes(
+    boxes_path: Path,
+    manifest_path: Optional[Path] = None,
+    threshold: Optional[float] = None,
+    margin: float = DEFAULT_MATCH_MARGIN,
+    priors: Optional[List[str]] = None,
+    shortlist: Optional[int] = None,
+    scorer: str = DEFAULT_SCORER,
+    jobs: int = 1,
+    metrics: Optional[Metrics] = None,
+    matcher: Optional[Matcher] = None,
+    max_memory: Optional[int] = None,
+    scope: Optional[List[str]] = None,
+) -> Iterator[Tuple[str, List[tuple]]]:
+    """
+    Iterate over all boxes and estimates the id of the more likely Pokemon
+    corresponding to each slot, yielding the results of each box as soon as
+    they are available.
+
+    Parameters
+    ----------
+    boxes_path : Path
+        Path to the 'boxes' folder with one subfolder per box.
+    manifest_path : Optional[Path], optional
+        Path to the manifest with the results of previous runs. Only the boxes
+        whose content or template set changed are matched again, by default
+        None (match every box).
+    threshold : Optional[float], optional
+        Likelihood above which the search of a slot stops early, comparing
+        the most likely templates first, by default None (compare every
+        template).
+    margin : float, optional
+        Minimum likelihood gap with the runner-up to stop early, by default
+        DEFAULT_MATCH_MARGIN
+    priors : Optional[List[str]], optional
+        Paths to 'match.json' files of previous dumps used to estimate how
+        frequent each pokemon is, by default None
+    shortlist : Optional[int], optional
+        Number of species whose forms are compared after a first match
+        against one representative per species, by default None (compare
+        every template).
+    scorer : str, optional
+        Name of the scorer used to compare the thumbnails with the
+        templates, by default DEFAULT_SCORER
+    jobs : int, optional
+        Number of processes matching boxes in parallel, by default 1
+    metrics : Optional[Metrics], optional
+        Collector of the counters and timers of the stage, by default None
+    matcher : Optional[Matcher], optional
+        Matcher already loaded, shared by several projects, by default None
+        (load the templates if some box needs to be matched).
+    max_memory : Optional[int], optional
+        Memory budget of the pipeline in bytes, bounding the templates kept
+        in memory and the boxes read ahead, by default None (unbounded)
+    scope : Optional[List[str]], optional
+        Pokemon names, template ids or paths to files with them restricting
+        the templates to their species, by default None (every template)
+
+    Yields
+    ------
+    Tuple[str, List[tuple]]
+        Name of the box folder and its rows (Box name, Slot Number,
+        Pokemon ID, Template ID, Likelihood).
+    """
+
+    check_search(threshold, shortlist)
+    version = _manifest_version(threshold, margin, shortlist, scorer, scope, priors)
+    cached = {}
+    if manifest_path is not None:
+        cached = _load_manifest(manifest_path, version)
+
+    # Initialize the updated manifest entries
+    boxes = {}
+    matched_slots = 0
+    visited = 0
+
+    # Iterate over the boxes, reading the next ones in background
+    box_paths = sorted(path for path in boxes_path.iterdir() if path.is_dir())
+    matcher_args = (
+        cached, priors or [], threshold, margin, shortlist, scorer, max_memory, scope
+    )
+    results = _box_results(
+        box_paths,
+        cached,
+        matcher_args,
+        jobs,
+        metrics,
+        matcher,
+        budget_share(max_memory, "buffers"),
+    )
+    for box, box_matches, count in results:
+
+        if count:
+            matched_slots += len(box_matches)
+            visited += count
+
+        boxes[box.folder] = {"hash": box.hash, "matches": box_matches}
+        yield box.folder, box_matches
+
+    if matched_slots:
+        logging.info(
+            f"Made {visited / matched_slots:.1f} comparisons per slot on average"
+        )
+
+    if manifest_path is not None:
+        _save_manifest(manifest_path, version, boxes)
+
+
+def _box_results(
+    box_paths: List[Path],
+    cached: Dict[str, dict],
+    matcher_args: tuple,
+    jobs: int = 1,
+    metrics: Optional[Metrics] = None,
+    matcher: Optional[Matcher] = None,
+    max_bytes: Optional[int] = None,
+) -> Iterator[Tuple[LoadedBox, List[tuple], int]]:
+    """
+    Match the boxes that changed since the previous run, in this process or
+    in a pool of worker processes, and reuse the results of the rest.
+
+    Parameters
+    ----------
+    box_paths : List[Path]
+        Paths to the box folders, in order.
+    cached : Dict[str, dict]
+        Entries of the project manifest with the results of previous runs.
+    matcher_args : tuple
+        Arguments of _create_matcher.
+    jobs : int, optional
+        Number of worker processes, by default 1 (match in this process)
+    metrics : Optional[Metrics], optional
+        Collector of the counters and timers of the stage, by default None
+    matcher : Optional[Matcher], optional
+        Matcher already loaded, used in this process, by default None
+    max_bytes : Optional[int], optional
+        Memory available to the boxes read ahead or being matched, by default
+        None (unbounded)
+
+    Yields
+    ------
+    Tuple[LoadedBox, List[tuple], int]
+        Each box in order, its rows and the number of comparisons made (0 if
+        the results were cached).
+    """
+
+    if metrics is None:
+        metrics = Metrics()
+
+    # Templates are only loaded if some box needs to be matched
+    pool = None
+
+    # Boxes whose results are being computed, in order
+    pending: deque = deque()
+
+    try:
+        for box in prefetch_boxes(box_paths, max_bytes=max_bytes):
+
+            entry = cached.get(box.folder)
+
+            # Reuse the previous results if the box didn't change
+            if entry is not None and entry["hash"] == box.hash:
+                logging.info(f"Reusing cached matches for {box.folder}")
+                metrics.count("match.cache_hits")
+                pending.append((box, ([tuple(row) for row in entry["matches"]], 0)))
+
+            # Match the box in a worker process
+            elif jobs > 1 and matcher is None:
+                if pool is None:
+                    pool = process_pool(jobs, _init_worker, matcher_args)
+                pending.append((box, pool.submit(_match_box_worker, box)))
+
+            # Match the box in this process
+            else:
+                if matcher is None:
+                    with metrics.timer("match.load_templates"):
+                        matcher = _create_matcher(*matcher_args)
+                pending.append((box, _match_box(box, matcher, metrics)))
+
+            # Yield the finished boxes in order, bounding the ones in flight
+            in_flight = 2 * jobs
+            if max_bytes is not None:
+                in_flight = min(in_flight, max(1, max_bytes // box_bytes(box)))
+            while pending and (
+                len(pending) > in_flight
+                or not isinstance(pending[0][1], Future)
+                or pending[0][1].done()
+            ):
+                box, result = pending.popleft()
+                yield _resolve(box, result, metrics)
+
+        while pending:
+            box, result = pending.popleft()
+            yield _resolve(box, result, metrics)
+
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+
+def _resolve(
+    box: LoadedBox, result: Union[Future, Tuple[List[tuple], int]], metrics: Metrics
+) -> Tuple[LoadedBox, List[tuple], int]:
+    """
+    Wait for the results of a box.
+
+    Parameters
+    ----------
+    box : LoadedBox
+        The box.
+    result : Union[Future, Tuple[List[tuple], int]]
+        Its rows and number of comparisons, or the future that computes them
+        along with the metrics of the worker.
+    metrics : Metrics
+        Collector where the metrics of the worker are merged.
+
+    Returns
+    -------
+    Tuple[LoadedBox, List[tuple], int]
+        The box, its rows and the number of comparisons made.
+    """
+
+    if isinstance(result, Future):
+        rows, visited, worker_metrics = result.result()
+        metrics.merge(worker_metrics)
+    else:
+        rows, visited = result
+    return box, rows, visited
+
+
+def _create_matcher(
+    cached: Dict[str, dict],
+    priors: List[str],
+    threshold: Optional[float],
+    margin: float,
+    shortlist: Optional[int],
+    scorer: str,
+    max_memory: Optional[int] = None,
+    scope: Optional[List[str]] = None,
+) -> Matcher:
+    """
+    Load the templates and create the matcher with the given settings.
+
+    Parameters
+    ----------
+    cached : Dict[str, dict]
+        Entries of the project manifest with the results of previous runs,
+        used as priors.
+    priors : List[str]
+        Paths to 'match.json' files of previous dumps.
+    threshold : Optional[float]
+        Likelihood above which the search of a slot stops early.
+    margin : float
+        Minimum likelihood gap with the runner-up to stop early.
+    shortlist : Optional[int]
+        Number of species whose forms are compared.
+    scorer : str
+        Name of the scorer.
+    max_memory : Optional[int], optional
+        Memory budget of the pipeline in bytes, by default None (unbounded)
+    scope : Optional[List[str]], optional
+        Pokemon names, template ids or paths to files with them restricting
+        the templates to their species, by default None (every template)
+
+    Returns
+    -------
+    Matcher
+        The matcher.
+    """
+
+    # Keep the templates from being updated while they are read
+    masks = None
+    with cache_lock(template_cache(), shared=True):
+        ids = _scope_ids(scope) if scope else None
+        templates = _load_templates(ids=ids)
+        if scorer == "masked":
+            masks = _load_templates("regular_mask", ids)
+
+    search = None
+    if threshold is not None:
+        search = _search_order(templates, cached, priors)
+    return Matcher(
+        templates, search, threshold, margin, shortlist, scorer, masks, max_memory
+    )
+
+
+# Matcher of each worker process of the pool used by _box_results
+_worker_matcher: Optional[Matcher] = None
+
+
+def _init_worker(*matcher_args):
+    """
+    Create the matcher of a worker process.
+    """
+
+    global _worker_matcher
+    _worker_matcher = _create_matcher(*matcher_args)
+
+
+def _match_box_worker(box: LoadedBox) -> Tuple[List[tuple], int, Metrics]:
+    """
+    Match a box with the matcher of the worker process.
+
+    Parameters
+    ----------
+    box : LoadedBox
+        Title and thumbnails of the box.
+
+    Returns
+    -------
+    Tuple[List[tuple], int, Metrics]
+        Rows of the box, the number of comparisons made and the metrics
+        collected while matching it.
+    """
+
+    if _worker_matcher is None:
+        raise RuntimeError("The worker process was not initialized")
+    metrics = Metrics()
+    rows, visited = _match_box(box, _worker_matcher, metrics)
+    return rows, visited, metrics
+
+
+def _match(
+    boxes_path: Path,
+    manifest_path: Optional[Path] = None,
+    threshold: Optional[float] = None,
+    margin: float = DEFAULT_MATCH_MARGIN,
+    priors: Optional[List[str]] = None,
+    shortlist: Optional[int] = None,
+    scorer: str = DEFAULT_SCORER,
+    jobs: int = 1,
+    metrics: Optional[Metrics] = None,
+    matcher: Optional[Matcher] = None,
+    max_memory: Optional[int] = None,
+    scope: Optional[List[str]] = None,
+) -> List[Tuple[str, str, str]]:
+    """
+    Iterate over all boxes and estimates the id of the more likely Pokemon
+    corresponding to each slot.
+
+    Parameters
+    ----------
+    boxes_path : Path
+        Path to the 'boxes' folder with one subfolder per box.
+    manifest_path : Optional[Path], optional
+        Path to the manifest with the results of previous runs, by default
+        None (match every box).
+    threshold : Optional[float], optional
+        Likelihood above which the search of a slot stops early, by default
+        None (compare every template).
+    margin : float, optional
+        Minimum likelihood gap with the runner-up to stop early, by default
+        DEFAULT_MATCH_MARGIN
+    priors : Optional[List[str]], optional
+        Paths to 'match.json' files of previous dumps, by default None
+    shortlist : Optional[int], optional
+        Number of species whose forms are compared, by default None (compare
+        every template).
+    scorer : str, optional
+        Name of the scorer, by default DEFAULT_SCORER
+    jobs : int, optional
+        Number of processes matching boxes in parallel, by default 1
+    metrics : Optional[Metrics], optional
+        Collector of the counters and timers of the stage, by default None
+    matcher : Optional[Matcher], optional
+        Matcher already loaded, by default None
+    max_memory : Optional[int], optional
+        Memory budget of the pipeline in bytes, by default None (unbounded)
+    scope : Optional[List[str]], optional
+        Species scope of the templates, by default None (every template)
+
+    Returns
+    -------
+    List[Tuple[str, str, str]]
+        List of rows (Box name, Slot Number, Pokemon ID).
+    """
+
+    boxes = _match_boxes(
+        boxes_path,
+        manifest_path,
+        threshold,
+        margin,
+        priors,
+        shortlist,
+        scorer,
+        jobs,
+        metrics,
+        matcher,
+        max_memory,
+        scope,
+    )
+    return [row[:3] for _, rows in boxes for row in rows]
+
+
+def _search_order(
+    templates: dict, cached: Dict[str, dict], priors: List[str]
+) -> SearchOrder:
+    """
+    Create the priors used to sort the templates compared against each slot.
+
+    Parameters
+    ----------
+    templates : dict
+        Dictionary with the templates. Keys are the ids and values are
+        the template images.
+    cached : Dict[str, dict]
+        Entries of the project manifest with the results of previous runs.
+    priors : List[str]
+        Paths to 'match.json' files of previous dumps.
+
+    Returns
+    -------
+    SearchOrder
+        Priors to sort the templates.
+    """
+
+    name2id = {name: id for id, name in name_dict().items()}
+
+    # Count the pokemon found in previous dumps and previous runs
+    frequencies = count_previous_dumps(priors, name2id)
+    for entry in cached.values():
+        frequencies += count_names((row[2] for row in entry["matches"]), name2id)
+
+    return SearchOrder(templates.keys(), frequencies)
+
+
+def export_csv(path: Path, header: Tuple[str, str, str], data: Iterable[Tuple[str, str, str]]):
     """
     Export the data to a csv file.
 
@@ -170,8 +1009,8 @@ def export_csv(path: Path, header: Tuple[str, str, str], data: List[Tuple[str, s
         Path to the csv file.
     header : Tuple[str, str, str]
         Title of the columns in the csv file.
-    data : List[Tuple[str, str, str]
-        List of all rows (Box name, Slot Number, Pokemon ID).
+    data : Iterable[Tuple[str, str, str]
+        All rows (Box name, Slot Number, Pokemon ID).
     """
     with open(path, "w", newline="", encoding="utf-8") as f:
         writer = csv.writer(f)
@@ -202,7 +1041,7 @@ def _emptybox(name: str) -> dict:
       "pokemon": [None for i in range(30)]
     }
 
-def export_json(path: Path, data: List[Tuple[str, str, str]]):
+def export_json(path: Path, data: Iterable[Tuple[str, str, str]]):
     """
     Export the data to a csv file.
 
@@ -210,8 +1049,8 @@ def export_json(path: Path, data: List[Tuple[str, str, str]]):
     ----------
     path : Path
         Path to the json file.
-    data : List[Tuple[str, str, str]
-        List of all rows (Box name, Slot Number, Pokemon ID).
+    data : Iterable[Tuple[str, str, str]
+        All rows (Box name, Slot Number, Pokemon ID).
     """
 
     json_data = {
@@ -244,7 +1083,116 @@ def export_json(path: Path, data: List[Tuple[str, str, str]]):
         json.dump(json_data, f, indent=4)
 
 
-def match(path: str) -> int:
+def _export(project_path: Path, data: Iterable[Tuple[str, str, str]]):
+    """
+    Write the results to the csv and json files of the project.
+
+    Parameters
+    ----------
+    project_path : Path
+        Path to the project folder.
+    data : Iterable[Tuple[str, str, str]]
+        All rows (Box name, Slot Number, Pokemon ID). It is iterated twice.
+    """
+
+    # Write the data to a csv file
+    csv_file = project_path / "match.csv"
+    export_csv(csv_file, CSV_HEADER, data)
+
+    # Write the data to a json file
+    json_file = project_path / "match.json"
+    export_json(json_file, data)
+
+
+def _match_to_store(
+    project_path: Path,
+    sqlite: str,
+    metrics: Metrics,
+    matcher: Optional[Matcher] = None,
+    **kwargs,
+) -> int:
+    """
+    Match all boxes of a project storing the results of each box in a SQLite
+    database as soon as it is matched, then export the csv and json files
+    from the database.
+
+    Parameters
+    ----------
+    project_path : Path
+        Path to the project folder.
+    sqlite : str
+        Path to the SQLite database.
+    metrics : Metrics
+        Collector of the counters and timers of the stage.
+    matcher : Optional[Matcher], optional
+        Matcher already loaded, by default None
+    **kwargs
+        Search settings forwarded to _match_boxes.
+
+    Returns
+    -------
+    int
+        Total number of pokemon found.
+    """
+
+    store = ResultStore(sqlite)
+    try:
+        settings = json.dumps(kwargs, sort_keys=True)
+        run_id = store.start_run(str(project_path.absolute()), settings)
+
+        boxes = _match_boxes(
+            project_path / "boxes",
+            project_path / MANIFEST_FILE,
+            metrics=metrics,
+            matcher=matcher,
+            **kwargs,
+        )
+        for folder, rows in boxes:
+            store.add_box(run_id, folder, rows)
+        store.finish_run(run_id)
+
+        # Export the results streaming them from the database
+        with metrics.timer("match.export"):
+            export_csv(project_path / "match.csv", CSV_HEADER, store.rows(run_id))
+            export_json(project_path / "match.json", store.rows(run_id))
+        return store.count(run_id)
+    finally:
+        store.close()
+
+
+def _count_written(project_path: Path, metrics: Metrics):
+    """
+    Count the bytes of the files written by the match stage.
+
+    Parameters
+    ----------
+    project_path : Path
+        Path to the project folder.
+    metrics : Metrics
+        Collector of the counters and timers of the stage.
+    """
+
+    for name in ("match.csv", "match.json", MANIFEST_FILE):
+        path = project_path / name
+        if path.exists():
+            metrics.count("match.bytes_written", path.stat().st_size)
+
+
+def match(
+    path: str,
+    force: bool = False,
+    threshold: Optional[float] = None,
+    margin: float = DEFAULT_MATCH_MARGIN,
+    priors: Optional[List[str]] = None,
+    shortlist: Optional[int] = None,
+    sqlite: Optional[str] = None,
+    scorer: str = DEFAULT_SCORER,
+    jobs: int = 1,
+    metrics: Optional[Metrics] = None,
+    matcher: Optional[Matcher] = None,
+    max_memory: Optional[int] = None,
+    scope: Optional[List[str]] = None,
+) -> int:
     """
     Iterate over all boxes and estimates the id of the more likely Pokemon
 
@@ -252,6 +1200,51 @@ def match(path: str) -> int:
     ----------
     path : str
         Path to the folder that contains the 'boxes' subfolder with the images.
+    force : bool, optional
+        Match every box again ignoring the results cached in the project
+        manifest, by default False
+    threshold : Optional[float], optional
+        Likelihood above which the search of a slot stops early, comparing
+        the most likely templates first, by default None (compare every
+        template).
+    margin : float, optional
+        Minimum likelihood gap with the runner-up to stop early, by default
+        DEFAULT_MATCH_MARGIN
+    priors : Optional[List[str]], optional
+        Paths to 'match.json' files of previous dumps used to sort the
+        templates, by default None
+    shortlist : Optional[int], optional
+        Number of species whose forms are compared after a first match
+        against one representative per species, by default None (compare
+        every template). It can't be combined with `threshold`.
+    sqlite : Optional[str], optional
+        Path to a SQLite database where the results are stored as each box is
+        matched, by default None (keep the results in memory).
+    scorer : str, optional
+        Name of the scorer used to compare the thumbnails with the templates,
+        one of 'ssim', 'ncc' (matrix product of normalized images),
+        'ncc-int8' (same with templates quantized to int8) or 'masked' (only
+        the foreground pixels of each template), by default DEFAULT_SCORER
+    jobs : int, optional
+        Number of processes matching boxes in parallel, by default 1
+    metrics : Optional[Metrics], optional
+        Collector of the counters and timers of the stage, by default None
+    matcher : Optional[Matcher], optional
+        Matcher already loaded with the same settings, shared by several
+        projects, by default None (load the templates if needed). The matches
+        cached in the project manifest are not used to sort its templates.
+    max_memory : Optional[int], optional
+        Memory budget of the pipeline in bytes, by default None (unbounded).
+        The template matrix is memory mapped if it doesn't fit, fewer boxes
+        are read ahead and, without `sqlite`, the results are kept in a
+        temporary database in the project folder instead of in memory.
+    scope : Optional[List[str]], optional
+        Pokemon names, template ids or paths to 'match.json' files of
+        previous dumps or text files with one name per line. Only the
+        templates of their species (every form) and the empty slot are
+        compared, packed into a single file of the cache the first time, by
+        default None (every template). A shared `matcher` must have been
+        created with the same scope.
 
     Returns
     -------
@@ -268,17 +1261,65 @@ def match(path: str) -> int:
         # Check if the input folder exists and is a valid project folder
         if boxes_path.exists() and boxes_path.is_dir():       
 
-            # match the data
-            data = _match(boxes_path)
-
-            # Write the data to a csv file
-            header = ("Box name", "Slot Number", "Pokemon ID")
-            csv_file = project_path / "match.csv"
-            export_csv(csv_file, header, data)
+            # Discard previous results if the user asks for it
+            manifest_path = project_path / MANIFEST_FILE
+            if force and manifest_path.exists():
+                manifest_path.unlink()
+
+            if metrics is None:
+                metrics = Metrics()
+
+            # Spill the results to disk under a memory budget
+            spill_path = None
+            if sqlite is None and max_memory is not None:
+                spill_path = project_path / SPILL_FILE
+                if spill_path.exists():
+                    spill_path.unlink()
+                sqlite = str(spill_path)
+
+            # Store the results in a database while they are matched
+            if sqlite is not None:
+                try:
+                    with metrics.timer("match.total"):
+                        count = _match_to_store(
+                            project_path,
+                            sqlite,
+                            metrics,
+                            matcher,
+                            threshold=threshold,
+                            margin=margin,
+                            priors=priors,
+                            shortlist=shortlist,
+                            scorer=scorer,
+                            jobs=jobs,
+                            max_memory=max_memory,
+                            scope=scope,
+                        )
+                finally:
+                    if spill_path is not None and spill_path.exists():
+                        spill_path.unlink()
+                _count_written(project_path, metrics)
+                return count
 
-            # Write the data to a json file
-            json_file = project_path / "match.json"
-            export_json(json_file, data)
+            # match the data
+            with metrics.timer("match.total"):
+                data = _match(
+                    boxes_path,
+                    manifest_path,
+                    threshold,
+                    margin,
+                    priors,
+                    shortlist,
+                    scorer,
+                    jobs,
+                    metrics,
+                    matcher,
+                    max_memory,
+                    scope,
+                )
+                with metrics.timer("match.export"):
+                    _export(project_path, data)
+            _count_written(project_path, metrics)
 
             return len(data)
         else:
@@ -0,0 +1,87 @@
+import re
+from pathlib import Path
+from typing import Optional
+
+from homedumper.const import MEMORY_SHARES
+
+SIZE_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+def parse_size(text: str) -> int:
+    """
+    Parse a memory size like '512M' or '2G'.
+
+    Parameters
+    ----------
+    text : str
+        Number of bytes, optionally followed by K, M or G.
+
+    Returns
+    -------
+    int
+        Number of bytes.
+
+    Raises
+    ------
+    ValueError
+        When the text is not a valid size.
+    """
+
+    found = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?)B?\s*", text.upper())
+    if found is None:
+        raise ValueError(f"Invalid memory size '{text}', expected e.g. 512M or 2G")
+    return int(float(found.group(1)) * SIZE_UNITS[found.group(2)])
+
+
+def budget_share(max_memory: Optional[int], stage: str) -> Optional[int]:
+    """
+    Get the part of the memory budget available to a stage.
+
+    Parameters
+    ----------
+    max_memory : Optional[int]
+        Memory budget of the whole pipeline in bytes, None if unbounded.
+    stage : str
+        One of the keys of MEMORY_SHARES.
+
+    Returns
+    -------
+    Optional[int]
+        Bytes available to the stage, None if unbounded.
+    """
+
+    if max_memory is None:
+        return None
+    return int(max_memory * MEMORY_SHARES[stage])
+
+
+def peak_rss() -> int:
+    """
+    Get the peak resident memory of this process or of the largest of its
+    finished children.
+
+    Returns
+    -------
+    int
+        Peak RSS in bytes, 0 if it can't be measured on this platform.
+    """
+
+    # resource only exists on Unix, use psutil elsewhere if it is installed
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return 0
+        return getattr(psutil.Process().memory_info(), "peak_wset", 0)
+
+    # ru_maxrss also counts the parent before exec, prefer /proc if available
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    status = Path("/proc/self/status")
+    if status.exists():
+        for line in status.read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                own = int(line.split()[1])
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) * 1024
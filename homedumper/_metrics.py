@@ -0,0 +1,130 @@
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+
+class Metrics:
+    """
+    Class for collecting counters and timers of the stages of the pipeline.
+
+    Names are prefixed with the stage they belong to, e.g.
+    'extract.frames_decoded' or 'match.scoring'. Metrics collected in worker
+    processes are sent back to the parent and merged.
+    """
+
+    # Averages reported, as the counters they divide
+    averages: Dict[str, Tuple[str, str]] = {
+        "match.comparisons_per_slot": ("match.comparisons", "match.slots_matched"),
+    }
+
+    def __init__(self):
+
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.timers: Dict[str, float] = defaultdict(float)
+
+    def count(self, name: str, value: int = 1):
+        """
+        Increase a counter.
+
+        Parameters
+        ----------
+        name : str
+            Name of the counter.
+        value : int, optional
+            Amount added to the counter, by default 1
+        """
+
+        self.counters[name] += value
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """
+        Add the time spent inside the context to a timer.
+
+        Parameters
+        ----------
+        name : str
+            Name of the timer.
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timers[name] += time.perf_counter() - start
+
+    def merge(self, other: "Metrics"):
+        """
+        Add the counters and timers of other metrics to these ones.
+
+        Parameters
+        ----------
+        other : Metrics
+            Metrics to add, e.g. collected in a worker process.
+        """
+
+        for name, value in other.counters.items():
+            self.counters[name] += value
+        for name, seconds in other.timers.items():
+            self.timers[name] += seconds
+
+    def average(self, name: str) -> Optional[float]:
+        """
+        Get one of the averages derived from the counters.
+
+        Parameters
+        ----------
+        name : str
+            Name of the average, e.g. 'match.comparisons_per_slot'.
+
+        Returns
+        -------
+        Optional[float]
+            The average, None if nothing was counted.
+        """
+
+        total, count = self.averages[name]
+        if not self.counters.get(count):
+            return None
+        return self.counters.get(total, 0) / self.counters[count]
+
+    def report(self) -> dict:
+        """
+        Group the metrics by stage.
+
+        Returns
+        -------
+        dict
+            Counters, averages and seconds spent of each stage, by stage
+            name.
+        """
+
+        stages: Dict[str, dict] = defaultdict(lambda: {"counters": {}, "seconds": {}})
+        for name, value in sorted(self.counters.items()):
+            stage, _, key = name.partition(".")
+            stages[stage]["counters"][key] = value
+        for name in self.averages:
+            average = self.average(name)
+            if average is not None:
+                stage, _, key = name.partition(".")
+                stages[stage].setdefault("averages", {})[key] = round(average, 3)
+        for name, seconds in sorted(self.timers.items()):
+            stage, _, key = name.partition(".")
+            stages[stage]["seconds"][key] = round(seconds, 6)
+        return dict(stages)
+
+    def save(self, path: Path):
+        """
+        Write the report of the metrics as JSON.
+
+        Parameters
+        ----------
+        path : Path
+            Path to the report file.
+        """
+
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=4)
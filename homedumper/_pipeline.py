@@ -0,0 +1,733 @@
+import logging
+import pathlib
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import cv2
+import numpy.typing as npt
+
+from homedumper.const import (
+    DEDUP_MIN_PIXELS,
+    DEDUP_THRESHOLD,
+    DEFAULT_MATCH_MARGIN,
+    DEFAULT_OUT,
+    DEFAULT_SCORER,
+    PIPELINE_QUEUE_SIZE,
+    STABLE_THRESHOLD,
+)
+from homedumper._boxify import boxify_frame
+from homedumper._download import download
+from homedumper._extract import FrameExtractor, frame_name
+from homedumper._loader import LoadedBox, load_box
+from homedumper._match import (
+    MANIFEST_FILE,
+    Matcher,
+    _create_matcher,
+    _export,
+    _load_manifest,
+    _manifest_version,
+    _match_box,
+    _save_manifest,
+)
+from homedumper._metrics import Metrics
+from homedumper._ring import FrameRing
+from homedumper._runtime import process_pool
+
+# Marks the end of the items of a queue
+_DONE = object()
+
+# Frames, matcher and cached results of each worker process
+_worker_ring: Optional[FrameRing] = None
+_worker_matcher: Optional[Matcher] = None
+_worker_cached: Dict[str, dict] = {}
+
+
+class _Stopped(Exception):
+    """
+    Raised in a stage when another one failed and the pipeline is stopping.
+    """
+
+
+def _put(items: queue.Queue, item: Any, stop: threading.Event):
+    """
+    Put an item in a bounded queue, waiting for a free place unless the
+    pipeline stops.
+
+    Parameters
+    ----------
+    items : queue.Queue
+        The queue.
+    item : Any
+        The item.
+    stop : threading.Event
+        Set when the pipeline stops.
+
+    Raises
+    ------
+    _Stopped
+        When the pipeline stops while waiting.
+    """
+
+    while True:
+        if stop.is_set():
+            raise _Stopped
+        try:
+            items.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def _close(items: queue.Queue, stop: threading.Event):
+    """
+    Put the end mark in a queue, unless the pipeline stops.
+
+    Parameters
+    ----------
+    items : queue.Queue
+        The queue.
+    stop : threading.Event
+        Set when the pipeline stops.
+    """
+
+    try:
+        _put(items, _DONE, stop)
+    except _Stopped:
+        pass
+
+
+def _get(items: queue.Queue, stop: threading.Event) -> Iterator[Any]:
+    """
+    Iterate over the items of a queue until the end mark.
+
+    Parameters
+    ----------
+    items : queue.Queue
+        The queue.
+    stop : threading.Event
+        Set when the pipeline stops.
+
+    Yields
+    ------
+    Any
+        The items in order.
+
+    Raises
+    ------
+    _Stopped
+        When the pipeline stops while waiting.
+    """
+
+    while True:
+        if stop.is_set():
+            raise _Stopped
+        try:
+            item = items.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        yield item
+
+
+def _write_slot(ring: FrameRing, frame: npt.NDArray, stop: threading.Event) -> int:
+    """
+    Copy a frame into the ring, waiting for a free slot unless the pipeline
+    stops.
+
+    Parameters
+    ----------
+    ring : FrameRing
+        Ring shared with the worker processes.
+    frame : npt.NDArray
+        The frame.
+    stop : threading.Event
+        Set when the pipeline stops.
+
+    Returns
+    -------
+    int
+        Index of the slot.
+
+    Raises
+    ------
+    _Stopped
+        When the pipeline stops while waiting.
+    """
+
+    while True:
+        if stop.is_set():
+            raise _Stopped
+        try:
+            return ring.write(frame, timeout=0.1)
+        except TimeoutError:
+            continue
+
+
+def _extract_stage(
+    extractor: FrameExtractor,
+    frames: queue.Queue,
+    stop: threading.Event,
+    metrics: Metrics,
+    ring: Optional[FrameRing] = None,
+) -> int:
+    """
+    Decode the video and queue the new frames as soon as they are written.
+
+    Parameters
+    ----------
+    extractor : FrameExtractor
+        Extractor of the video.
+    frames : queue.Queue
+        Queue of (name, frame) of the frames written, or of (name, slot)
+        with a ring.
+    stop : threading.Event
+        Set when the pipeline stops.
+    metrics : Metrics
+        Collector of the counters and timers of the stages.
+    ring : Optional[FrameRing], optional
+        Ring where the frames are copied for the worker processes, by
+        default None (queue the frames themselves)
+
+    Returns
+    -------
+    int
+        Number of frames extracted.
+    """
+
+    cap = cv2.VideoCapture(str(extractor.video_path))
+    try:
+        with metrics.timer("extract.total"):
+            while True:
+                with metrics.timer("extract.decode"):
+                    ret, frame = cap.read()
+                if not ret:
+                    break
+                metrics.count("extract.frames_decoded")
+
+                # Pass the frame on if it is a new box
+                name = pathlib.Path(frame_name(extractor.frame_count - 1)).stem
+                if extractor.process_frame(frame, extractor.output_path):
+                    if ring is None:
+                        _put(frames, (name, frame), stop)
+                    else:
+                        _put(frames, (name, _write_slot(ring, frame, stop)), stop)
+    finally:
+        cap.release()
+        _close(frames, stop)
+
+    return extractor.frame_count - 1
+
+
+def _boxify_stage(
+    frames: queue.Queue,
+    boxes: queue.Queue,
+    boxes_path: pathlib.Path,
+    stop: threading.Event,
+    metrics: Metrics,
+) -> int:
+    """
+    Convert the frames into box folders as soon as they are extracted.
+
+    Parameters
+    ----------
+    frames : queue.Queue
+        Queue of (name, frame) of the frames written.
+    boxes : queue.Queue
+        Queue of the paths to the box folders written.
+    boxes_path : pathlib.Path
+        Path to the 'boxes' folder of the project.
+    stop : threading.Event
+        Set when the pipeline stops.
+    metrics : Metrics
+        Collector of the counters and timers of the stages.
+
+    Returns
+    -------
+    int
+        Number of frames converted to box.
+    """
+
+    count = 0
+    try:
+        for name, frame in _get(frames, stop):
+            with metrics.timer("boxify.total"):
+                box_path = boxify_frame(frame, name, boxes_path, metrics, int(name))
+            _put(boxes, box_path, stop)
+            count += 1
+    finally:
+        _close(boxes, stop)
+
+    return count
+
+
+def _prepare_matcher(
+    verify: bool,
+    cached_path: pathlib.Path,
+    settings: dict,
+    max_memory: Optional[int],
+    metrics: Metrics,
+) -> tuple:
+    """
+    Validate the cache and load the templates while the video is decoded.
+
+    Parameters
+    ----------
+    verify : bool
+        Check the content of every cached template.
+    cached_path : pathlib.Path
+        Path to the manifest of the project.
+    settings : dict
+        Search settings (threshold, margin, priors, shortlist, scorer and
+        scope).
+    max_memory : Optional[int]
+        Memory budget of the pipeline in bytes.
+    metrics : Metrics
+        Collector of the counters and timers of the stages.
+
+    Returns
+    -------
+    tuple
+        The matcher, the manifest version and the cached box results.
+    """
+
+    with metrics.timer("download.total"):
+        download(verify=verify)
+
+    # Results of a previous run with the same templates and settings
+    version = _manifest_version(
+        settings["threshold"],
+        settings["margin"],
+        settings["shortlist"],
+        settings["scorer"],
+        settings["scope"],
+        settings["priors"],
+    )
+    cached = _load_manifest(cached_path, version)
+
+    with metrics.timer("match.load_templates"):
+        matcher = _create_matcher(
+            cached,
+            settings["priors"] or [],
+            settings["threshold"],
+            settings["margin"],
+            settings["shortlist"],
+            settings["scorer"],
+            max_memory,
+            settings["scope"],
+        )
+    return matcher, version, cached
+
+
+def _match_cached(
+    box: LoadedBox, matcher: Matcher, cached: Dict[str, dict], metrics: Metrics
+) -> List[tuple]:
+    """
+    Match a box, reusing the results of a previous run if it didn't change.
+
+    Parameters
+    ----------
+    box : LoadedBox
+        The box.
+    matcher : Matcher
+        The matcher.
+    cached : Dict[str, dict]
+        Entries of the project manifest with the results of previous runs.
+    metrics : Metrics
+        Collector of the counters and timers of the stages.
+
+    Returns
+    -------
+    List[tuple]
+        Rows of the box.
+    """
+
+    entry = cached.get(box.folder)
+    if entry is not None and entry["hash"] == box.hash:
+        metrics.count("match.cache_hits")
+        return [tuple(row) for row in entry["matches"]]
+
+    with metrics.timer("match.total"):
+        rows, _ = _match_box(box, matcher, metrics)
+    return rows
+
+
+def _run_threads(
+    extractor: FrameExtractor,
+    manifest_path: pathlib.Path,
+    settings: dict,
+    verify: bool,
+    max_memory: Optional[int],
+    jobs: int,
+    metrics: Metrics,
+) -> Tuple[Dict[str, dict], int, str]:
+    """
+    Run the stages in threads of this process, matching in this thread.
+
+    Parameters
+    ----------
+    extractor : FrameExtractor
+        Extractor of the video.
+    manifest_path : pathlib.Path
+        Path to the manifest of the project.
+    settings : dict
+        Search settings (threshold, margin, priors, shortlist, scorer and
+        scope).
+    verify : bool
+        Check the content of every cached template.
+    max_memory : Optional[int]
+        Memory budget of the pipeline in bytes.
+    jobs : int
+        Unused, there is a single matching thread.
+    metrics : Metrics
+        Collector of the counters and timers of the stages.
+
+    Returns
+    -------
+    Tuple[Dict[str, dict], int, str]
+        Manifest entries of the boxes in order, the number of frames
+        extracted and the manifest version.
+    """
+
+    boxes_path = manifest_path.parent / "boxes"
+    frames: queue.Queue = queue.Queue(PIPELINE_QUEUE_SIZE)
+    boxes: queue.Queue = queue.Queue(PIPELINE_QUEUE_SIZE)
+    stop = threading.Event()
+    entries = {}
+
+    with ThreadPoolExecutor(3) as pool:
+        prepared: Future = pool.submit(
+            _prepare_matcher, verify, manifest_path, settings, max_memory, metrics
+        )
+        extracted = pool.submit(_extract_stage, extractor, frames, stop, metrics)
+        boxified = pool.submit(_boxify_stage, frames, boxes, boxes_path, stop, metrics)
+
+        try:
+            for box_path in _get(boxes, stop):
+                box = load_box(box_path)
+
+                # Wait for the templates before the first box
+                matcher, _, cached = prepared.result()
+                rows = _match_cached(box, matcher, cached, metrics)
+                entries[box.folder] = {"hash": box.hash, "matches": rows}
+
+            # Raise the errors of the other stages, the later ones first
+            # since the earlier ones wait for them
+            boxified.result()
+            frame_count = extracted.result()
+            _, version, _ = prepared.result()
+
+        except BaseException:
+            stop.set()
+            raise
+
+    return entries, frame_count, version
+
+
+def _frame_shape(video_path: pathlib.Path) -> Optional[Tuple[int, ...]]:
+    """
+    Get the shape of the frames of a video by decoding the first one, since
+    the size reported by some backends is missing or, e.g. for rotated
+    videos, wrong.
+
+    Parameters
+    ----------
+    video_path : pathlib.Path
+        Path to the video.
+
+    Returns
+    -------
+    Optional[Tuple[int, ...]]
+        Shape of the first frame, None if no frame can be decoded.
+    """
+
+    cap = cv2.VideoCapture(str(video_path))
+    try:
+        ret, frame = cap.read()
+    finally:
+        cap.release()
+    return frame.shape if ret else None
+
+
+def _init_ring_worker(ring: FrameRing, matcher: Matcher, cached: Dict[str, dict]):
+    """
+    Keep the ring, the matcher and the cached results in a worker process.
+
+    Parameters
+    ----------
+    ring : FrameRing
+        Ring with the frames written by the parent process.
+    matcher : Matcher
+        The matcher, inherited without copying it when processes are forked.
+    cached : Dict[str, dict]
+        Entries of the project manifest with the results of previous runs.
+    """
+
+    global _worker_ring, _worker_matcher, _worker_cached
+    _worker_ring = ring
+    _worker_matcher = matcher
+    _worker_cached = cached
+
+
+def _box_worker(
+    index: int, name: str, boxes_path: pathlib.Path
+) -> Tuple[str, str, List[tuple], Metrics]:
+    """
+    Boxify the frame of a ring slot and match the box in a worker process.
+
+    Parameters
+    ----------
+    index : int
+        Index of the slot of the frame.
+    name : str
+        Name of the box folder.
+    boxes_path : pathlib.Path
+        Path to the 'boxes' folder of the project.
+
+    Returns
+    -------
+    Tuple[str, str, List[tuple], Metrics]
+        Name and hash of the box folder, its rows and the metrics collected.
+    """
+
+    ring, matcher = _worker_ring, _worker_matcher
+    if ring is None or matcher is None:
+        raise RuntimeError("The worker process was not initialized")
+    metrics = Metrics()
+
+    # Release the slot as soon as the thumbnails are written, numbering the
+    # default box titles after the frames
+    try:
+        with metrics.timer("boxify.total"):
+            box_path = boxify_frame(
+                ring.view(index), name, boxes_path, metrics, int(name)
+            )
+    finally:
+        ring.release(index)
+
+    box = load_box(box_path)
+    rows = _match_cached(box, matcher, _worker_cached, metrics)
+    return box.folder, box.hash, rows, metrics
+
+
+def _run_workers(
+    extractor: FrameExtractor,
+    manifest_path: pathlib.Path,
+    settings: dict,
+    verify: bool,
+    max_memory: Optional[int],
+    jobs: int,
+    metrics: Metrics,
+) -> Tuple[Dict[str, dict], int, str]:
+    """
+    Decode the video in a thread of this process and boxify and match the
+    frames in worker processes, which read them from a shared FrameRing.
+
+    Parameters
+    ----------
+    extractor : FrameExtractor
+        Extractor of the video.
+    manifest_path : pathlib.Path
+        Path to the manifest of the project.
+    settings : dict
+        Search settings (threshold, margin, priors, shortlist, scorer and
+        scope).
+    verify : bool
+        Check the content of every cached template.
+    max_memory : Optional[int]
+        Memory budget of the pipeline in bytes.
+    jobs : int
+        Number of worker processes.
+    metrics : Metrics
+        Collector of the counters and timers of the stages.
+
+    Returns
+    -------
+    Tuple[Dict[str, dict], int, str]
+        Manifest entries of the boxes in order, the number of frames
+        extracted and the manifest version.
+    """
+
+    boxes_path = manifest_path.parent / "boxes"
+    frames: queue.Queue = queue.Queue(PIPELINE_QUEUE_SIZE)
+    stop = threading.Event()
+    entries = {}
+
+    def collect(future: Future):
+        folder, hash, rows, worker_metrics = future.result()
+        metrics.merge(worker_metrics)
+        entries[folder] = {"hash": hash, "matches": rows}
+
+    # Size the slots after the decoded frames, without frames there is
+    # nothing to share with the workers
+    shape = _frame_shape(extractor.video_path)
+    if shape is None:
+        return _run_threads(
+            extractor, manifest_path, settings, verify, max_memory, jobs, metrics
+        )
+
+    # Load the templates before forking the workers that share them. The
+    # decoding waits for them, since forking while it runs in a thread could
+    # leave its locks held in the workers
+    matcher, version, cached = _prepare_matcher(
+        verify, manifest_path, settings, max_memory, metrics
+    )
+
+    ring = FrameRing(shape)
+    pool = process_pool(jobs, _init_ring_worker, (ring, matcher, cached))
+    try:
+        # Fork the workers before starting the decoding thread
+        pool.submit(int).result()
+
+        with ThreadPoolExecutor(1) as threads:
+            extracted = threads.submit(
+                _extract_stage, extractor, frames, stop, metrics, ring
+            )
+            try:
+                # Collect the boxes in order, bounding the ones in flight
+                pending: deque = deque()
+                for name, index in _get(frames, stop):
+                    pending.append(pool.submit(_box_worker, index, name, boxes_path))
+                    while pending and (len(pending) > 2 * jobs or pending[0].done()):
+                        collect(pending.popleft())
+                while pending:
+                    collect(pending.popleft())
+
+                frame_count = extracted.result()
+
+            except BaseException:
+                stop.set()
+                raise
+    finally:
+        pool.shutdown(cancel_futures=True)
+        ring.close()
+
+    return entries, frame_count, version
+
+
+def dump(
+    video_path: str,
+    output_path: str = DEFAULT_OUT,
+    verify: bool = False,
+    threshold: Optional[float] = None,
+    margin: float = DEFAULT_MATCH_MARGIN,
+    priors: Optional[List[str]] = None,
+    shortlist: Optional[int] = None,
+    scorer: str = DEFAULT_SCORER,
+    stable_threshold: int = STABLE_THRESHOLD,
+    dedup_threshold: int = DEDUP_THRESHOLD,
+    dedup_pixels: int = DEDUP_MIN_PIXELS,
+    max_memory: Optional[int] = None,
+    jobs: int = 1,
+    metrics: Optional[Metrics] = None,
+    scope: Optional[List[str]] = None,
+) -> dict:
+    """
+    Run every stage of the pipeline on a video at once. Each new frame is
+    boxified and matched while the rest of the video is being decoded, with
+    bounded queues of PIPELINE_QUEUE_SIZE items between the stages, and the
+    templates are validated and loaded in the meantime. The project folder
+    ends up like after running extract, boxify and match one after another.
+
+    Parameters
+    ----------
+    video_path : str
+        Path to the video.
+    output_path : str, optional
+        Path to the output folder, by default DEFAULT_OUT
+    verify : bool, optional
+        Check the content of every cached template, by default False
+    threshold : Optional[float], optional
+        Likelihood above which the search of a slot stops early, by default
+        None (compare every template).
+    margin : float, optional
+        Minimum likelihood gap with the runner-up to stop early, by default
+        DEFAULT_MATCH_MARGIN
+    priors : Optional[List[str]], optional
+        Paths to 'match.json' files of previous dumps used to sort the
+        templates, by default None
+    shortlist : Optional[int], optional
+        Number of species whose forms are compared, by default None (compare
+        every template).
+    scorer : str, optional
+        Name of the scorer, by default DEFAULT_SCORER
+    stable_threshold : int, optional
+        Max difference of the L/R indicators with their resting color, by
+        default STABLE_THRESHOLD
+    dedup_threshold : int, optional
+        Min gray level difference of a changed pixel, by default
+        DEDUP_THRESHOLD
+    dedup_pixels : int, optional
+        Min changed pixels for a frame not to be a duplicate, by default
+        DEDUP_MIN_PIXELS
+    max_memory : Optional[int], optional
+        Memory budget of the pipeline in bytes, by default None (unbounded).
+        The results of every box are kept until the end, to write the
+        manifest.
+    jobs : int, optional
+        Number of worker processes that boxify and match the frames, by
+        default 1 (threads of this process). With more than one, the
+        frames are passed to the workers through a FrameRing and the video is
+        decoded only after the templates are downloaded and loaded, since
+        the workers can't be forked safely while a thread is running.
+    metrics : Optional[Metrics], optional
+        Collector of the counters and timers of the stages, by default None
+    scope : Optional[List[str]], optional
+        Pokemon names, template ids or paths to files with them restricting
+        the templates to their species, by default None (every template)
+
+    Returns
+    -------
+    dict
+        Path to the 'project' folder and number of 'frames', 'boxes' and
+        'pokemon' found.
+    """
+
+    if metrics is None:
+        metrics = Metrics()
+
+    try:
+        extractor = FrameExtractor(
+            video_path,
+            output_path,
+            metrics,
+            stable_threshold,
+            dedup_threshold,
+            dedup_pixels,
+            max_memory,
+        )
+    except ValueError:
+        return {"project": None, "frames": 0, "boxes": 0, "pokemon": 0}
+
+    project_path = extractor.output_path.parent
+    (project_path / "boxes").mkdir(parents=True, exist_ok=True)
+    manifest_path = project_path / MANIFEST_FILE
+    settings = {
+        "threshold": threshold,
+        "margin": margin,
+        "priors": priors,
+        "shortlist": shortlist,
+        "scorer": scorer,
+        "scope": scope,
+    }
+
+    # Match the boxes in this process or in worker processes
+    run = _run_threads if jobs <= 1 else _run_workers
+    entries, frame_count, version = run(
+        extractor, manifest_path, settings, verify, max_memory, jobs, metrics
+    )
+    rows = [row for entry in entries.values() for row in entry["matches"]]
+
+    with metrics.timer("match.export"):
+        _export(project_path, [row[:3] for row in rows])
+    _save_manifest(manifest_path, version, entries)
+    logging.info(f"{len(rows)} pokemon found in {project_path}")
+
+    return {
+        "project": str(project_path),
+        "frames": frame_count,
+        "boxes": len(entries),
+        "pokemon": len(rows),
+    }
@@ -0,0 +1,194 @@
+import hashlib
+import json
+import logging
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from homedumper.const import BOX_COLUMNS, EMPTY_TEMPLATE
+
+
+def dex_number(id: str) -> Optional[int]:
+    """
+    Get the national dex number encoded in a template id.
+
+    Parameters
+    ----------
+    id : str
+        Name of the template file (e.g. '0025' or '0025-f').
+
+    Returns
+    -------
+    Optional[int]
+        National dex number of the pokemon, None if the id doesn't start with
+        one.
+    """
+
+    digits = id.split("-")[0]
+    return int(digits) if digits.isdigit() else None
+
+
+def count_previous_dumps(paths: Iterable[str], name2id: Dict[str, str]) -> Counter:
+    """
+    Count how often each template was found in previous dumps.
+
+    Parameters
+    ----------
+    paths : Iterable[str]
+        Paths to 'match.json' files generated by previous dumps.
+    name2id : Dict[str, str]
+        Dictionary to map pokemon names to template ids.
+
+    Returns
+    -------
+    Counter
+        Number of occurrences of each template id.
+    """
+
+    names = []
+
+    for path in paths:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                boxes = json.load(f)["boxes"]
+        except (OSError, ValueError, KeyError):
+            logging.warning(f"Ignoring unreadable previous dump {path}")
+            continue
+
+        for box in boxes:
+            names += box["pokemon"]
+
+    return count_names(names, name2id)
+
+
+def priors_version(paths: Iterable[str]) -> str:
+    """
+    Get a version string identifying the content of previous dumps used as
+    priors.
+
+    Parameters
+    ----------
+    paths : Iterable[str]
+        Paths to 'match.json' files generated by previous dumps.
+
+    Returns
+    -------
+    str
+        Hexadecimal digest of the files, the unreadable ones are ignored as
+        when they are counted.
+    """
+
+    digest = hashlib.sha1()
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        except OSError:
+            continue
+    return digest.hexdigest()[:16]
+
+
+def count_names(names: Iterable[Optional[str]], name2id: Dict[str, str]) -> Counter:
+    """
+    Count the template ids corresponding to a sequence of pokemon names.
+
+    Parameters
+    ----------
+    names : Iterable[Optional[str]]
+        Pokemon names, None for empty slots.
+    name2id : Dict[str, str]
+        Dictionary to map pokemon names to template ids.
+
+    Returns
+    -------
+    Counter
+        Number of occurrences of each template id.
+    """
+
+    frequencies: Counter = Counter()
+    for name in names:
+        if name is None:
+            frequencies[EMPTY_TEMPLATE] += 1
+        elif name in name2id:
+            frequencies[name2id[name]] += 1
+    return frequencies
+
+
+class SearchOrder:
+    """
+    Class for sorting the templates by their prior likelihood of matching a
+    slot, so the most probable ones are compared first.
+    """
+
+    def __init__(self, ids: Iterable[str], frequencies: Optional[Counter] = None):
+
+        frequencies = frequencies or Counter()
+        ids = sorted(ids)
+
+        # Templates sorted by frequency in previous dumps, then by dex order
+        self.base = sorted(ids, key=lambda id: -frequencies[id])
+
+        # Templates grouped by national dex number
+        self.by_dex: Dict[int, List[str]] = defaultdict(list)
+        for id in ids:
+            dex = dex_number(id)
+            if dex is not None:
+                self.by_dex[dex].append(id)
+
+    def order(self, neighbours: Iterable[Tuple[str, int]]) -> List[str]:
+        """
+        Sort the templates for a slot given the matches of its neighbours.
+        HOME boxes are often sorted by national dex number, so the species
+        that follow the neighbours in the dex are tried first.
+
+        Parameters
+        ----------
+        neighbours : Iterable[Tuple[str, int]]
+            Template ids already matched in the same box, along with their
+            distance in slots to the current one (1 for the slot on the left,
+            BOX_COLUMNS for the slot above).
+
+        Returns
+        -------
+        List[str]
+            All the template ids, the most likely ones first.
+        """
+
+        first = []
+        for id, distance in neighbours:
+            dex = dex_number(id)
+            if dex is None or id == EMPTY_TEMPLATE:
+                continue
+
+            # Expected species if the box is sorted, its neighbours and
+            # the other forms of the neighbouring species
+            expected = dex + distance
+            for candidate in (expected, expected + 1, expected - 1, dex):
+                first += self.by_dex.get(candidate, [])
+
+        # Remove duplicates keeping the order
+        return list(dict.fromkeys(first + self.base))
+
+
+def slot_neighbours(slot: int, found: Dict[int, str]) -> List[Tuple[str, int]]:
+    """
+    Get the templates matched in the slots next to a given one.
+
+    Parameters
+    ----------
+    slot : int
+        Zero-based index of the slot in the box.
+    found : Dict[int, str]
+        Template ids already matched in the box by slot index.
+
+    Returns
+    -------
+    List[Tuple[str, int]]
+        Template ids of the slots on the left and above, along with their
+        distance in slots.
+    """
+
+    neighbours = []
+    for distance in (1, BOX_COLUMNS):
+        if slot - distance in found:
+            neighbours.append((found[slot - distance], distance))
+    return neighbours
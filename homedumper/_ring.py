@@ -0,0 +1,189 @@
+import multiprocessing
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional, Tuple
+import numpy as np
+import numpy.typing as npt
+
+from homedumper.const import RING_SLOTS
+
+
+class FrameRing:
+    """
+    Class for passing frames between processes without copying them, through
+    a ring of fixed-size slots in shared memory.
+
+    The writer copies each frame into a free slot and sends only its index.
+    Every slot keeps a count of the readers that still need it, and it is
+    reused once all of them release it. The ring must be given to the other
+    processes when they are created, e.g. in the initializer arguments of a
+    pool, since its lock can't be sent later.
+    """
+
+    def __init__(
+        self,
+        shape: Tuple[int, ...],
+        slots: int = RING_SLOTS,
+        dtype: npt.DTypeLike = np.uint8,
+    ):
+
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.dtype = np.dtype(dtype)
+
+        # Frames first, then the reference count of each slot
+        frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.shm = SharedMemory(create=True, size=slots * frame_bytes + slots * 4)
+        self.owner = True
+        self.condition = multiprocessing.Condition()
+        self.next = 0
+        self._map()
+        self.refs[:] = 0
+
+    def _map(self):
+        """
+        Create the arrays backed by the shared memory.
+        """
+
+        self.frames = np.ndarray(
+            (self.slots,) + self.shape, dtype=self.dtype, buffer=self.shm.buf
+        )
+        self.refs = np.ndarray(
+            (self.slots,), dtype=np.int32, buffer=self.shm.buf, offset=self.frames.nbytes
+        )
+
+    def __getstate__(self) -> dict:
+        return {
+            "shape": self.shape,
+            "slots": self.slots,
+            "dtype": self.dtype,
+            "name": self.shm.name,
+            "condition": self.condition,
+        }
+
+    def __setstate__(self, state: dict):
+
+        # Attach to the memory created by the writer in a spawned process
+        self.shape = state["shape"]
+        self.slots = state["slots"]
+        self.dtype = state["dtype"]
+        self.shm = SharedMemory(name=state["name"])
+        self.owner = False
+        self.condition = state["condition"]
+        self.next = 0
+        self._map()
+
+    def write(
+        self, frame: npt.NDArray, readers: int = 1, timeout: Optional[float] = None
+    ) -> int:
+        """
+        Copy a frame into a free slot, waiting for one if all are in use.
+
+        Parameters
+        ----------
+        frame : npt.NDArray
+            The frame, with the shape of the slots.
+        readers : int, optional
+            Number of releases needed to free the slot, by default 1
+        timeout : Optional[float], optional
+            Seconds to wait for a free slot, by default None (forever)
+
+        Returns
+        -------
+        int
+            Index of the slot.
+
+        Raises
+        ------
+        ValueError
+            When the frame doesn't have the shape of the slots.
+        TimeoutError
+            When no slot was freed in time.
+        """
+
+        if frame.shape != self.shape:
+            raise ValueError(f"Frame of shape {frame.shape}, expected {self.shape}")
+
+        with self.condition:
+
+            # Take the first free slot from the one after the last written
+            def free() -> Optional[int]:
+                for offset in range(self.slots):
+                    index = (self.next + offset) % self.slots
+                    if self.refs[index] == 0:
+                        return index
+                return None
+
+            self.condition.wait_for(lambda: free() is not None, timeout)
+            index = free()
+            if index is None:
+                raise TimeoutError("No free slot in the frame ring")
+            self.refs[index] = readers
+            self.next = (index + 1) % self.slots
+
+        self.frames[index] = frame
+        return index
+
+    def view(self, index: int) -> npt.NDArray:
+        """
+        Get the frame of a slot without copying it. It is only valid until
+        the slot is released.
+
+        Parameters
+        ----------
+        index : int
+            Index of the slot.
+
+        Returns
+        -------
+        npt.NDArray
+            The frame.
+        """
+
+        return self.frames[index]
+
+    def release(self, index: int):
+        """
+        Release a slot after reading it, freeing it for the writer once every
+        reader released it.
+
+        Parameters
+        ----------
+        index : int
+            Index of the slot.
+        """
+
+        with self.condition:
+            self.refs[index] -= 1
+            if self.refs[index] <= 0:
+                self.refs[index] = 0
+                self.condition.notify_all()
+
+    def in_use(self) -> int:
+        """
+        Count the slots not released yet.
+
+        Returns
+        -------
+        int
+            Number of slots in use.
+        """
+
+        with self.condition:
+            return int(np.count_nonzero(self.refs))
+
+    def close(self):
+        """
+        Unmap the shared memory, and remove it in the process that created it.
+        """
+
+        # Drop the arrays before unmapping their buffer
+        del self.frames, self.refs
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self) -> "FrameRing":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,175 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Optional
+
+from homedumper.const import THREAD_VARIABLES
+
+# Pin the workers of the pools created by process_pool, see configure
+_pin_cores = False
+
+
+def available_cores() -> List[int]:
+    """
+    Get the processors this process may run on.
+
+    Returns
+    -------
+    List[int]
+        Ids of the processors.
+    """
+
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def resolve_jobs(jobs: Optional[int] = None) -> int:
+    """
+    Get the number of processes of a pool.
+
+    Parameters
+    ----------
+    jobs : Optional[int], optional
+        Requested number of processes, by default None (one per available
+        processor).
+
+    Returns
+    -------
+    int
+        Number of processes, at least 1.
+    """
+
+    if jobs is None or jobs < 1:
+        return len(available_cores())
+    return jobs
+
+
+def limit_threads(threads: int):
+    """
+    Bound the threads that OpenCV, BLAS, OpenMP and tesseract start in this
+    process and in the processes it starts later.
+
+    Parameters
+    ----------
+    threads : int
+        Maximum number of threads of each library.
+    """
+
+    # Read by the libraries when they are loaded, and by tesseract
+    for name in THREAD_VARIABLES:
+        os.environ[name] = str(threads)
+
+    import cv2
+    from threadpoolctl import threadpool_limits
+
+    cv2.setNumThreads(threads)
+
+    # BLAS may already be loaded with its own thread pool, e.g. in the
+    # workers forked from a process that used it
+    threadpool_limits(threads)
+
+
+def configure(jobs: Optional[int] = None, pin_cores: bool = False) -> int:
+    """
+    Set the concurrency of this process and of the pools it creates, so the
+    stages use about `jobs` processors in total. Call it before running any
+    stage so it also applies to the libraries loaded by them.
+
+    This process runs at most `jobs` threads of each library, and every pool
+    created with process_pool runs `jobs` workers with a single thread each.
+
+    Parameters
+    ----------
+    jobs : Optional[int], optional
+        Number of processors to use, by default None (all the available
+        ones).
+    pin_cores : bool, optional
+        Restrict this process to the first `jobs` available processors and
+        pin each worker of the pools to one of them, by default False
+
+    Returns
+    -------
+    int
+        Number of processors used.
+    """
+
+    global _pin_cores
+
+    jobs = resolve_jobs(jobs)
+    cores = available_cores()
+    if jobs > len(cores):
+        logging.warning(f"Using {jobs} jobs on {len(cores)} available processors.")
+
+    _pin_cores = pin_cores and hasattr(os, "sched_setaffinity")
+    if _pin_cores:
+        os.sched_setaffinity(0, cores[:jobs])
+
+    limit_threads(jobs)
+    return jobs
+
+
+def _init_runtime_worker(
+    counter, cores: Optional[List[int]], initializer: Optional[Callable], initargs: tuple
+):
+    """
+    Apply the runtime settings to a worker process before its own
+    initializer.
+
+    Parameters
+    ----------
+    counter : multiprocessing.Value
+        Number of workers started, shared by the pool.
+    cores : Optional[List[int]]
+        Processors the workers are pinned to, in turns, None to not pin them.
+    initializer : Optional[Callable]
+        Initializer of the worker.
+    initargs : tuple
+        Arguments of the initializer.
+    """
+
+    limit_threads(1)
+
+    if cores:
+        with counter.get_lock():
+            index = counter.value
+            counter.value += 1
+        os.sched_setaffinity(0, {cores[index % len(cores)]})
+
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def process_pool(
+    jobs: Optional[int] = None,
+    initializer: Optional[Callable] = None,
+    initargs: tuple = (),
+) -> ProcessPoolExecutor:
+    """
+    Create a pool of worker processes that run a single thread of each
+    library, pinned to their own processor if configured.
+
+    Parameters
+    ----------
+    jobs : Optional[int], optional
+        Number of worker processes, by default None (one per available
+        processor).
+    initializer : Optional[Callable], optional
+        Function called when each worker starts, by default None
+    initargs : tuple, optional
+        Arguments of the initializer, by default ()
+
+    Returns
+    -------
+    ProcessPoolExecutor
+        The pool.
+    """
+
+    cores = available_cores() if _pin_cores else None
+    counter = multiprocessing.Value("i", 0)
+    return ProcessPoolExecutor(
+        resolve_jobs(jobs),
+        initializer=_init_runtime_worker,
+        initargs=(counter, cores, initializer, initargs),
+    )
@@ -0,0 +1,203 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+import numpy as np
+import numpy.typing as npt
+
+from homedumper.const import EMPTY_TEMPLATE, SCOPE_DIR
+from homedumper._cache import cache_root
+from homedumper._index import species_key
+
+
+def read_scope(entries: Iterable[str]) -> List[str]:
+    """
+    Read the pokemon of a species scope.
+
+    Parameters
+    ----------
+    entries : Iterable[str]
+        Pokemon names or template ids, or paths to files with them: either
+        'match.json' files of previous dumps or text files with one name or
+        id per line (e.g. the dex of a game).
+
+    Returns
+    -------
+    List[str]
+        Sorted names and ids, without duplicates.
+
+    Raises
+    ------
+    ValueError
+        When an entry looks like a path, with a separator or an extension,
+        but the file doesn't exist.
+    """
+
+    names = set()
+    for entry in entries:
+        path = Path(entry)
+        if not path.is_file():
+            # Don't take a mistyped path for a name
+            if re.search(r"[\\/]|\.\w+$", entry.strip()):
+                raise ValueError(f"Scope file not found: {entry}")
+            names.add(entry.strip())
+
+        # Pokemon found in a previous dump, empty slots are null
+        elif path.suffix == ".json":
+            with open(path, "r", encoding="utf-8") as f:
+                boxes = json.load(f)["boxes"]
+            names.update(name for box in boxes for name in box["pokemon"] if name)
+
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                names.update(line.strip() for line in f if line.strip())
+
+    names.discard("")
+    return sorted(names)
+
+
+def scope_version(names: List[str]) -> str:
+    """
+    Get a version string identifying a species scope.
+
+    Parameters
+    ----------
+    names : List[str]
+        Sorted names and ids of the scope, as returned by read_scope.
+
+    Returns
+    -------
+    str
+        Hexadecimal digest of the names.
+    """
+
+    return hashlib.sha1("\n".join(names).encode("utf-8")).hexdigest()[:16]
+
+
+def resolve_scope(
+    names: Iterable[str], template_ids: Iterable[str], name2id: Dict[str, str]
+) -> Set[str]:
+    """
+    Get the templates of the species of a scope. Every form of a species is
+    included, since a box may hold another form than the one listed, along
+    with the empty slot.
+
+    Parameters
+    ----------
+    names : Iterable[str]
+        Names and ids of the scope.
+    template_ids : Iterable[str]
+        Ids of every template.
+    name2id : Dict[str, str]
+        Dictionary to map pokemon names to template ids.
+
+    Returns
+    -------
+    Set[str]
+        Ids of the templates in the scope.
+
+    Raises
+    ------
+    ValueError
+        When no template corresponds to the scope.
+    """
+
+    template_ids = set(template_ids)
+
+    species = set()
+    for name in names:
+        id = name if name in template_ids else name2id.get(name)
+        if id is None:
+            logging.warning(f"Ignoring {name} of the scope, no template found.")
+            continue
+        species.add(species_key(id))
+
+    scoped = {id for id in template_ids if species_key(id) in species}
+    if not scoped:
+        raise ValueError("No template found for the pokemon of the scope")
+    scoped.add(EMPTY_TEMPLATE)
+
+    return scoped
+
+
+def pack_path(version: str, folder: str, ids: Set[str]) -> Path:
+    """
+    Get the path to the pack of a subset of the templates.
+
+    Parameters
+    ----------
+    version : str
+        Version of the template set.
+    folder : str
+        Subfolder of the resized templates.
+    ids : Set[str]
+        Ids of the templates in the subset.
+
+    Returns
+    -------
+    Path
+        Path to the pack in the cache, which may not exist yet.
+    """
+
+    key = "\n".join([version, folder] + sorted(ids))
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    return cache_root() / SCOPE_DIR / f"{folder}-{digest}.npz"
+
+
+def load_pack(path: Path) -> Optional[Dict[str, npt.NDArray]]:
+    """
+    Load a pack of templates.
+
+    Parameters
+    ----------
+    path : Path
+        Path to the pack.
+
+    Returns
+    -------
+    Optional[Dict[str, npt.NDArray]]
+        Templates by id, None if the pack doesn't exist or can't be read.
+    """
+
+    try:
+        with np.load(path) as pack:
+            ids, images = pack["ids"], pack["images"]
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+
+    return {str(id): image for id, image in zip(ids, images)}
+
+
+def save_pack(path: Path, templates: Dict[str, npt.NDArray]):
+    """
+    Store templates of the same size in a single file, written through a
+    temporary sibling so concurrent runs never read it half-written.
+
+    Parameters
+    ----------
+    path : Path
+        Path to the pack.
+    templates : Dict[str, npt.NDArray]
+        Templates by id.
+    """
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    ids = sorted(templates)
+
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{path.stem}.", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(
+                f,
+                ids=np.array(ids),
+                images=np.stack([templates[id] for id in ids]),
+            )
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
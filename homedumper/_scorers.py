@@ -0,0 +1,297 @@
+import os
+import tempfile
+from typing import List, Optional, Tuple, Union
+from skimage.metrics import structural_similarity
+import cv2
+import numpy as np
+import numpy.typing as npt
+
+SCORERS = ("ssim", "ncc", "ncc-int8", "masked")
+QUANTIZED_CHUNK = 256  # templates dequantized or paged in at once
+
+
+def ssim_likelihood(img1: npt.NDArray, img2: npt.NDArray, fine: bool = False) -> float:
+    """
+    Compute the likelihood of two images being the same using the Structural
+    Similarity Index
+
+    Parameters
+    ----------
+    img1 : npt.NDarray
+        The first image.
+    img2 : npt.NDarray
+        The second image.
+    fine : bool, optional
+        Use the slower gaussian weighted SSIM of Wang et al. instead of the
+        uniform window, by default False
+
+    Returns
+    -------
+    float
+        The likelihood of the two images being the same using the SSIM method.
+    """
+
+    # Convert the second image to the first image's size
+    if img1.shape != img2.shape:
+        img2 = cv2.resize(img2, (img1.shape[1], img1.shape[0]))
+
+    # Compute SSIM between two images
+    if fine:
+        return structural_similarity(
+            img1,
+            img2,
+            channel_axis=2,
+            gaussian_weights=True,
+            sigma=1.5,
+            use_sample_covariance=False,
+        )
+    return structural_similarity(img1, img2, channel_axis=2)
+
+
+def _flatten(images: List[npt.NDArray], shape: Tuple[int, ...]) -> npt.NDArray:
+    """
+    Stack images of the same size as float32 row vectors.
+
+    Parameters
+    ----------
+    images : List[npt.NDArray]
+        Images to stack. They are resized to `shape` if needed.
+    shape : Tuple[int, ...]
+        Shape of the templates.
+
+    Returns
+    -------
+    npt.NDArray
+        Matrix with one flattened image per row.
+    """
+
+    rows = []
+    for img in images:
+        if img.shape != shape:
+            img = cv2.resize(img, (shape[1], shape[0]), interpolation=cv2.INTER_AREA)
+        rows.append(img.reshape(-1))
+    return np.asarray(rows, dtype=np.float32)
+
+
+def _normalize(matrix: npt.NDArray, mean: npt.NDArray) -> npt.NDArray:
+    """
+    Center the rows of a matrix and scale them to unit norm.
+
+    Parameters
+    ----------
+    matrix : npt.NDArray
+        Matrix with one flattened image per row.
+    mean : npt.NDArray
+        Vector subtracted from every row.
+
+    Returns
+    -------
+    npt.NDArray
+        Normalized matrix.
+    """
+
+    matrix = matrix - mean
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-6)
+
+
+class NCCScorer:
+    """
+    Class for scoring all the thumbnails of a box against all the templates
+    with a single matrix product, using the normalized cross-correlation.
+
+    Vectors are centered with the mean of the template set rather than with
+    their own mean, so flat images (like the empty slot) are still
+    comparable.
+
+    When the matrix doesn't fit in `max_bytes`, it is written to a file in
+    `spill_dir` and memory mapped, so only the pages being scored are
+    resident. The file is removed as soon as it is mapped.
+    """
+
+    def __init__(
+        self,
+        templates: dict,
+        quantize: bool = False,
+        max_bytes: Optional[int] = None,
+        spill_dir: Optional[str] = None,
+    ):
+
+        self.ids = sorted(templates)
+        self.shape = templates[self.ids[0]].shape
+        chunks = [
+            self.ids[start : start + QUANTIZED_CHUNK]
+            for start in range(0, len(self.ids), QUANTIZED_CHUNK)
+        ]
+
+        # Compute the mean template without flattening every template at once
+        total = np.zeros(int(np.prod(self.shape)), dtype=np.float64)
+        for chunk in chunks:
+            total += _flatten([templates[id] for id in chunk], self.shape).sum(axis=0)
+        self.mean = (total / len(self.ids)).astype(np.float32)
+
+        # Allocate the (N, D) matrix, in a mapped file if it is too large
+        dtype = np.int8 if quantize else np.float32
+        shape = (len(self.ids), len(total))
+        nbytes = np.dtype(dtype).itemsize * shape[0] * shape[1]
+        self.mapped = max_bytes is not None and nbytes > max_bytes
+        self.matrix: npt.NDArray
+        if self.mapped:
+            fd, mmap_path = tempfile.mkstemp(suffix=".npy", dir=spill_dir)
+            os.close(fd)
+            self.matrix = np.lib.format.open_memmap(mmap_path, "w+", dtype, shape)
+            os.remove(mmap_path)
+        else:
+            self.matrix = np.empty(shape, dtype=dtype)
+
+        # Flatten and normalize the templates by chunks, keeping them as int8
+        # with one scale per row to save memory if requested
+        scales = np.empty(len(self.ids), dtype=np.float32) if quantize else None
+        self.scales: Optional[npt.NDArray] = scales
+        start = 0
+        for chunk in chunks:
+            rows = slice(start, start + len(chunk))
+            matrix = _flatten([templates[id] for id in chunk], self.shape)
+            matrix = _normalize(matrix, self.mean)
+            if scales is not None:
+                scales[rows] = np.abs(matrix).max(axis=1) / 127
+                matrix = np.round(matrix / scales[rows, None])
+            self.matrix[rows] = matrix
+            start += len(chunk)
+
+    def score(self, thumbnails: List[npt.NDArray]) -> npt.NDArray:
+        """
+        Compute the likelihood of every thumbnail being every template.
+
+        Parameters
+        ----------
+        thumbnails : List[npt.NDArray]
+            Images of the target Pokemon.
+
+        Returns
+        -------
+        npt.NDArray
+            Matrix (thumbnails x templates) with the likelihoods, in the order
+            of `ids`.
+        """
+
+        batch = _normalize(_flatten(thumbnails, self.shape), self.mean)
+
+        if self.scales is None and not self.mapped:
+            return batch @ self.matrix.T
+
+        # Dequantize or page in the templates by chunks to bound the memory
+        scores = np.empty((len(batch), len(self.ids)), dtype=np.float32)
+        for start in range(0, len(self.ids), QUANTIZED_CHUNK):
+            chunk = np.asarray(self.matrix[start : start + QUANTIZED_CHUNK], np.float32)
+            scores[:, start : start + QUANTIZED_CHUNK] = batch @ chunk.T
+        if self.scales is None:
+            return scores
+        return scores * self.scales
+
+
+class MaskedScorer:
+    """
+    Class for scoring thumbnails against the templates with the normalized
+    cross-correlation computed only on the foreground pixels of each
+    template, gathered through a precomputed index array.
+    """
+
+    def __init__(self, templates: dict, masks: dict):
+
+        self.ids = sorted(templates)
+        self.shape = templates[self.ids[0]].shape
+
+        # Center with the mean of the template set, like NCCScorer
+        self.mean = _flatten([templates[id] for id in self.ids], self.shape).mean(axis=0)
+
+        self.indices = []
+        self.vectors = []
+        for id in self.ids:
+
+            # Indexes of the foreground pixels in the flattened image
+            mask = np.repeat(masks[id].reshape(-1) > 0, self.shape[2])
+            indices = np.flatnonzero(mask)
+
+            # Keep only the normalized foreground of the template
+            vector = templates[id].reshape(-1)[indices].astype(np.float32)
+            vector = _normalize(vector[None, :], self.mean[indices])[0]
+
+            self.indices.append(indices)
+            self.vectors.append(vector)
+
+    def score(self, thumbnails: List[npt.NDArray]) -> npt.NDArray:
+        """
+        Compute the likelihood of every thumbnail being every template.
+
+        Parameters
+        ----------
+        thumbnails : List[npt.NDArray]
+            Images of the target Pokemon.
+
+        Returns
+        -------
+        npt.NDArray
+            Matrix (thumbnails x templates) with the likelihoods, in the order
+            of `ids`.
+        """
+
+        batch = _flatten(thumbnails, self.shape)
+        scores = np.empty((len(batch), len(self.ids)), dtype=np.float32)
+
+        for i, (indices, vector) in enumerate(zip(self.indices, self.vectors)):
+            foreground = _normalize(batch[:, indices], self.mean[indices])
+            scores[:, i] = foreground @ vector
+
+        return scores
+
+
+def create_scorer(
+    name: str,
+    templates: dict,
+    masks: Optional[dict] = None,
+    max_bytes: Optional[int] = None,
+    spill_dir: Optional[str] = None,
+) -> Optional[Union[NCCScorer, MaskedScorer]]:
+    """
+    Create the matrix scorer with the given name.
+
+    Parameters
+    ----------
+    name : str
+        One of SCORERS.
+    templates : dict
+        Dictionary with the templates. Keys are the ids and values are
+        the template images.
+    masks : Optional[dict], optional
+        Dictionary with the foreground masks of the templates, required by
+        the 'masked' scorer, by default None
+    max_bytes : Optional[int], optional
+        Memory available to the template matrix of the 'ncc' scorers, which
+        is memory mapped from `spill_dir` beyond it, by default None
+        (unbounded)
+    spill_dir : Optional[str], optional
+        Folder of the mapped matrix, by default None (the temporary folder)
+
+    Returns
+    -------
+    Optional[Union[NCCScorer, MaskedScorer]]
+        The scorer, None for 'ssim' that compares each pair of images.
+
+    Raises
+    ------
+    ValueError
+        When the name is not a known scorer.
+    """
+
+    if name == "ssim":
+        return None
+    if name == "ncc":
+        return NCCScorer(templates, max_bytes=max_bytes, spill_dir=spill_dir)
+    if name == "ncc-int8":
+        return NCCScorer(templates, True, max_bytes, spill_dir)
+    if name == "masked":
+        if masks is None:
+            raise ValueError("The 'masked' scorer requires the template masks")
+        return MaskedScorer(templates, masks)
+    raise ValueError(f"Unknown scorer '{name}', expected one of {SCORERS}")
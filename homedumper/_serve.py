@@ -0,0 +1,529 @@
+import json
+import logging
+import signal
+import socketserver
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from homedumper.const import (
+    DEFAULT_HOST,
+    DEFAULT_MATCH_MARGIN,
+    DEFAULT_OUT,
+    DEFAULT_PORT,
+    DEFAULT_SCORER,
+    JOB_TTL,
+    MAX_FINISHED_JOBS,
+)
+from homedumper._batch import _dump_video, _init_batch_worker
+from homedumper._download import download, name_dict
+from homedumper._match import Matcher, _create_matcher
+from homedumper._runtime import process_pool, resolve_jobs
+
+
+class QueueFull(Exception):
+    """
+    Raised when a job is submitted while the server has as many jobs waiting
+    or running as it accepts.
+    """
+
+
+def _init_serve_worker(matcher: Matcher):
+    """
+    Keep the matcher loaded by the server in a worker process, leaving the
+    handling of Ctrl+C to the server so running jobs can finish.
+
+    Parameters
+    ----------
+    matcher : Matcher
+        The matcher, inherited without copying it when processes are forked.
+    """
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _init_batch_worker(matcher)
+
+
+class JobManager:
+    """
+    Class for running dump jobs in a pool of worker processes that share the
+    templates and the name dictionary loaded by the server, accepting a
+    bounded number of jobs at once.
+
+    Finished jobs are forgotten after job_ttl seconds, or earlier when more
+    than max_finished of them are kept. Their results stay on disk.
+    """
+
+    def __init__(
+        self,
+        matcher: Matcher,
+        settings: dict,
+        output_path: str = DEFAULT_OUT,
+        jobs: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        job_ttl: float = JOB_TTL,
+        max_finished: int = MAX_FINISHED_JOBS,
+    ):
+
+        self.settings = settings
+        self.output_path = Path(output_path)
+        self.jobs = resolve_jobs(jobs)
+        self.queue_size = queue_size or 2 * self.jobs
+        self.job_ttl = job_ttl
+        self.max_finished = max_finished
+
+        # Workers are forked with the matcher already loaded, start them now
+        # before the server threads exist
+        self.pool = process_pool(self.jobs, _init_serve_worker, (matcher,))
+        self.pool.submit(int).result()
+
+        # Jobs by id, along with the future that runs each one
+        self.records: Dict[str, dict] = {}
+        self.futures: Dict[str, Future] = {}
+        self.lock = threading.RLock()
+
+    def _evict(self):
+        """
+        Forget the finished jobs that expired, and the oldest ones beyond the
+        number of finished jobs kept. Jobs are timed from the first check
+        that finds them finished.
+        """
+
+        with self.lock:
+            now = time.time()
+            for id, record in self.records.items():
+                if "finished" not in record and self.futures[id].done():
+                    record["finished"] = now
+
+            finished = sorted(
+                (record["finished"], id)
+                for id, record in self.records.items()
+                if "finished" in record
+            )
+            excess = max(0, len(finished) - self.max_finished)
+            deadline = now - self.job_ttl
+            for i, (stamp, id) in enumerate(finished):
+                if i < excess or stamp < deadline:
+                    del self.records[id]
+                    del self.futures[id]
+
+    def pending(self) -> int:
+        """
+        Count the jobs waiting or running.
+
+        Returns
+        -------
+        int
+            Number of unfinished jobs.
+        """
+
+        with self.lock:
+            return sum(not future.done() for future in self.futures.values())
+
+    def submit(self, video: str) -> dict:
+        """
+        Queue a dump job.
+
+        Parameters
+        ----------
+        video : str
+            Path to the video, readable by the server.
+
+        Returns
+        -------
+        dict
+            Status of the new job.
+
+        Raises
+        ------
+        ValueError
+            When the video doesn't exist.
+        QueueFull
+            When the server can't accept more jobs until some finish.
+        """
+
+        video_path = Path(video)
+        if not video_path.is_file():
+            raise ValueError(f"Invalid video path: {video}")
+
+        with self.lock:
+            self._evict()
+            if self.pending() >= self.queue_size:
+                raise QueueFull(f"{self.queue_size} jobs are already pending")
+
+            # Each job writes to its own folder, videos may share their names
+            id = uuid.uuid4().hex
+            output_path = str(self.output_path / id)
+            self.records[id] = {"id": id, "video": video, "submitted": time.time()}
+            self.futures[id] = self.pool.submit(
+                _dump_video, video_path, output_path, self.settings
+            )
+            logging.info(f"Job {id} submitted for {video}")
+
+            return self._describe(self.records[id], self.futures[id])
+
+    def status(self, id: str) -> Optional[dict]:
+        """
+        Get the status of a job.
+
+        Parameters
+        ----------
+        id : str
+            Id of the job.
+
+        Returns
+        -------
+        Optional[dict]
+            The job, with its 'status' (queued, running, done or failed) and
+            its 'summary' or 'error' once finished. None if the id is unknown
+            or the job was forgotten.
+        """
+
+        with self.lock:
+            self._evict()
+            if id not in self.records:
+                return None
+            record, future = self.records[id], self.futures[id]
+
+        return self._describe(record, future)
+
+    def _describe(self, record: dict, future: Future) -> dict:
+        """
+        Describe a job along with its status.
+
+        Parameters
+        ----------
+        record : dict
+            The job.
+        future : Future
+            The future that runs the job.
+
+        Returns
+        -------
+        dict
+            A copy of the job with its status, and its 'summary' or 'error'
+            once finished.
+        """
+
+        record = dict(record)
+        if future.done():
+            error = future.exception()
+            if error is None:
+                record.update(status="done", summary=future.result())
+            else:
+                record.update(status="failed", error=str(error))
+        else:
+            record["status"] = "running" if future.running() else "queued"
+        return record
+
+    def list(self) -> List[dict]:
+        """
+        Get the status of every job.
+
+        Returns
+        -------
+        List[dict]
+            The jobs in the order they were submitted.
+        """
+
+        with self.lock:
+            self._evict()
+            ids = list(self.records)
+        records = [self.status(id) for id in ids]
+        return [record for record in records if record is not None]
+
+    def result(self, id: str) -> Optional[dict]:
+        """
+        Read the results of a finished job.
+
+        Parameters
+        ----------
+        id : str
+            Id of the job.
+
+        Returns
+        -------
+        Optional[dict]
+            Content of the 'match.json' file of the job, None if the job
+            didn't finish successfully.
+        """
+
+        record = self.status(id)
+        if record is None or record["status"] != "done":
+            return None
+        match_path = Path(record["summary"]["project"]) / "match.json"
+        with open(match_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def shutdown(self):
+        """
+        Wait for the running jobs and stop the workers.
+        """
+
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    HTTP handler of the job API:
+
+    - POST /jobs with {"video": path} submits a job (202, or 429 when full).
+    - GET /jobs lists the jobs and GET /jobs/<id> gets the status of one.
+    - GET /jobs/<id>/result gets the results of a finished job.
+    - GET /health reports the pending jobs and the capacity.
+    """
+
+    def _send(self, code: int, data: dict, headers: Optional[Dict[str, str]] = None):
+        """
+        Send a JSON response.
+
+        Parameters
+        ----------
+        code : int
+            HTTP status code.
+        data : dict
+            Body of the response.
+        headers : Optional[Dict[str, str]], optional
+            Extra headers, by default None
+        """
+
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self) -> Tuple[str, ...]:
+        """
+        Split the path of the request.
+
+        Returns
+        -------
+        Tuple[str, ...]
+            Non-empty parts of the path.
+        """
+
+        return tuple(part for part in self.path.split("?")[0].split("/") if part)
+
+    def do_GET(self):
+        manager: JobManager = self.server.manager
+        route = self._route()
+
+        if route == ("health",):
+            health = {"pending": manager.pending(), "capacity": manager.queue_size}
+            self._send(200, health)
+        elif route == ("jobs",):
+            self._send(200, {"jobs": manager.list()})
+        elif len(route) == 2 and route[0] == "jobs":
+            record = manager.status(route[1])
+            if record is None:
+                self._send(404, {"error": f"Unknown job {route[1]}"})
+            else:
+                self._send(200, record)
+        elif len(route) == 3 and route[0] == "jobs" and route[2] == "result":
+            record = manager.status(route[1])
+            if record is None:
+                self._send(404, {"error": f"Unknown job {route[1]}"})
+            elif record["status"] != "done":
+                self._send(409, {"error": f"Job {route[1]} is {record['status']}"})
+            else:
+                self._send(200, manager.result(route[1]))
+        else:
+            self._send(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        manager: JobManager = self.server.manager
+
+        if self._route() != ("jobs",):
+            self._send(404, {"error": f"Unknown path {self.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            self._send(202, manager.submit(request["video"]))
+        except QueueFull as err:
+            self._send(429, {"error": str(err)}, {"Retry-After": "5"})
+        except (KeyError, TypeError, ValueError) as err:
+            self._send(400, {"error": f"Invalid job: {err}"})
+
+    def address_string(self) -> str:
+        # Clients of a Unix socket have no address
+        return self.client_address[0] if self.client_address else "local"
+
+    def log_message(self, format: str, *args):
+        logging.info(f"{self.address_string()} {format % args}")
+
+
+class _TCPHTTPServer(ThreadingHTTPServer):
+    """
+    HTTP server listening on a TCP port, handling each request in a thread.
+    """
+
+    manager: JobManager
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    HTTP server listening on a Unix socket, handling each request in a thread.
+    """
+
+    daemon_threads = True
+    manager: JobManager
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+def create_server(
+    manager: JobManager,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    socket: Optional[str] = None,
+) -> Union[_TCPHTTPServer, _UnixHTTPServer]:
+    """
+    Create the HTTP server of the job API.
+
+    Parameters
+    ----------
+    manager : JobManager
+        Manager that runs the jobs.
+    host : str, optional
+        Address to listen on, by default DEFAULT_HOST
+    port : int, optional
+        Port to listen on, by default DEFAULT_PORT
+    socket : Optional[str], optional
+        Path to a Unix socket to listen on instead of a TCP port, by default
+        None
+
+    Returns
+    -------
+    Union[_TCPHTTPServer, _UnixHTTPServer]
+        The server, not started yet.
+    """
+
+    server: Union[_TCPHTTPServer, _UnixHTTPServer]
+    if socket is not None:
+        if Path(socket).exists():
+            Path(socket).unlink()
+        server = _UnixHTTPServer(socket, _Handler)
+    else:
+        server = _TCPHTTPServer((host, port), _Handler)
+    server.manager = manager
+    return server
+
+
+def _interrupt(signum: int, frame):
+    """
+    Handle a signal like Ctrl+C.
+    """
+
+    raise KeyboardInterrupt
+
+
+def _check_ocr():
+    """
+    Check once that the OCR engine is available, so a missing tesseract is
+    reported at startup rather than in every job.
+    """
+
+    import pytesseract
+
+    try:
+        version = pytesseract.get_tesseract_version()
+        logging.info(f"Using tesseract {version}")
+    except pytesseract.pytesseract.TesseractNotFoundError:
+        logging.error("Tesseract not found, default names will be used for the boxes.")
+
+
+def serve(
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    socket: Optional[str] = None,
+    output_path: str = DEFAULT_OUT,
+    jobs: Optional[int] = None,
+    queue_size: Optional[int] = None,
+    threshold: Optional[float] = None,
+    margin: float = DEFAULT_MATCH_MARGIN,
+    priors: Optional[List[str]] = None,
+    shortlist: Optional[int] = None,
+    scorer: str = DEFAULT_SCORER,
+    verify: bool = False,
+):
+    """
+    Serve the job API until interrupted, keeping the templates and the name
+    dictionary loaded between jobs.
+
+    Parameters
+    ----------
+    host : str, optional
+        Address to listen on, by default DEFAULT_HOST
+    port : int, optional
+        Port to listen on, by default DEFAULT_PORT
+    socket : Optional[str], optional
+        Path to a Unix socket to listen on instead of a TCP port, by default
+        None
+    output_path : str, optional
+        Folder where each job writes its results, by default DEFAULT_OUT
+    jobs : Optional[int], optional
+        Number of jobs processed at once, by default None (the number of
+        processors).
+    queue_size : Optional[int], optional
+        Maximum number of jobs waiting or running, by default None (twice
+        the number of jobs).
+    threshold : Optional[float], optional
+        Likelihood above which the search of a slot stops early, by default
+        None (compare every template).
+    margin : float, optional
+        Minimum likelihood gap with the runner-up to stop early, by default
+        DEFAULT_MATCH_MARGIN
+    priors : Optional[List[str]], optional
+        Paths to 'match.json' files of previous dumps used to sort the
+        templates, by default None
+    shortlist : Optional[int], optional
+        Number of species whose forms are compared, by default None (compare
+        every template).
+    scorer : str, optional
+        Name of the scorer, by default DEFAULT_SCORER
+    verify : bool, optional
+        Check the content of every cached template, by default False
+    """
+
+    # Load everything the jobs need before forking the workers
+    download(verify=verify)
+    name_dict()
+    _check_ocr()
+    matcher = _create_matcher({}, priors or [], threshold, margin, shortlist, scorer)
+    settings = {
+        "threshold": threshold,
+        "margin": margin,
+        "priors": priors,
+        "shortlist": shortlist,
+        "scorer": scorer,
+    }
+
+    manager = JobManager(matcher, settings, output_path, jobs, queue_size)
+    server = create_server(manager, host, port, socket)
+    address = socket or f"http://{host}:{server.server_port}"
+    logging.info(f"Serving {manager.jobs} workers on {address}")
+
+    # Stop gracefully when the service manager terminates the server
+    signal.signal(signal.SIGTERM, _interrupt)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Shutting down, waiting for the running jobs.")
+    finally:
+        server.server_close()
+        manager.shutdown()
+        if socket is not None and Path(socket).exists():
+            Path(socket).unlink()
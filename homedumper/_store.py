@@ -0,0 +1,169 @@
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    project TEXT NOT NULL,
+    settings TEXT,
+    started REAL NOT NULL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS boxes (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    position INTEGER NOT NULL,
+    folder TEXT NOT NULL,
+    title TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS slots (
+    box_id INTEGER NOT NULL REFERENCES boxes(id),
+    slot TEXT NOT NULL,
+    pokemon TEXT,
+    template TEXT,
+    score REAL,
+    PRIMARY KEY (box_id, slot)
+);
+CREATE INDEX IF NOT EXISTS boxes_by_run ON boxes(run_id, position);
+CREATE INDEX IF NOT EXISTS boxes_by_title ON boxes(title);
+CREATE INDEX IF NOT EXISTS slots_by_pokemon ON slots(pokemon);
+"""
+
+
+class ResultStore:
+    """
+    Class for storing the results of the matching stage in a SQLite database
+    as soon as the boxes are matched.
+    """
+
+    def __init__(self, path: str):
+
+        # Create the database and its tables if they don't exist
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(path))
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+
+    def start_run(self, project: str, settings: Optional[str] = None) -> int:
+        """
+        Register a new run of the matching stage.
+
+        Parameters
+        ----------
+        project : str
+            Path to the project folder being matched.
+        settings : Optional[str], optional
+            Description of the settings used to match, by default None
+
+        Returns
+        -------
+        int
+            Id of the run.
+        """
+
+        cursor = self.connection.execute(
+            "INSERT INTO runs (project, settings, started) VALUES (?, ?, ?)",
+            (project, settings, time.time()),
+        )
+        self.connection.commit()
+        if cursor.lastrowid is None:
+            raise sqlite3.Error("The run could not be recorded")
+        return cursor.lastrowid
+
+    def add_box(self, run_id: int, folder: str, rows: List[tuple]):
+        """
+        Store the results of a box and commit them.
+
+        Parameters
+        ----------
+        run_id : int
+            Id of the run the box belongs to.
+        folder : str
+            Name of the box folder.
+        rows : List[tuple]
+            Rows of the box (Box name, Slot Number, Pokemon ID, Template ID,
+            Likelihood).
+        """
+
+        title = rows[0][0] if rows else ""
+        position = self.connection.execute(
+            "SELECT COUNT(*) FROM boxes WHERE run_id = ?", (run_id,)
+        ).fetchone()[0]
+
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO boxes (run_id, position, folder, title) VALUES (?, ?, ?, ?)",
+                (run_id, position, folder, title),
+            )
+            self.connection.executemany(
+                "INSERT INTO slots (box_id, slot, pokemon, template, score) "
+                "VALUES (?, ?, ?, ?, ?)",
+                ((cursor.lastrowid,) + tuple(row[1:]) for row in rows),
+            )
+
+    def finish_run(self, run_id: int):
+        """
+        Mark a run as finished.
+
+        Parameters
+        ----------
+        run_id : int
+            Id of the run.
+        """
+
+        with self.connection:
+            self.connection.execute(
+                "UPDATE runs SET finished = ? WHERE id = ?", (time.time(), run_id)
+            )
+
+    def rows(self, run_id: int) -> Iterator[Tuple[str, str, str]]:
+        """
+        Iterate over the results of a run in the order they were stored.
+
+        Parameters
+        ----------
+        run_id : int
+            Id of the run.
+
+        Returns
+        -------
+        Iterator[Tuple[str, str, str]]
+            Rows (Box name, Slot Number, Pokemon ID).
+        """
+
+        return self.connection.execute(
+            "SELECT boxes.title, slots.slot, slots.pokemon FROM slots "
+            "JOIN boxes ON slots.box_id = boxes.id "
+            "WHERE boxes.run_id = ? ORDER BY boxes.position, slots.slot",
+            (run_id,),
+        )
+
+    def count(self, run_id: int) -> int:
+        """
+        Count the slots stored for a run.
+
+        Parameters
+        ----------
+        run_id : int
+            Id of the run.
+
+        Returns
+        -------
+        int
+            Number of slots.
+        """
+
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM slots JOIN boxes ON slots.box_id = boxes.id "
+            "WHERE boxes.run_id = ?",
+            (run_id,),
+        ).fetchone()[0]
+
+    def close(self):
+        """
+        Close the connection to the database.
+        """
+
+        self.connection.close()
@@ -1,10 +1,62 @@
 # Paths
 DEFAULT_OUT = "./output"
-CACHE_DIR = "homedumper/.cache"
+CACHE_ENV = "HOMEDUMPER_CACHE"  # overrides the folder of the cache
+CACHE_NAME = "homedumper"  # folder of the cache in the cache folder of the user
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".mov", ".avi", ".webm")  # found by batch
+BATCH_SUMMARY = "batch_summary.json"
+LIVE_RESULTS = "live.jsonl"  # boxes matched by live, one JSON object per line
+SIGNATURES_FILE = "signatures.npz"  # per-frame sidecar written by extract
+
+# Server
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+JOB_TTL = 3600  # seconds a finished job is kept by the server
+MAX_FINISHED_JOBS = 1000  # finished jobs kept by the server, the oldest go first
 
 # URLs
 URL_TEMPLATES = "https://mega.nz/#!kwtkWLaZ!QpEZIEeOADV4_xE4rCy7G1yUJFu1CvWXL4aS_1bat48"
+TEMPLATES_SHA256 = None  # expected checksum of the templates archive, if known
 URL_RAW_POKEMON_METADATA = "https://raw.githubusercontent.com/itsjavi/livingdex/main/apps/data-generator/data/meta/pokemon.json"
 
 # Geometry
-THUMBANIL_SIZE = 37  # half-Width of the squared thumbnails
\ No newline at end of file
+THUMBANIL_SIZE = 37  # half-Width of the squared thumbnails
+RESIZED_DIR = f"resized_{THUMBANIL_SIZE * 2}"  # cache subfolder of the templates
+BOX_ROWS = 5
+BOX_COLUMNS = 6
+
+# Extraction
+STABLE_THRESHOLD = 10  # max difference of the L/R indicators with their color
+DEDUP_THRESHOLD = 10  # min gray level difference of a changed pixel
+DEDUP_MIN_PIXELS = 2000  # min changed pixels between frames of different boxes
+SIGNATURE_STRIDE = 8  # pixels between the samples of the frame signatures
+
+# Matching
+EMPTY_TEMPLATE = "0000"  # id of the template of an empty slot
+DEFAULT_MATCH_MARGIN = 0.05  # min likelihood gap with the runner-up to stop
+DEFAULT_SCORER = "ssim"
+SCOPE_DIR = "scopes"  # cache subfolder of the templates packed by species scope
+LOADER_THREADS = 4  # threads reading the next boxes while one is matched
+PIPELINE_QUEUE_SIZE = 4  # frames or boxes waiting between the stages of dump
+RING_SLOTS = 8  # frames shared with the worker processes of dump
+
+# Concurrency, variables read by the thread pools of BLAS, OpenMP and tesseract
+THREAD_VARIABLES = (
+    "OMP_NUM_THREADS",
+    "OMP_THREAD_LIMIT",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "BLIS_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+)
+
+# Memory budget, fraction of --max-memory available to each stage
+MEMORY_SHARES = {"dedup": 0.25, "templates": 0.5, "buffers": 0.25}
+
+# Live capture
+LIVE_QUEUE_SIZE = 8  # new frames waiting to be matched, bounds the latency
+LIVE_POLL_INTERVAL = 0.5  # seconds between checks of a growing file
+LIVE_IDLE_TIMEOUT = 10.0  # seconds without growing before a file is finished
+
+# Cache
+LOCK_POLL_INTERVAL = 0.1  # seconds between tries to lock the cache on Windows
\ No newline at end of file
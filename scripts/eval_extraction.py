@@ -1,7 +1,12 @@
 # This scripts evaluates the extraction of the Pokémon from the video by
 # comparing the extracted ids with the ground truth manually labeled for
 # the sample video.
+#
+# Usage: python scripts/eval_extraction.py [path/to/match.json]
+#
+# Run it on the output of `match` with each `--scorer` to compare them.
 
+import sys
 import json
 
 
@@ -48,7 +53,7 @@ def compare_boxes(box1: dict, box2: dict) -> tuple[int, int, int, int, list]:
             if pkm1.split("-")[0] == pkm2.split("-")[0]:
                 form_incorrect += 1
                 errors.append((pkm1, pkm2, "form"))
-            continue
+                continue
         errors.append((pkm1, pkm2, "species"))
         species_incorrect += 1
 
@@ -56,36 +61,58 @@ def compare_boxes(box1: dict, box2: dict) -> tuple[int, int, int, int, list]:
 
 
 
+def evaluate(ground_truth: dict, predicted: dict) -> dict:
+    """
+    Compares every box of a dump with the ground truth.
+
+    Parameters
+    ----------
+    ground_truth : dict
+        Content of the labeled 'perfect.json' file.
+    predicted : dict
+        Content of the 'match.json' file of the dump.
+
+    Returns
+    -------
+    dict
+        Number of correct, species-incorrect, form-incorrect and
+        fake-detected pokemon followed by a list of incorrect matches.
+    """
+
+    result = {"correct": 0, "species": 0, "form": 0, "empty": 0, "errors": []}
+
+    for gt_box, dp_box in zip(ground_truth["boxes"], predicted["boxes"]):
+        c, si, fi, vi, err = compare_boxes(gt_box, dp_box)
+        result["correct"] += c
+        result["species"] += si
+        result["form"] += fi
+        result["empty"] += vi
+        result["errors"] += err
+
+    return result
+
+
+
 if __name__ == "__main__":
 
     with open('data/perfect.json') as f:
         ground_truth = json.load(f)
 
-    with open('../homedumper/output/myhome/match.json') as f:
-        predicted = json.load(f)
+    predicted_path = '../homedumper/output/myhome/match.json'
+    if len(sys.argv) > 1:
+        predicted_path = sys.argv[1]
 
-    
-    correct = 0
-    species_incorrect = 0
-    form_incorrect = 0
-    fake_detected = 0
-    errors = []
+    with open(predicted_path) as f:
+        predicted = json.load(f)
 
-    for gt_box, dp_box in zip(ground_truth["boxes"], predicted["boxes"]):
-        c, si, fi, vi, err = compare_boxes(gt_box, dp_box)
-        correct += c
-        species_incorrect += si
-        form_incorrect += fi
-        fake_detected += vi
-        errors += err
+    result = evaluate(ground_truth, predicted)
 
     print('Bad matches: \n')
-    for er in errors:
+    for er in result["errors"]:
         print(f'[{er[2]}] {er[0]} -> {er[1]}')
 
-    print(f'\nCorrect: {correct}')
-    print(f'Incorrect: {species_incorrect + form_incorrect + fake_detected}')
-    print(f'     Species: {species_incorrect}')
-    print(f'     Form: {form_incorrect}')
-    print(f'     Empty slots: {fake_detected}')
- 
+    print(f'\nCorrect: {result["correct"]}')
+    print(f'Incorrect: {result["species"] + result["form"] + result["empty"]}')
+    print(f'     Species: {result["species"]}')
+    print(f'     Form: {result["form"]}')
+    print(f'     Empty slots: {result["empty"]}')
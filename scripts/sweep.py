@@ -0,0 +1,257 @@
+# This script runs the pipeline over a grid of settings and compares the
+# accuracy of each configuration, measured against a labeled dump like
+# data/perfect.json, with the wall time and the peak memory it took. It
+# prints a table of every configuration and the Pareto frontier, i.e. the
+# configurations that no other one beats in accuracy, time and memory at once.
+#
+# Usage: python scripts/sweep.py <video> [--truth data/perfect.json]
+#            [--stable 10 15] [--dedup 10] [--dedup-pixels 1000 2000]
+#            [--scorers ssim ncc] [--shortlist 0 3] [--jobs 1 2]
+#            [--work-dir DIR] [--output sweep.json]
+#
+# The templates are read from the cache of the user (or HOMEDUMPER_CACHE).
+# Frames are extracted once per extraction setting and matched with every
+# match setting. A shortlist of 0 compares every template.
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Import the homedumper of this checkout, also in the stage processes
+REPO_PATH = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_PATH))
+
+from eval_extraction import evaluate
+from homedumper._memory import peak_rss
+
+
+def run_stage(args: argparse.Namespace) -> dict:
+    """
+    Run a stage of the pipeline with a single configuration in this process.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Command line arguments, with one value per setting.
+
+    Returns
+    -------
+    dict
+        Elapsed seconds and peak RSS in kilobytes.
+    """
+
+    import homedumper
+
+    start = time.perf_counter()
+    if args.stage == "extract":
+        homedumper.extract(
+            args.video,
+            args.project_out,
+            stable_threshold=args.stable[0],
+            dedup_threshold=args.dedup[0],
+            dedup_pixels=args.dedup_pixels[0],
+        )
+        homedumper.boxify(str(Path(args.project_out) / Path(args.video).stem))
+    else:
+        homedumper.match(
+            args.project,
+            force=True,
+            scorer=args.scorers[0],
+            shortlist=args.shortlist[0] or None,
+            jobs=args.jobs[0],
+        )
+
+    return {"seconds": time.perf_counter() - start, "peak_rss_kb": peak_rss() // 1024}
+
+
+def measure(command: list) -> dict:
+    """
+    Run a stage of the pipeline in a fresh process.
+
+    Parameters
+    ----------
+    command : list
+        Arguments of this script selecting the stage and its configuration.
+
+    Returns
+    -------
+    dict
+        Measures of the stage.
+    """
+
+    result = subprocess.run(
+        [sys.executable, str(Path(__file__).resolve())] + command,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def pareto_frontier(rows: list) -> list:
+    """
+    Find the configurations that are not dominated by any other one, i.e.
+    no other configuration is at least as accurate, fast and small and
+    strictly better in one of them.
+
+    Parameters
+    ----------
+    rows : list
+        Results of every configuration.
+
+    Returns
+    -------
+    list
+        Results of the configurations on the frontier.
+    """
+
+    def better_or_equal(a: dict, b: dict) -> bool:
+        return (
+            a["correct"] >= b["correct"]
+            and a["seconds"] <= b["seconds"]
+            and a["peak_rss_kb"] <= b["peak_rss_kb"]
+        )
+
+    return [
+        row
+        for row in rows
+        if not any(
+            better_or_equal(other, row) and not better_or_equal(row, other)
+            for other in rows
+        )
+    ]
+
+
+def print_table(rows: list):
+    """
+    Print the results of the configurations as a table.
+
+    Parameters
+    ----------
+    rows : list
+        Results of the configurations.
+    """
+
+    settings = ["stable", "dedup", "dedup_pixels", "scorer", "shortlist", "jobs"]
+    measures = ["frames", "correct", "species", "form", "empty", "seconds"]
+    columns = settings + measures + ["peak_rss_kb"]
+    print(" ".join(f"{name:>12}" for name in columns))
+    for row in rows:
+        values = (
+            f"{row[name]:.2f}" if isinstance(row[name], float) else str(row[name])
+            for name in columns
+        )
+        print(" ".join(f"{value:>12}" for value in values))
+
+
+def sweep(args: argparse.Namespace) -> list:
+    """
+    Run and evaluate the pipeline with every configuration of the grid.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Command line arguments, with the values of each setting.
+
+    Returns
+    -------
+    list
+        Settings, accuracy, wall time and peak memory of every configuration.
+    """
+
+    with open(args.truth, encoding="utf-8") as f:
+        ground_truth = json.load(f)
+
+    work_path = Path(args.work_dir or tempfile.mkdtemp(prefix="homedumper-sweep-"))
+    video = str(Path(args.video).absolute())
+    rows = []
+
+    for stable, dedup, pixels in itertools.product(
+        args.stable, args.dedup, args.dedup_pixels
+    ):
+
+        # Extract and boxify the frames once per extraction setting
+        out_path = work_path / f"stable{stable}_dedup{dedup}_pixels{pixels}"
+        extraction = measure(
+            ["--stage", "extract", video, "--project-out", str(out_path)]
+            + ["--stable", str(stable), "--dedup", str(dedup)]
+            + ["--dedup-pixels", str(pixels)]
+        )
+        project = out_path / Path(video).stem
+        frames = len(list((project / "frames").glob("*.png")))
+
+        for scorer, shortlist, jobs in itertools.product(
+            args.scorers, args.shortlist, args.jobs
+        ):
+            matching = measure(
+                ["--stage", "match", video, "--project", str(project)]
+                + ["--scorers", scorer, "--shortlist", str(shortlist)]
+                + ["--jobs", str(jobs)]
+            )
+
+            # Hide the mismatches printed while comparing the boxes
+            with open(project / "match.json", encoding="utf-8") as f:
+                predicted = json.load(f)
+            with contextlib.redirect_stdout(io.StringIO()):
+                accuracy = evaluate(ground_truth, predicted)
+            del accuracy["errors"]
+
+            row = {
+                "stable": stable,
+                "dedup": dedup,
+                "dedup_pixels": pixels,
+                "scorer": scorer,
+                "shortlist": shortlist,
+                "jobs": jobs,
+                "frames": frames,
+                **accuracy,
+                "seconds": extraction["seconds"] + matching["seconds"],
+                "peak_rss_kb": max(extraction["peak_rss_kb"], matching["peak_rss_kb"]),
+            }
+            rows.append(row)
+            print_table([row])
+
+    return rows
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Sweep the pipeline settings")
+    parser.add_argument("video")
+    parser.add_argument("--truth", default="data/perfect.json")
+    parser.add_argument("--stable", nargs="+", type=int, default=[10])
+    parser.add_argument("--dedup", nargs="+", type=int, default=[10])
+    parser.add_argument("--dedup-pixels", nargs="+", type=int, default=[2000])
+    parser.add_argument("--scorers", nargs="+", default=["ssim", "ncc"])
+    parser.add_argument("--shortlist", nargs="+", type=int, default=[0])
+    parser.add_argument("--jobs", nargs="+", type=int, default=[1])
+    parser.add_argument("--work-dir", default=None)
+    parser.add_argument("--output", default="sweep.json")
+    parser.add_argument("--stage", choices=["extract", "match"])
+    parser.add_argument("--project-out")
+    parser.add_argument("--project")
+    args = parser.parse_args()
+
+    # Run a single stage, called by measure() in a fresh process
+    if args.stage is not None:
+        print(json.dumps(run_stage(args)))
+        sys.exit(0)
+
+    rows = sweep(args)
+    frontier = pareto_frontier(rows)
+
+    print("\nAll configurations:")
+    print_table(rows)
+    print("\nPareto frontier:")
+    print_table(frontier)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"configurations": rows, "frontier": frontier}, f, indent=2)
+    print(f"\nResults saved to {args.output}")
@@ -0,0 +1,65 @@
+import json
+import shutil
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from homedumper.const import CACHE_ENV
+
+# The synthetic inputs are generated by the benchmark helpers
+BENCHMARKS_PATH = Path(__file__).parents[1] / "benchmarks"
+
+
+@pytest.fixture(scope="session")
+def synthetic(tmp_path_factory):
+    """
+    Generate a synthetic template cache and a video scrolling through 3
+    boxes, and use that cache for the whole session.
+    """
+
+    sys.path.insert(0, str(BENCHMARKS_PATH))
+    import synthetic as generator
+
+    work_path = tmp_path_factory.mktemp("synthetic")
+    templates = generator.make_templates(work_path, 20)
+    video = generator.make_video(work_path, templates, 3, hold=8, transition=4)
+    with open(work_path / "truth.json", "r", encoding="utf-8") as f:
+        truth = json.load(f)
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv(CACHE_ENV, str(work_path / generator.WORK_CACHE))
+        yield SimpleNamespace(
+            path=work_path,
+            video=video,
+            truth=truth,
+            cache=work_path / generator.WORK_CACHE,
+        )
+
+
+@pytest.fixture(scope="session")
+def boxified(synthetic, tmp_path_factory):
+    """
+    Extract and boxify the synthetic video once for the session.
+    """
+
+    import homedumper
+
+    output_path = tmp_path_factory.mktemp("boxified")
+    homedumper.extract(str(synthetic.video), str(output_path))
+    project_path = output_path / synthetic.video.stem
+    homedumper.boxify(str(project_path))
+    return project_path
+
+
+@pytest.fixture
+def project(boxified, tmp_path):
+    """
+    Copy of the boxified project that a test can modify.
+    """
+
+    project_path = tmp_path / boxified.name
+    shutil.copytree(boxified, project_path)
+    return project_path
+
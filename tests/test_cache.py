@@ -0,0 +1,33 @@
+import threading
+import time
+
+from homedumper._cache import cache_lock, cache_root
+from homedumper.const import CACHE_ENV, CACHE_NAME
+
+
+def test_cache_root(monkeypatch, tmp_path):
+
+    monkeypatch.delenv(CACHE_ENV, raising=False)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    assert cache_root() == tmp_path / CACHE_NAME
+
+    monkeypatch.setenv(CACHE_ENV, str(tmp_path / "custom"))
+    assert cache_root() == tmp_path / "custom"
+
+
+def test_readers_wait_for_the_writer(tmp_path):
+
+    events = []
+
+    def read():
+        with cache_lock(tmp_path / "templates", shared=True):
+            events.append("read")
+
+    with cache_lock(tmp_path / "templates"):
+        reader = threading.Thread(target=read)
+        reader.start()
+        time.sleep(0.2)
+        events.append("written")
+    reader.join()
+
+    assert events == ["written", "read"]
@@ -0,0 +1,58 @@
+import cv2
+import numpy as np
+import pytest
+
+from homedumper._download import _prepare_resized_folders, foreground_mask
+
+
+def test_empty_template_is_written_once(tmp_path):
+
+    folders = _prepare_resized_folders(tmp_path)
+    files = [folder / "0000.png" for pair in folders.values() for folder in pair]
+    stamps = [file.stat().st_mtime_ns for file in files]
+
+    _prepare_resized_folders(tmp_path)
+
+    assert [file.stat().st_mtime_ns for file in files] == stamps
+
+
+def test_stale_empty_template_is_rewritten(tmp_path):
+
+    folders = _prepare_resized_folders(tmp_path)
+    out_file = folders["regular"][0] / "0000.png"
+    expected = cv2.imread(str(out_file))
+    cv2.imwrite(str(out_file), np.zeros((8, 8, 3), dtype=np.uint8))
+
+    _prepare_resized_folders(tmp_path)
+
+    assert np.array_equal(cv2.imread(str(out_file)), expected)
+
+
+def _template(channels):
+    img = np.full((8, 8, channels), 255, dtype=np.uint8)
+    img[2:6, 2:6, :3] = (40, 120, 200)
+    return img
+
+
+def _transparent():
+    img = _template(4)
+    img[:, :, 3] = 0
+    img[2:6, 2:6, 3] = 255
+    return img
+
+
+@pytest.mark.parametrize(
+    "img, foreground",
+    [
+        (_transparent(), (slice(2, 6), slice(2, 6))),
+        (_template(3), (slice(2, 6), slice(2, 6))),
+        (np.full((8, 8, 3), 255, dtype=np.uint8), (slice(None), slice(None))),
+    ],
+    ids=["alpha", "non-white", "flat"],
+)
+def test_foreground_mask(img, foreground):
+
+    expected = np.zeros(img.shape[:2], dtype=np.uint8)
+    expected[foreground] = 255
+
+    assert np.array_equal(foreground_mask(img), expected)
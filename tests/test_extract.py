@@ -0,0 +1,54 @@
+import cv2
+import numpy as np
+import pytest
+
+import homedumper
+from homedumper import _extract
+
+
+def read_frames(project_path):
+    return [
+        cv2.imread(str(path)) for path in sorted((project_path / "frames").glob("*.png"))
+    ]
+
+
+def same_frames(a, b):
+    return len(a) == len(b) and all(map(np.array_equal, a, b))
+
+
+@pytest.fixture
+def recorded(synthetic, tmp_path):
+
+    homedumper.extract(str(synthetic.video), str(tmp_path), signatures=True)
+    project_path = tmp_path / synthetic.video.stem
+    return project_path, read_frames(project_path)
+
+
+def test_signatures_extract_the_same_frames(synthetic, recorded):
+
+    project_path, frames = recorded
+    metrics = homedumper.Metrics()
+
+    homedumper.extract(
+        str(synthetic.video), str(project_path.parent), metrics, signatures=True
+    )
+
+    assert len(frames) == len(synthetic.truth["boxes"])
+    assert same_frames(read_frames(project_path), frames)
+    assert metrics.counters["extract.frames_decoded"] == len(frames)
+
+
+def test_inaccurate_seeks_decode_the_video(synthetic, recorded, monkeypatch):
+
+    project_path, frames = recorded
+    metrics = homedumper.Metrics()
+
+    # Every frame decoded after a seek looks like another one
+    signature = _extract.frame_signature
+    monkeypatch.setattr(_extract, "frame_signature", lambda frame: signature(frame) ^ 1)
+    homedumper.extract(
+        str(synthetic.video), str(project_path.parent), metrics, signatures=True
+    )
+
+    assert metrics.counters["extract.inaccurate_seeks"] == 1
+    assert same_frames(read_frames(project_path), frames)
@@ -0,0 +1,95 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from homedumper._fetch import stream_download
+
+CONTENT = bytes(range(256)) * 1000
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """
+    Serve CONTENT with support for 'bytes=<first>-' ranges. Unsatisfiable
+    ranges announce the size of the file unless the server is 'terse'.
+    """
+
+    terse = False
+
+    def do_GET(self):
+        first = 0
+        if "Range" in self.headers:
+            first = int(self.headers["Range"].split("=")[1].rstrip("-"))
+
+        if first >= len(CONTENT):
+            self.send_response(416)
+            if not self.terse:
+                self.send_header("Content-Range", f"bytes */{len(CONTENT)}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        body = CONTENT[first:]
+        self.send_response(206 if first else 200)
+        if first:
+            last = len(CONTENT) - 1
+            self.send_header("Content-Range", f"bytes {first}-{last}/{len(CONTENT)}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+
+    RangeHandler.terse = False
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/templates.zip"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_download(server, tmp_path):
+
+    dest = stream_download(server, tmp_path / "templates.zip")
+
+    assert dest.read_bytes() == CONTENT
+
+
+def test_resume_partial_download(server, tmp_path):
+
+    dest = tmp_path / "templates.zip"
+    (tmp_path / "templates.zip.part").write_bytes(CONTENT[:1000])
+
+    stream_download(server, dest)
+
+    assert dest.read_bytes() == CONTENT
+
+
+def test_complete_partial_download_is_verified(server, tmp_path):
+
+    dest = tmp_path / "templates.zip"
+    part = tmp_path / "templates.zip.part"
+    part.write_bytes(CONTENT + b"garbage")
+
+    with pytest.raises(ValueError):
+        stream_download(server, dest)
+
+    assert not dest.exists()
+    assert not part.exists()
+
+
+def test_unverifiable_partial_download_is_downloaded_again(server, tmp_path):
+
+    RangeHandler.terse = True
+    dest = tmp_path / "templates.zip"
+    (tmp_path / "templates.zip.part").write_bytes(b"x" * len(CONTENT))
+
+    stream_download(server, dest)
+
+    assert dest.read_bytes() == CONTENT
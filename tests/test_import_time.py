@@ -0,0 +1,41 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+# Modules that must not be imported just to load the package or the CLI
+HEAVY_MODULES = ["cv2", "numpy", "skimage", "scipy", "pytesseract", "requests"]
+
+REPO_PATH = Path(__file__).parents[1]
+
+
+def imported_modules(args: list) -> set:
+    """
+    Run python with -X importtime and collect the modules it imports.
+    """
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime"] + args,
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=REPO_PATH,
+    )
+
+    modules = set()
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            modules.add(line.split("|")[-1].strip())
+    return modules
+
+
+@pytest.mark.parametrize(
+    "args", [["-c", "import homedumper"], ["-m", "homedumper", "--help"]]
+)
+def test_heavy_modules_are_imported_on_demand(args):
+
+    modules = imported_modules(args)
+
+    assert "homedumper" in modules
+    assert not [module for module in HEAVY_MODULES if module in modules]
@@ -0,0 +1,109 @@
+import csv
+import json
+import time
+
+import cv2
+import numpy as np
+import pytest
+from typer.testing import CliRunner
+
+import homedumper
+from homedumper.__main__ import app
+from homedumper._extract import frame_signature
+from homedumper._live import LiveSource
+from homedumper.const import LIVE_RESULTS
+
+
+def test_live_replay(synthetic, tmp_path):
+
+    received = []
+    start = time.perf_counter()
+    count = homedumper.live(
+        str(synthetic.video),
+        str(tmp_path),
+        callback=received.append,
+        fps=60,
+        scorer="ncc",
+    )
+    elapsed = time.perf_counter() - start
+
+    project_path = tmp_path / synthetic.video.stem
+    with open(project_path / LIVE_RESULTS, "r", encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    with open(project_path / "match.csv", "r", encoding="utf-8") as f:
+        table = list(csv.reader(f))[1:]
+
+    # Replayed at the frame rate, one line per box as it is matched
+    expected = [box["pokemon"] for box in synthetic.truth["boxes"]]
+    assert elapsed >= synthetic.truth["frames"] / 60
+    assert count == len(expected)
+    assert lines == received
+    assert [[slot["pokemon"] for slot in line["slots"]] for line in lines] == expected
+    assert [line["frame"] for line in lines] == sorted(line["frame"] for line in lines)
+
+    # The csv file holds the same rows
+    rows = [
+        [line["title"], slot["slot"], slot["pokemon"] or ""]
+        for line in lines
+        for slot in line["slots"]
+    ]
+    assert table == rows
+
+
+def test_live_raises_the_errors_of_the_capture(synthetic, tmp_path):
+
+    broken = tmp_path / "broken.mp4"
+    broken.write_text("not a video")
+
+    with pytest.raises(ValueError):
+        homedumper.live(str(broken), str(tmp_path / "out"), scorer="ncc")
+
+    result = CliRunner().invoke(
+        app, ["live", str(broken), "--output-path", str(tmp_path / "out")]
+    )
+    assert result.exit_code != 0
+
+
+class KeyframeCapture:
+    """
+    Capture seeking to the first frame whatever the frame asked, like the
+    videos that can only be seeked to their keyframes.
+    """
+
+    def __init__(self, capture):
+        self.capture = capture
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            value = 0
+        return self.capture.set(prop, value)
+
+    def __getattr__(self, name):
+        return getattr(self.capture, name)
+
+
+@pytest.mark.parametrize("accurate", [True, False])
+def test_follow_reopens_at_the_first_frame_not_read(synthetic, monkeypatch, accurate):
+
+    cap = cv2.VideoCapture(str(synthetic.video))
+    frames = []
+    ret, frame = cap.read()
+    while ret:
+        frames.append(frame)
+        ret, frame = cap.read()
+    cap.release()
+
+    source = LiveSource(str(synthetic.video), follow=True)
+    if not accurate:
+        capture = cv2.VideoCapture
+        monkeypatch.setattr(
+            cv2, "VideoCapture", lambda *args: KeyframeCapture(capture(*args))
+        )
+
+    position = len(frames) - 1
+    cap = source._reopen(position, frame_signature(frames[position - 1]))
+    ret, frame = cap.read()
+    cap.release()
+
+    assert np.array_equal(frame, frames[position])
+    assert source.seek == accurate
@@ -0,0 +1,65 @@
+import json
+
+import cv2
+
+import homedumper
+from homedumper._match import MANIFEST_FILE
+
+
+def test_rematch_reuses_the_manifest(project):
+
+    homedumper.match(str(project))
+    metrics = homedumper.Metrics()
+    homedumper.match(str(project), metrics=metrics)
+
+    assert metrics.counters["match.cache_hits"] == 3
+
+
+def test_rows_of_older_manifests_are_matched_again(synthetic, project, tmp_path):
+
+    homedumper.match(str(project))
+
+    # Rows written before the template and likelihood were stored
+    manifest_path = project / MANIFEST_FILE
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    for entry in manifest["boxes"].values():
+        entry["matches"] = [row[:3] for row in entry["matches"]]
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+    count = homedumper.match(str(project), sqlite=str(tmp_path / "dumps.db"))
+
+    assert count == 30 * len(synthetic.truth["boxes"])
+
+
+def test_cached_boxes_are_not_decoded(project, monkeypatch):
+
+    homedumper.match(str(project))
+
+    decoded = []
+    imdecode = cv2.imdecode
+
+    def counting_imdecode(*args):
+        decoded.append(1)
+        return imdecode(*args)
+
+    monkeypatch.setattr(cv2, "imdecode", counting_imdecode)
+    homedumper.match(str(project))
+
+    assert not decoded
+
+
+def test_other_priors_match_again(project, tmp_path):
+
+    homedumper.match(str(project))
+    priors = tmp_path / "previous.json"
+    (project / "match.json").replace(priors)
+
+    metrics = homedumper.Metrics()
+    homedumper.match(str(project), priors=[str(priors)], metrics=metrics)
+    assert metrics.counters["match.cache_hits"] == 0
+
+    metrics = homedumper.Metrics()
+    homedumper.match(str(project), priors=[str(priors)], metrics=metrics)
+    assert metrics.counters["match.cache_hits"] == 3
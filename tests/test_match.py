@@ -0,0 +1,91 @@
+import json
+
+import numpy as np
+import pytest
+from typer.testing import CliRunner
+
+import homedumper
+from homedumper.__main__ import app
+from homedumper._scorers import MaskedScorer
+
+
+def read_pokemon(project_path):
+    with open(project_path / "match.json", "r", encoding="utf-8") as f:
+        return [box["pokemon"] for box in json.load(f)["boxes"]]
+
+
+def test_match_finds_the_synthetic_boxes(synthetic, project):
+
+    count = homedumper.match(str(project))
+
+    expected = [box["pokemon"] for box in synthetic.truth["boxes"]]
+    assert count == 30 * len(expected)
+    assert read_pokemon(project) == expected
+
+
+def test_shortlist_matches_like_a_full_search(synthetic, project):
+
+    homedumper.match(str(project), shortlist=3)
+
+    expected = [box["pokemon"] for box in synthetic.truth["boxes"]]
+    assert read_pokemon(project) == expected
+
+
+def test_shortlist_rejects_threshold(project):
+
+    with pytest.raises(ValueError):
+        homedumper.match(str(project), shortlist=3, threshold=0.9)
+
+    result = CliRunner().invoke(
+        app, ["match", str(project), "--shortlist", "3", "--threshold", "0.9"]
+    )
+    assert result.exit_code == 2
+    assert "--shortlist" in result.output
+
+
+def test_match_reports_the_comparisons_per_slot(project):
+
+    metrics = homedumper.Metrics()
+    homedumper.match(str(project), metrics=metrics)
+
+    comparisons = metrics.average("match.comparisons_per_slot")
+    assert comparisons == (
+        metrics.counters["match.comparisons"] / metrics.counters["match.slots_matched"]
+    )
+    assert metrics.report()["match"]["averages"]["comparisons_per_slot"] > 0
+
+    result = CliRunner().invoke(app, ["match", str(project), "--force"])
+    assert result.exit_code == 0
+    assert "templates compared per slot" in result.output
+
+
+@pytest.mark.parametrize("scorer", ["ncc", "ncc-int8"])
+def test_matrix_scorers_agree_with_ssim(project, scorer):
+
+    homedumper.match(str(project), scorer="ssim")
+    expected = read_pokemon(project)
+
+    homedumper.match(str(project), scorer=scorer, force=True)
+
+    assert read_pokemon(project) == expected
+
+
+def test_masked_scorer_ignores_the_background():
+
+    rng = np.random.default_rng(0)
+    mask = np.zeros((16, 16), dtype=np.uint8)
+    mask[4:12, 4:12] = 255
+    templates = {}
+    for id in ("0001", "0002", "0003"):
+        templates[id] = np.full((16, 16, 3), 255, dtype=np.uint8)
+        templates[id][4:12, 4:12] = rng.integers(0, 256, (8, 8, 3), dtype=np.uint8)
+    scorer = MaskedScorer(templates, {id: mask for id in templates})
+
+    # The same pokemon over a noisy background, like a highlighted slot
+    thumbnail = rng.integers(0, 256, (16, 16, 3), dtype=np.uint8)
+    thumbnail[4:12, 4:12] = templates["0002"][4:12, 4:12]
+
+    scores = scorer.score([templates["0002"], thumbnail])
+
+    assert scorer.ids[int(np.argmax(scores[1]))] == "0002"
+    assert np.allclose(scores[0], scores[1])
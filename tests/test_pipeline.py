@@ -0,0 +1,141 @@
+import json
+
+import cv2
+import numpy as np
+import pytest
+import pytesseract
+from typer.testing import CliRunner
+
+import homedumper
+from homedumper.__main__ import app
+from homedumper._ring import FrameRing
+from homedumper.const import THREAD_VARIABLES
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_dump_finds_the_synthetic_boxes(synthetic, tmp_path, jobs):
+
+    summary = homedumper.dump(
+        str(synthetic.video), str(tmp_path), scorer="ncc", jobs=jobs
+    )
+
+    with open(tmp_path / synthetic.video.stem / "match.json", encoding="utf-8") as f:
+        boxes = json.load(f)["boxes"]
+    expected = [box["pokemon"] for box in synthetic.truth["boxes"]]
+    assert summary["boxes"] == len(expected)
+    assert [box["pokemon"] for box in boxes] == expected
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_dump_numbers_the_default_titles(synthetic, tmp_path, monkeypatch, jobs):
+
+    def missing(*args, **kwargs):
+        raise pytesseract.pytesseract.TesseractNotFoundError()
+
+    monkeypatch.setattr(pytesseract, "image_to_string", missing)
+
+    homedumper.dump(str(synthetic.video), str(tmp_path), scorer="ncc", jobs=jobs)
+
+    boxes_path = tmp_path / synthetic.video.stem / "boxes"
+    titles = sorted(p.read_text() for p in boxes_path.glob("*/title.txt"))
+    expected = [f"HOME {i:03}" for i in range(1, len(synthetic.truth["boxes"]) + 1)]
+    assert titles == expected
+
+
+def test_dump_profile(synthetic, tmp_path, monkeypatch):
+
+    # Restore the thread limits exported by --jobs
+    for name in THREAD_VARIABLES:
+        monkeypatch.delenv(name, raising=False)
+
+    result = CliRunner().invoke(
+        app,
+        ["dump", str(synthetic.video), "--output-path", str(tmp_path)]
+        + ["--profile", "--jobs", "2"],
+    )
+    assert result.exit_code == 0
+
+    report_path = tmp_path / synthetic.video.stem / "profile.json"
+    with open(report_path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+
+    # The video is decoded here, the boxes are boxified and matched by the
+    # workers and their metrics merged
+    boxes = len(synthetic.truth["boxes"])
+    assert report["extract"]["counters"]["frames_decoded"] == synthetic.truth["frames"]
+    assert report["extract"]["counters"]["frames_written"] == boxes
+    assert report["boxify"]["counters"]["thumbnails_written"] == 30 * boxes
+    assert report["match"]["counters"]["slots_matched"] == 30 * boxes
+    timers = [("extract", "decode"), ("boxify", "total"), ("match", "scoring")]
+    for stage, timer in timers:
+        assert report[stage]["seconds"][timer] > 0
+
+
+class RotatedCapture:
+    """
+    Capture reporting the size of the frames swapped, like some rotated
+    videos.
+    """
+
+    swapped = {
+        cv2.CAP_PROP_FRAME_WIDTH: cv2.CAP_PROP_FRAME_HEIGHT,
+        cv2.CAP_PROP_FRAME_HEIGHT: cv2.CAP_PROP_FRAME_WIDTH,
+    }
+
+    def __init__(self, capture):
+        self.capture = capture
+
+    def get(self, prop):
+        return self.capture.get(self.swapped.get(prop, prop))
+
+    def __getattr__(self, name):
+        return getattr(self.capture, name)
+
+
+def test_workers_size_the_ring_after_the_frames(synthetic, tmp_path, monkeypatch):
+
+    capture = cv2.VideoCapture
+    monkeypatch.setattr(
+        cv2, "VideoCapture", lambda *args: RotatedCapture(capture(*args))
+    )
+
+    summary = homedumper.dump(str(synthetic.video), str(tmp_path), scorer="ncc", jobs=2)
+
+    assert summary["boxes"] == len(synthetic.truth["boxes"])
+
+
+def test_ring_waits_for_a_free_slot():
+
+    ring = FrameRing((2, 2, 3), slots=2)
+    try:
+        frame = np.ones((2, 2, 3), dtype=np.uint8)
+        first = ring.write(frame)
+        ring.write(frame * 2)
+        with pytest.raises(TimeoutError):
+            ring.write(frame, timeout=0.01)
+
+        ring.release(first)
+        assert ring.write(frame * 3, timeout=0.01) == first
+        assert ring.view(first)[0, 0, 0] == 3
+    finally:
+        ring.close()
+
+
+def test_peak_rss_without_resource(monkeypatch):
+
+    import builtins
+
+    from homedumper._memory import peak_rss
+
+    assert peak_rss() > 0
+
+    # Platforms without the resource module, like Windows
+    real_import = builtins.__import__
+
+    def import_without(name, *args, **kwargs):
+        if name in ("resource", "psutil"):
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "__import__", import_without)
+    assert peak_rss() == 0
@@ -0,0 +1,45 @@
+import json
+
+import pytest
+from typer.testing import CliRunner
+
+import homedumper
+from homedumper._scope import read_scope
+from homedumper.__main__ import app
+
+
+def test_read_scope(tmp_path):
+
+    dex = tmp_path / "dex.txt"
+    dex.write_text("bulbasaur\n\nivysaur\n", encoding="utf-8")
+    dump = tmp_path / "match.json"
+    dump.write_text(
+        json.dumps({"boxes": [{"pokemon": ["venusaur", None, "bulbasaur"]}]}),
+        encoding="utf-8",
+    )
+
+    names = read_scope(["mr-mime", str(dex), str(dump)])
+
+    assert names == ["bulbasaur", "ivysaur", "mr-mime", "venusaur"]
+
+
+@pytest.mark.parametrize("entry", ["dex.txt", "data/dex", "old\\match.json"])
+def test_missing_scope_files_are_rejected(entry, project):
+
+    with pytest.raises(ValueError):
+        read_scope([entry])
+
+    result = CliRunner().invoke(app, ["match", str(project), "--scope", entry])
+    assert result.exit_code == 2
+    assert "--scope" in result.output
+
+
+def test_scope_keeps_the_matches_in_it(synthetic, project):
+
+    expected = [box["pokemon"] for box in synthetic.truth["boxes"]]
+    scope = sorted({name for box in expected for name in box if name})
+
+    homedumper.match(str(project), scope=scope)
+
+    with open(project / "match.json", "r", encoding="utf-8") as f:
+        assert [box["pokemon"] for box in json.load(f)["boxes"]] == expected
@@ -0,0 +1,72 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from homedumper._match import _create_matcher
+from homedumper._serve import JobManager, create_server
+
+
+@pytest.fixture
+def manager(synthetic, tmp_path):
+
+    matcher = _create_matcher({}, [], None, 0.0, None, "ncc")
+    manager = JobManager(matcher, {"scorer": "ncc"}, str(tmp_path), jobs=1)
+    yield manager
+    manager.shutdown()
+
+
+def get(url: str) -> tuple:
+    """
+    Send a GET request and return the status and the JSON body.
+    """
+
+    try:
+        with urllib.request.urlopen(url) as resp:
+            return resp.status, json.load(resp)
+    except urllib.error.HTTPError as err:
+        return err.code, json.load(err)
+
+
+def test_job_results(synthetic, manager):
+
+    server = create_server(manager, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/jobs"
+
+    id = manager.submit(str(synthetic.video))["id"]
+    manager.futures[id].result()
+    status, record = get(f"{url}/{id}")
+    _, results = get(f"{url}/{id}/result")
+    server.shutdown()
+    server.server_close()
+
+    assert status == 200 and record["status"] == "done"
+    assert len(results["boxes"]) == len(synthetic.truth["boxes"])
+
+
+def test_finished_jobs_are_forgotten(synthetic, manager):
+
+    server = create_server(manager, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/jobs"
+
+    manager.max_finished = 1
+    first = manager.submit(str(synthetic.video))["id"]
+    manager.futures[first].result()
+    second = manager.submit(str(synthetic.video))["id"]
+    manager.futures[second].result()
+    first_status, _ = get(f"{url}/{first}")
+    second_status, _ = get(f"{url}/{second}")
+    _, listing = get(url)
+
+    manager.job_ttl = -1
+    expired_status, _ = get(f"{url}/{second}/result")
+    server.shutdown()
+    server.server_close()
+
+    assert (first_status, second_status, expired_status) == (404, 200, 404)
+    assert [record["id"] for record in listing["jobs"]] == [second]
+    assert not manager.records and not manager.futures